@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     'shift',
     'salary',
     'poster_api',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -225,12 +226,17 @@ else:
 
 
 if 'test' in sys.argv:
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'test_db.sqlite3',
+    # Set TEST_DATABASE_URL to a local Postgres to run the query-plan regression tests.
+    TEST_DATABASE_URL = config('TEST_DATABASE_URL', default='')
+    if TEST_DATABASE_URL:
+        DATABASES = {'default': dj_database_url.parse(TEST_DATABASE_URL)}
+    else:
+        DATABASES = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            }
         }
-    }
     
     class DisableMigrations:
         def __contains__(self, item):
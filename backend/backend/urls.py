@@ -29,4 +29,5 @@ urlpatterns = [
     path('api/', include('shift.urls')),
     path('api/', include('poster_api.urls')),
     path('api/', include('salary.urls')),
+    path('api/', include('jobs.urls')),
 ]
@@ -0,0 +1,76 @@
+import logging
+from calendar import monthrange
+from datetime import date as date_cls
+
+from poster_api.client import PosterAPIClient
+from poster_api.services.sync import sync_day, sync_static_data
+from salary.dirty import dirty_shift_count, recalculate_dirty_shifts
+from salary.services import calculate_and_save_shift_salaries, recalculate_shifts_parallel
+from shift.models import Shift
+
+from .services import JobProgress, job_handler
+
+logger = logging.getLogger(__name__)
+
+
+@job_handler("salary.recalculate_month")
+def recalculate_month(progress: JobProgress, year: int, month: int, trace: bool = False) -> dict:
+    """Recalculates the salaries of every shift in a month on a worker pool and saves them together."""
+    shifts = list(Shift.objects.filter(date__year=year, date__month=month).order_by('date', 'id'))
+    progress.set_total(len(shifts))
+
+    processed, failed = recalculate_shifts_parallel(
+        shifts,
+        on_chunk=lambda chunk: progress.advance(len(chunk), message=f"Calculated {chunk[0].date} to {chunk[-1].date}"),
+        trace=trace,
+    )
+
+    logger.info(f"--- Recalculation of {month}/{year} finished. Processed shifts: {processed} ---")
+    return {
+        "message": f"Recalculation finished. Processed shifts: {processed}",
+        "processed": processed,
+        "failed": failed,
+    }
+
+
+@job_handler("salary.recalculate_dirty")
+def recalculate_dirty(progress: JobProgress, year: int = None, month: int = None) -> dict:
+    """Recalculates the dirty shifts, of one month or of all time."""
+    date_from = date_to = None
+    if year and month:
+        date_from = date_cls(year, month, 1)
+        date_to = date_cls(year, month, monthrange(year, month)[1])
+    progress.set_total(dirty_shift_count(date_from, date_to))
+
+    processed, failed = recalculate_dirty_shifts(
+        date_from, date_to, on_shift=lambda shift, error: progress.advance(message=f"Shift {shift.id} ({shift.date})")
+    )
+    return {
+        "message": f"Recalculation finished. Processed shifts: {processed}",
+        "processed": processed,
+        "failed": failed,
+    }
+
+
+@job_handler("salary.recalculate_shift")
+def recalculate_shift(progress: JobProgress, shift_id: int, trace: bool = False) -> dict:
+    """Recalculates and saves the salaries of one shift."""
+    shift = Shift.objects.get(pk=shift_id)
+    progress.set_total(1)
+    calculate_and_save_shift_salaries(shift, trace=trace)
+    progress.advance()
+    return {"message": f"Salary for shift {shift.id} recalculated."}
+
+
+@job_handler("poster_api.sync_day")
+def resync_day(progress: JobProgress, date: str, spot_id: int = 1, skip_static: bool = False) -> dict:
+    """Re-syncs one day of one spot from the Poster API."""
+    date_cls.fromisoformat(date)
+    api_client = PosterAPIClient()
+    progress.set_total(1 if skip_static else 2)
+    if not skip_static:
+        sync_static_data(api_client)
+        progress.advance(message="Static data synced.")
+    transactions = sync_day(api_client, date, spot_id)
+    progress.advance(message=f"{date} synced for spot {spot_id}.")
+    return {"message": f"Synced {transactions} transactions for {date}, spot {spot_id}.", "transactions": transactions}
@@ -0,0 +1,57 @@
+import logging
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from jobs.services import claim_next, requeue_stale, run_job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Background worker for queued jobs.
+    1. Requeues jobs left running by dead workers
+    2. Claims the oldest pending job and runs it
+    3. Sleeps when the queue is empty
+    Any number of workers can run side by side; each job is claimed once.
+    """
+    help = "Runs queued background jobs (salary recalculations, manual resyncs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--max-jobs', type=int, help='Exit after running this many jobs.')
+
+    def handle(self, *args, **options):
+        if options['poll_interval'] <= 0:
+            raise CommandError("--poll-interval must be positive.")
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(self.style.SUCCESS(f"=== Worker {worker} started ==="))
+
+        ran = 0
+        try:
+            while options['max_jobs'] is None or ran < options['max_jobs']:
+                close_old_connections()
+                requeue_stale()
+                job = claim_next(worker)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f"Running {job}...")
+                job = run_job(job)
+                ran += 1
+                if job.status == job.STATUS_DONE:
+                    self.stdout.write(self.style.SUCCESS(f"{job} finished."))
+                else:
+                    self.stderr.write(self.style.ERROR(f"{job} failed: {job.error}"))
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted.")
+
+        self.stdout.write(self.style.SUCCESS(f"=== Worker {worker} stopped after {ran} jobs ==="))
@@ -0,0 +1,26 @@
+from rest_framework import serializers
+
+from .models import Job
+
+
+class JobProgressSerializer(serializers.ModelSerializer):
+    percent = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'progress', 'total', 'percent', 'message']
+
+    def get_percent(self, job):
+        if job.status == Job.STATUS_DONE:
+            return 100.0
+        if not job.total:
+            return None
+        return round(100.0 * min(job.progress, job.total) / job.total, 1)
+
+
+class JobSerializer(JobProgressSerializer):
+    class Meta:
+        model = Job
+        fields = JobProgressSerializer.Meta.fields + [
+            'params', 'result', 'error', 'attempts', 'created_at', 'started_at', 'finished_at',
+        ]
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# A running job whose heartbeat is older than this belongs to a dead worker.
+STALE_AFTER = timedelta(minutes=10)
+
+# How often a running job's heartbeat is refreshed, whether or not its handler reports progress.
+HEARTBEAT_INTERVAL = STALE_AFTER / 5
+
+# A job is failed instead of requeued once it has been started this often.
+MAX_ATTEMPTS = 3
+
+# Seconds between progress writes; `set_total` and the final save always write.
+PROGRESS_INTERVAL = 1.0
+
+HANDLERS: Dict[str, Callable[..., Any]] = {}
+
+
+class UnknownJobKind(ValueError):
+    """No handler is registered for the job kind."""
+
+
+def job_handler(kind: str):
+    """
+    Registers a function as the handler of `kind` jobs.
+
+    The handler is called with a `JobProgress` as `progress` and the job's
+    params as keyword arguments; its return value is stored as the result.
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def dedupe_key(kind: str, params: Dict[str, Any]) -> str:
+    """The key shared by all jobs of the same kind with the same params."""
+    payload = json.dumps([kind, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue(kind: str, params: Optional[Dict[str, Any]] = None, user=None) -> Tuple[Job, bool]:
+    """
+    Queues a job, unless an identical one is already pending.
+
+    Args:
+        kind: The registered job kind.
+        params: Keyword arguments for the handler; must be JSON serializable.
+        user: The user who requested the job.
+
+    Returns:
+        tuple: (the job, whether it was created); an identical pending job
+        is returned instead of creating a new one.
+
+    Raises:
+        UnknownJobKind: If no handler is registered for `kind`.
+    """
+    if kind not in HANDLERS:
+        raise UnknownJobKind(f"Unknown job kind '{kind}'.")
+    params = params or {}
+    key = dedupe_key(kind, params)
+
+    for _ in range(2):
+        existing = Job.objects.filter(dedupe_key=key, status=Job.STATUS_PENDING).first()
+        if existing:
+            return existing, False
+        try:
+            with transaction.atomic():
+                job = Job.objects.create(kind=kind, params=params, dedupe_key=key, created_by=user)
+            logger.info(f"[enqueue] Queued {job}.")
+            return job, True
+        except IntegrityError:
+            # Another request queued the same job concurrently.
+            continue
+    return Job.objects.get(dedupe_key=key, status=Job.STATUS_PENDING), False
+
+
+class JobProgress:
+    """
+    Lets a handler report progress; every write also refreshes the job's heartbeat.
+
+    Writes are throttled to one per `PROGRESS_INTERVAL` seconds, so handlers
+    can call `advance()` for every item they process.
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+        self._written_at = 0.0
+
+    def set_total(self, total: int):
+        self.job.total = total
+        self._write(force=True)
+
+    def advance(self, step: int = 1, message: Optional[str] = None):
+        self.job.progress += step
+        if message is not None:
+            self.job.message = message[:255]
+        self._write()
+
+    def _write(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._written_at < PROGRESS_INTERVAL:
+            return
+        self._written_at = now
+        self.job.heartbeat_at = timezone.now()
+        Job.objects.filter(pk=self.job.pk).update(
+            progress=self.job.progress, total=self.job.total,
+            message=self.job.message, heartbeat_at=self.job.heartbeat_at,
+        )
+
+
+def claim_next(worker: str) -> Optional[Job]:
+    """
+    Takes the oldest pending job and marks it running for `worker`.
+
+    The claim is a conditional update, so two workers never run the same job.
+    """
+    candidates = Job.objects.filter(status=Job.STATUS_PENDING).order_by("created_at").values_list("pk", flat=True)
+    for job_id in candidates[:10]:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+            attempts=F("attempts") + 1, error="",
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def _keep_alive(job_id: int, stop: threading.Event):
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+            Job.objects.filter(pk=job_id, status=Job.STATUS_RUNNING).update(heartbeat_at=timezone.now())
+    except Exception as e:
+        logger.error(f"[run_job] Refreshing the heartbeat of job #{job_id} failed: {e}", exc_info=True)
+    finally:
+        connections.close_all()
+
+
+def run_job(job: Job) -> Job:
+    """
+    Runs a claimed job and stores its result or error.
+
+    A background thread refreshes the job's heartbeat while the handler
+    runs, so a long step that reports no progress (e.g. one large Poster
+    fetch) isn't mistaken for a dead worker by `requeue_stale`.
+    """
+    progress = JobProgress(job)
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_keep_alive, args=(job.pk, stop), name="job-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise UnknownJobKind(f"Unknown job kind '{job.kind}'.")
+        job.result = handler(progress=progress, **job.params)
+        job.status = Job.STATUS_DONE
+    except Exception as e:
+        logger.error(f"[run_job] {job} failed: {e}", exc_info=True)
+        job.status = Job.STATUS_FAILED
+        job.error = str(e)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    job.finished_at = job.heartbeat_at = timezone.now()
+    job.save(update_fields=[
+        "status", "result", "error", "progress", "total", "message", "finished_at", "heartbeat_at",
+    ])
+    return job
+
+
+def requeue_stale(now=None) -> int:
+    """
+    Puts running jobs of dead workers back in the queue.
+
+    Jobs that already used up `MAX_ATTEMPTS`, or that an identical pending
+    job has superseded, are failed instead.
+
+    Returns:
+        int: The number of jobs requeued.
+    """
+    now = now or timezone.now()
+    requeued = 0
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=now - STALE_AFTER)
+    for job in stale:
+        if job.attempts >= MAX_ATTEMPTS:
+            error = f"Worker {job.worker} stopped responding; giving up after {job.attempts} attempts."
+        else:
+            try:
+                with transaction.atomic():
+                    Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING).update(
+                        status=Job.STATUS_PENDING, worker="",
+                    )
+                logger.warning(f"[requeue_stale] Requeued {job} from worker {job.worker}.")
+                requeued += 1
+                continue
+            except IntegrityError:
+                error = "Superseded by an identical pending job."
+        Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING).update(
+            status=Job.STATUS_FAILED, error=error, finished_at=now,
+        )
+    return requeued
@@ -0,0 +1,192 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from users.models import User
+from jobs.models import Job
+from jobs.services import (
+    HANDLERS,
+    MAX_ATTEMPTS,
+    STALE_AFTER,
+    UnknownJobKind,
+    claim_next,
+    enqueue,
+    job_handler,
+    requeue_stale,
+    run_job,
+)
+
+
+@job_handler("test.count")
+def count_job(progress, items, fail=False):
+    progress.set_total(items)
+    for i in range(items):
+        progress.advance(message=f"item {i}")
+    if fail:
+        raise RuntimeError("boom")
+    return {"counted": items}
+
+
+@job_handler("test.silent")
+def silent_job(progress, seconds):
+    # A long step that reports no progress; meanwhile another worker looks for stale jobs.
+    time.sleep(seconds)
+    return {"requeued": requeue_stale()}
+
+
+class JobQueueTest(TestCase):
+    """Tests for queueing, claiming and running jobs."""
+
+    def test_enqueue_dedupes_pending_jobs(self):
+        job, created = enqueue("test.count", {"items": 2})
+        same, created_again = enqueue("test.count", {"items": 2})
+        other, _ = enqueue("test.count", {"items": 3})
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(same.pk, job.pk)
+        self.assertNotEqual(other.pk, job.pk)
+        with self.assertRaises(UnknownJobKind):
+            enqueue("test.unknown")
+
+        # Once running, an identical request queues a fresh job.
+        self.assertEqual(claim_next("w1").pk, job.pk)
+        rerun, created = enqueue("test.count", {"items": 2})
+        self.assertTrue(created)
+        self.assertNotEqual(rerun.pk, job.pk)
+
+    def test_run_job_records_progress_and_result(self):
+        job, _ = enqueue("test.count", {"items": 3})
+        failing, _ = enqueue("test.count", {"items": 1, "fail": True})
+
+        job = run_job(claim_next("w1"))
+        failing = run_job(claim_next("w1"))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total, job.result), (Job.STATUS_DONE, 3, 3, {"counted": 3}))
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual((failing.status, failing.error), (Job.STATUS_FAILED, "boom"))
+        self.assertIsNone(claim_next("w1"))
+
+    def test_requeue_stale_jobs_of_dead_workers(self):
+        job, _ = enqueue("test.count", {"items": 1})
+        claim_next("dead-worker")
+        given_up, _ = enqueue("test.count", {"items": 2})
+        claim_next("dead-worker")
+        Job.objects.filter(pk=given_up.pk).update(attempts=MAX_ATTEMPTS)
+
+        self.assertEqual(requeue_stale(), 0)
+        self.assertEqual(requeue_stale(timezone.now() + STALE_AFTER + timedelta(seconds=1)), 1)
+
+        job.refresh_from_db()
+        given_up.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.STATUS_PENDING, ""))
+        self.assertEqual(given_up.status, Job.STATUS_FAILED)
+
+    def test_run_worker_drains_queue(self):
+        enqueue("test.count", {"items": 1})
+        enqueue("test.count", {"items": 2})
+
+        # The worker recycles connections between jobs; keep the test transaction's.
+        with patch("jobs.management.commands.run_worker.close_old_connections"):
+            call_command("run_worker", "--once", stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(Job.objects.filter(status=Job.STATUS_DONE).count(), 2)
+        self.assertIn("salary.recalculate_month", HANDLERS)
+
+
+class JobHeartbeatTest(TransactionTestCase):
+    """Tests that a running job keeps its heartbeat; the heartbeat thread needs committed rows."""
+
+    def test_silent_long_job_is_not_requeued(self):
+        job, _ = enqueue("test.silent", {"seconds": 1})
+
+        with patch("jobs.services.STALE_AFTER", timedelta(milliseconds=400)), \
+                patch("jobs.services.HEARTBEAT_INTERVAL", timedelta(milliseconds=50)):
+            job = run_job(claim_next("w1"))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.STATUS_DONE, {"requeued": 0}))
+        self.assertEqual(job.attempts, 1)
+
+
+class JobApiTest(TestCase):
+    """Tests for the job endpoints."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', password='password', role='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @patch("jobs.views.MANUAL_JOB_KINDS", {"test.count", "test.unknown"})
+    def test_create_status_and_progress(self):
+        url = reverse('jobs-list')
+
+        response = self.client.post(url, {"kind": "test.count", "params": {"items": 4}}, format='json')
+        duplicate = self.client.post(url, {"kind": "test.count", "params": {"items": 4}}, format='json')
+        invalid = self.client.post(url, {"kind": "test.unknown"}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(response.data['deduplicated'])
+        self.assertTrue(duplicate.data['deduplicated'])
+        self.assertEqual(duplicate.data['job_id'], response.data['job_id'])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        job = Job.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.created_by, self.user)
+        run_job(claim_next("w1"))
+
+        progress = self.client.get(reverse('jobs-progress', args=[job.pk]))
+        self.assertEqual(progress.status_code, status.HTTP_200_OK)
+        self.assertEqual((progress.data['status'], progress.data['percent']), (Job.STATUS_DONE, 100.0))
+        detail = self.client.get(reverse('jobs-detail', args=[job.pk]))
+        self.assertEqual(detail.data['result'], {"counted": 4})
+
+    def test_create_is_limited_to_owners_and_manual_kinds(self):
+        url = reverse('jobs-list')
+        month = {"kind": "salary.recalculate_month", "params": {"year": 2025, "month": 10}}
+
+        self.assertEqual(self.client.post(url, month, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=User.objects.create_user(username='cook', password='password', role='cook'))
+        resync = {"kind": "poster_api.sync_day", "params": {"date": "2025-10-01"}}
+        self.assertEqual(self.client.post(url, resync, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertFalse(Job.objects.exists())
+
+    def test_non_owners_only_read_their_own_jobs(self):
+        owners_job, _ = enqueue("test.count", {"items": 1}, user=self.user)
+        cook = User.objects.create_user(username='cook', password='password', role='cook')
+        cooks_job, _ = enqueue("test.count", {"items": 2}, user=cook)
+
+        self.assertEqual({job['id'] for job in self.client.get(reverse('jobs-list')).data},
+                         {owners_job.id, cooks_job.id})
+        self.client.force_authenticate(user=cook)
+        self.assertEqual([job['id'] for job in self.client.get(reverse('jobs-list')).data], [cooks_job.id])
+        self.assertEqual(self.client.get(reverse('jobs-detail', args=[owners_job.pk])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('jobs-progress', args=[owners_job.pk])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    @patch("jobs.handlers.sync_day", return_value=7)
+    @patch("jobs.handlers.sync_static_data")
+    def test_manual_resync_runs_as_job(self, mock_static, mock_sync_day):
+        response = self.client.post(
+            reverse('jobs-list'),
+            {"kind": "poster_api.sync_day", "params": {"date": "2025-10-01", "spot_id": 2}},
+            format='json',
+        )
+
+        job = run_job(claim_next("w1"))
+
+        self.assertEqual(job.pk, response.data['job_id'])
+        self.assertEqual((job.status, job.result['transactions']), (Job.STATUS_DONE, 7))
+        mock_static.assert_called_once()
+        self.assertEqual(mock_sync_day.call_args.args[1:], ("2025-10-01", 2))
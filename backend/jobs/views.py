@@ -0,0 +1,74 @@
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from users.permissions import IsOwnerOrAdmin
+from .models import Job
+from .serializers import JobProgressSerializer, JobSerializer
+from .services import UnknownJobKind, enqueue
+
+
+# Job kinds that may be queued through POST /api/jobs/. Salary recalculations
+# are queued by their own endpoints, which validate their params.
+MANUAL_JOB_KINDS = {"poster_api.sync_day"}
+
+
+def accepted_response(job: Job, created: bool) -> Response:
+    """The 202 response of an endpoint that queued `job`; `deduplicated` means an identical job was already pending."""
+    return Response(
+        {"job_id": job.id, **JobSerializer(job).data, "deduplicated": not created},
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs: list, status and progress.
+
+    The owner sees every job, other users only the jobs they queued. POST
+    queues a job of one of the `MANUAL_JOB_KINDS`, e.g. a manual resync;
+    only the owner may do this:
+    {"kind": "poster_api.sync_day", "params": {"date": "2025-10-01", "spot_id": 1}}
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not IsOwnerOrAdmin().has_permission(self.request, self):
+            queryset = queryset.filter(created_by=self.request.user)
+        job_status = self.request.query_params.get('status')
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+        return queryset
+
+    def get_permissions(self):
+        if self.action == 'create':
+            return [IsAuthenticated(), IsOwnerOrAdmin()]
+        return super().get_permissions()
+
+    def create(self, request):
+        kind = request.data.get('kind')
+        params = request.data.get('params') or {}
+        if not kind or not isinstance(params, dict):
+            return Response(
+                {"error": "'kind' is required and 'params' must be an object."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if kind not in MANUAL_JOB_KINDS:
+            return Response(
+                {"error": f"Jobs of kind '{kind}' can't be queued here."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            job, created = enqueue(kind, params, user=request.user)
+        except UnknownJobKind as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return accepted_response(job, created)
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """A compact status for polling."""
+        return Response(JobProgressSerializer(self.get_object()).data)
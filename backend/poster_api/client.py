@@ -2,10 +2,13 @@ import asyncio
 from collections import defaultdict
 from datetime import datetime, timedelta
 import json
-from typing import Optional, List
+from typing import Callable, Optional, List
 import requests
 from decouple import config
 import logging
+import queue
+import threading
+from dataclasses import dataclass
 from .decorators import timing_decorator
 
 logger = logging.getLogger(__name__)
@@ -16,6 +19,13 @@ if not logger.hasHandlers():
     logger.addHandler(handler)
     
     
+# Concurrent requests and results waiting for the consumer in `iter_histories`.
+HISTORY_FETCH_WORKERS = 5
+HISTORY_BUFFER_SIZE = 100
+
+# Transactions whose raw histories `HistoryFetchContext.stream` hands over together.
+HISTORY_BATCH_SIZE = 200
+
 REGULAR_PAYMENT_IDS = {0, 1, 2, 3, 4, 5}
 SERVICE_MAP = {
     7: "Uber Eats", 
@@ -29,13 +39,160 @@ SERVICE_MAP = {
 
 
 
+def parse_close_action(tx_id, actions: list) -> tuple[Optional[int], float]:
+    """
+    Extracts the payment method and tips from the 'close' action of a transaction history.
+
+    Args:
+        tx_id: The transaction the history belongs to (for logging).
+        actions (list): The raw `dash.getTransactionHistory` actions.
+
+    Returns:
+        tuple[int | None, float]: The payment_method_id (None if not found)
+        and the tip sum (0.0 if none).
+    """
+    payment_method_id = None
+    tip_sum = 0.0
+
+    for action in actions:
+        if action.get("type_history") == "close" and action.get("value_text"):
+            try:
+                value_text = json.loads(action["value_text"])
+                payment_method_id = value_text.get("payment_method_id")
+                if payment_method_id is not None:
+                    payment_method_id = int(payment_method_id)
+
+                ts = value_text.get("tip_sum")
+                if ts is None:
+                    ts = value_text.get("tip")
+                if ts is not None:
+                    try:
+                        tip_sum += float(ts)
+                    except Exception:
+                        logger.debug(f"Can't parse tip_sum '{ts}' for tx {tx_id}")
+
+            except Exception as e:
+                logger.warning(f"Failed to parse value_text for {tx_id}: {e}")
+
+    return payment_method_id, tip_sum
+
+
+@dataclass
+class HistoryEntry:
+    """What one fetched transaction history says about the payment: its close action's method and tips."""
+    payment_method_id: Optional[int]
+    tip_sum: float
+
+
+def _int_ids(transaction_ids) -> list[int]:
+    ids = {}
+    for tx_id in transaction_ids:
+        try:
+            ids[int(tx_id)] = None
+        except (TypeError, ValueError):
+            continue
+    return list(ids)
+
+
+class HistoryFetchFailed(Exception):
+    """Some transaction histories couldn't be fetched; their IDs are in `transaction_ids`."""
+
+    def __init__(self, transaction_ids):
+        self.transaction_ids = sorted(transaction_ids)
+        super().__init__(f"Failed to fetch the history of {len(self.transaction_ids)} transactions: "
+                         f"{self.transaction_ids[:10]}")
+
+
+class HistoryFetchContext:
+    """
+    Transaction histories shared by every consumer of one sync run.
+
+    Histories are streamed through `iter_histories` and fetched at most
+    once per run, so saving the history and building the shift sales
+    report don't request the same transactions twice. Only the payment
+    method and tips of each history are kept; the raw actions are handed
+    to the caller of `stream` in batches and then dropped. A history that
+    couldn't be fetched isn't kept, so it is requested again the next time,
+    and its ID stays in `failed` until it is.
+
+    Args:
+        api_client: The client used for the missing histories.
+    """
+
+    def __init__(self, api_client: 'PosterAPIClient'):
+        self.api_client = api_client
+        self.requested = 0
+        self._entries: dict[int, HistoryEntry] = {}
+        self.failed: set[int] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stream(self, transaction_ids, on_batch: Optional[Callable[[dict], None]] = None,
+               batch_size: int = HISTORY_BATCH_SIZE, workers: int = HISTORY_FETCH_WORKERS,
+               buffer_size: int = HISTORY_BUFFER_SIZE) -> int:
+        """
+        Fetches the histories of `transaction_ids` not seen yet in this run.
+
+        The raw actions are handed to `on_batch` as {transaction ID: actions}
+        every `batch_size` transactions, e.g. to save them, so memory stays
+        bounded by the fetch buffer and one batch however many transactions
+        there are. Histories fetched earlier in the run are skipped.
+
+        Args:
+            transaction_ids: The transactions whose history to fetch.
+            on_batch: Called with each batch of raw histories.
+            batch_size: Transactions per batch.
+            workers: Concurrent history requests.
+            buffer_size: Fetched histories that may wait for the consumer.
+
+        Returns:
+            int: The number of histories fetched; failed ones are added to `failed`.
+        """
+        with self._lock:
+            missing = [tx_id for tx_id in _int_ids(transaction_ids) if tx_id not in self._entries]
+        fetched, batch = 0, {}
+        for tx_id, actions, payment_method_id, *rest in self.api_client.iter_histories(missing, workers, buffer_size):
+            with self._lock:
+                self.requested += 1
+                if actions is None:
+                    self.failed.add(int(tx_id))
+                    continue
+                self._entries[int(tx_id)] = HistoryEntry(payment_method_id, float(rest[0] if rest else 0.0))
+                self.failed.discard(int(tx_id))
+            fetched += 1
+            if on_batch is not None:
+                batch[int(tx_id)] = actions
+                if len(batch) >= batch_size:
+                    on_batch(batch)
+                    batch = {}
+        if batch:
+            on_batch(batch)
+        return fetched
+
+    def failed_among(self, transaction_ids) -> set[int]:
+        """The IDs of `transaction_ids` whose history couldn't be fetched."""
+        with self._lock:
+            return self.failed.intersection(_int_ids(transaction_ids))
+
+    def get_many(self, transaction_ids) -> dict[int, HistoryEntry]:
+        """Returns the histories of `transaction_ids`, fetching the ones not seen yet in this run."""
+        ids = _int_ids(transaction_ids)
+        self.stream(ids)
+        with self._lock:
+            return {tx_id: self._entries[tx_id] for tx_id in ids if tx_id in self._entries}
+
+
 class PosterAPIClient:
     api_url = config("POSTER_API_URL")
     api_token = config("POSTER_API_TOKEN")
 
-    def __init__(self, api_token: str = None, api_url: str = None):
+    def __init__(self, api_token: str = None, api_url: str = None, session: requests.Session = None):
         self.api_token = api_token or self.api_token
         self.api_url = api_url or self.api_url
+        # Optional shared connection pool (e.g. for parallel backfills); plain `requests` otherwise.
+        self.session = session
 
     def _format_date(self, date_str: str) -> str:
         """This helper method is designed to be robust against common "dirty"
@@ -67,10 +224,11 @@ class PosterAPIClient:
             params = params or {}
             params["token"] = self.api_token
 
+            http = self.session or requests
             if method.upper() == "GET":
-                response = requests.get(url, params=params)
+                response = http.get(url, params=params)
             elif method.upper() == "POST":
-                response = requests.post(url, params=params)
+                response = http.post(url, params=params)
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
 
@@ -146,6 +304,18 @@ class PosterAPIClient:
         return normalized
 
 
+    def _sales_report(self, endpoint: str, params: dict) -> list:
+        """
+        Rows of a daily sales report.
+
+        Raises instead of returning no rows when the request failed, since the
+        savers treat an empty report as a day without sales and clear it.
+        """
+        data = self.make_request("GET", endpoint, params=params)
+        if "error" in data:
+            raise Exception(f"{endpoint} failed: {data['error']}")
+        return data.get("response", [])
+
     # --- Products Sales ---
     def get_products_sales(self, date_from: str = None, date_to: str = None, spot_id: int = None) -> List[dict]:
         params = {
@@ -160,7 +330,7 @@ class PosterAPIClient:
         if spot_id:
             params["spot_id"] = spot_id
 
-        data = self.make_request("GET", "dash.getProductsSales", params=params).get("response", [])
+        data = self._sales_report("dash.getProductsSales", params)
         normalized = []
 
         for item in data:
@@ -207,7 +377,7 @@ class PosterAPIClient:
         if spot_id:
             params["spot_id"] = spot_id
 
-        data = self.make_request("GET", "dash.getCategoriesSales", params=params).get("response", [])
+        data = self._sales_report("dash.getCategoriesSales", params)
         normalized = []
 
         for item in data:
@@ -299,9 +469,9 @@ class PosterAPIClient:
             sem (asyncio.Semaphore): A semaphore to control concurrency of network requests.
 
         Returns:
-            tuple[str, list, int | None, float]: A tuple containing:
+            tuple[str, list | None, int | None, float]: A tuple containing:
                 - The original transaction ID (tx_id).
-                - The list of history actions (or an empty list on failure).
+                - The list of history actions, or None if the request failed.
                 - The parsed payment_method_id (int) or None if not found/failed.
                 - The parsed tip_sum (float), defaulting to 0.0.
         """
@@ -312,58 +482,83 @@ class PosterAPIClient:
                         "GET", "dash.getTransactionHistory", params={"transaction_id": tx_id}
                     )
                 )
+                if "error" in history:
+                    raise Exception(history["error"])
                 actions = history.get("response", [])
-
-                payment_method_id = None
-                tip_sum = 0.0 
-                
-                for action in actions:
-                    if action.get("type_history") == "close" and action.get("value_text"):
-                        try:
-                            value_text = json.loads(action["value_text"])
-                            payment_method_id = value_text.get("payment_method_id")
-                            if payment_method_id is not None:
-                                payment_method_id = int(payment_method_id)
-                                
-                            ts = value_text.get("tip_sum")
-                            if ts is None:
-                                ts = value_text.get("tip")
-                            if ts is not None:
-                                try:
-                                    tip_sum += float(ts)
-                                except Exception:
-                                    logger.debug(f"Can't parse tip_sum '{ts}' for tx {tx_id}")    
-                            
-                            
-                        except Exception as e:
-                            logger.warning(f"Failed to parse value_text for {tx_id}: {e}")
-
+                payment_method_id, tip_sum = parse_close_action(tx_id, actions)
                 return tx_id, actions, payment_method_id, tip_sum
 
             except Exception as e:
                 logger.warning(f"Failed to fetch history for {tx_id}: {e}")
-                return tx_id, [], None
+                return tx_id, None, None, 0.0
 
-    # ------------------ Fetch all histories ------------------
-    async def fetch_all_histories(self, transaction_ids: list[str]):
-        """This method manage the fetching of all transaction histories
-        in parallel. It initializes an asyncio.Semaphore with a fixed limit (5)
-        to manage the load on the external API and then uses asyncio.gather
-        to execute all fetch operations.
+    # ------------------ Stream histories ------------------
+    def iter_histories(self, transaction_ids, workers: int = HISTORY_FETCH_WORKERS,
+                       buffer_size: int = HISTORY_BUFFER_SIZE):
+        """Yields transaction histories as they arrive, holding only a bounded
+        number of them in memory.
+
+        A fixed number of `workers` coroutines take IDs one at a time and fetch
+        the histories on a background event loop. Results are handed over
+        through a queue of `buffer_size`. When the consumer falls behind (e.g.
+        the database is slower than the API), the queue fills up and the
+        workers wait instead of piling up results. Closing the generator early
+        stops the workers after their current request.
 
         Args:
-            transaction_ids (list[str]): A list of transaction IDs to fetch.
+            transaction_ids (Iterable): The IDs to fetch; consumed lazily.
+            workers (int): Concurrent history requests.
+            buffer_size (int): Fetched histories that may wait for the consumer.
 
-        Returns:
-            list[tuple]: A list where each element is the tuple result from fetch_history_limited().
+        Yields:
+            tuple: The result of fetch_history_limited() for each transaction,
+            in completion order.
         """
-        sem = asyncio.Semaphore(5)
-        tasks = [self.fetch_history_limited(tx_id, sem) for tx_id in transaction_ids]
-        return await asyncio.gather(*tasks)
+        results = queue.Queue(maxsize=buffer_size)
+        stop = threading.Event()
+        done = object()
+        errors = []
+        pending = iter(transaction_ids)
+
+        async def worker(sem):
+            # All workers run on one event loop, so sharing the iterator is safe.
+            for tx_id in pending:
+                if stop.is_set():
+                    return
+                result = await self.fetch_history_limited(tx_id, sem)
+                await asyncio.to_thread(results.put, result)
+
+        async def produce():
+            sem = asyncio.Semaphore(workers)
+            await asyncio.gather(*(worker(sem) for _ in range(workers)))
+
+        def run():
+            try:
+                asyncio.run(produce())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results.put(done)
+
+        producer = threading.Thread(target=run, name="history-producer", daemon=True)
+        producer.start()
+        item = None
+        try:
+            while (item := results.get()) is not done:
+                yield item
+        finally:
+            stop.set()
+            # Unblock workers waiting on a full queue so the producer can finish.
+            while item is not done:
+                item = results.get()
+            producer.join()
+        if errors:
+            raise errors[0]
 
     # ------------------ Shift Sales ------------------
     @timing_decorator
-    def get_sales_by_shift_with_delivery(self, date: str, spot_id: int = 1) -> dict:
+    def get_sales_by_shift_with_delivery(self, date: str, spot_id: int = 1,
+                                         histories: Optional[HistoryFetchContext] = None) -> dict:
         """This comprehensive method orchestrates several data fetches to build a
         detailed sales report for a given date. A "business day" is defined as
         running until 6:00 AM the following day.
@@ -372,8 +567,9 @@ class PosterAPIClient:
         1.  Fetches all cash shifts for the given `date` and `spot_id`.
         2.  Fetches all transactions (including products and delivery info) for
             the relevant time period (from the given date to the next day).
-        3.  Asynchronously fetches transaction histories to get payment method
-            IDs and tip amounts for each transaction.
+        3.  Streams transaction histories to get payment method IDs and
+            tip amounts for each transaction, reusing the ones the run's
+            `histories` context already holds.
         4.  Fetches all individual products (line items) from those transactions.
         5.  Maps each product to its correct cash shift using its timestamp.
             Includes special logic to assign pre-shift sales (e.g., after 9 AM
@@ -391,6 +587,8 @@ class PosterAPIClient:
         Args:
             date (str): The target date in 'YYYY-MM-DD' format.
             spot_id (int, optional): The spot/location identifier. Defaults to 1.
+            histories (HistoryFetchContext, optional): The run's shared
+                history context; a private one is used if omitted.
 
         Returns:
             dict: A dictionary keyed by shift IDs. Each value is a dictionary
@@ -430,21 +628,13 @@ class PosterAPIClient:
             return {}
         transaction_ids = [t['transaction_id'] for t in transactions_data if t.get('transaction_id')]
         transactions_map = {int(t['transaction_id']): t for t in transactions_data if t.get('transaction_id')}
-        histories = asyncio.run(self.fetch_all_histories(transaction_ids))
+        if histories is None:
+            histories = HistoryFetchContext(self)
+        history_entries = histories.get_many(transaction_ids)
         payment_map, tips_map = {}, {}
-        tips_map = {}
-        for entry in histories:
-            try:
-                tx_id, _, payment_method_id, tip_sum = entry
-            except ValueError:
-                tx_id, _, payment_method_id = entry
-                tip_sum = 0.0
-            try:
-                tx_int = int(tx_id)
-            except Exception:
-                continue
-            payment_map[tx_int] = int(payment_method_id) if payment_method_id is not None else None
-            tips_map[tx_int] = float(tip_sum or 0.0)
+        for tx_int, entry in history_entries.items():
+            payment_map[tx_int] = int(entry.payment_method_id) if entry.payment_method_id is not None else None
+            tips_map[tx_int] = float(entry.tip_sum or 0.0)
         products_data = self.get_transactions_products(transaction_ids)
 
         first_shift_early_start = shifts[0]['start_dt'].replace(hour=9, minute=0, second=0) if shifts else None
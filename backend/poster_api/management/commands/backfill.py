@@ -0,0 +1,104 @@
+import logging
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+
+
+from poster_api.models import Spot
+from poster_api.services.backfill import CLAIMED_ELSEWHERE, run_backfill
+from poster_api.services.sync import resolve_spot_ids
+from salary.services import calculate_and_save_salaries
+from shift.models import Shift
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Historical backfill, one (day, spot) unit at a time.
+    1. Plans the units between --start and --end, skipping those already done
+    2. Runs them on a worker pool, recording a checkpoint per unit
+    3. Calculates salaries for the days that fully completed
+    Re-running the same command resumes an interrupted backfill.
+    """
+    help = "Backfills Poster data for a date range in parallel, resuming from checkpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=str, required=True, help='First day to backfill (YYYY-MM-DD).')
+        parser.add_argument('--end', type=str, help='Last day to backfill (YYYY-MM-DD). Defaults to yesterday.')
+        parser.add_argument(
+            '--spots',
+            type=str,
+            help="'all' or comma-separated spot IDs. Defaults to every known spot."
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Number of processes to shard the units across.')
+        parser.add_argument('--force', action='store_true', help='Re-run units that are already done.')
+        parser.add_argument('--skip-static', action='store_true', help='Skip syncing static data (products, workshops, etc.).')
+        parser.add_argument('--skip-salary', action='store_true', help='Only sync data, do not calculate salaries.')
+        parser.add_argument(
+            '--id-index',
+            action='store_true',
+            help='Seed in-memory indexes of stored transaction IDs once and skip existence queries for new IDs.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            end = (
+                datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end']
+                else datetime.now().date() - timedelta(days=1)
+            )
+        except ValueError:
+            raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+        if end < start:
+            raise CommandError("--end must not be before --start.")
+        if options['workers'] < 1 or options['processes'] < 1:
+            raise CommandError("--workers and --processes must be at least 1.")
+
+        if options['spots']:
+            try:
+                spot_ids = resolve_spot_ids(options['spots'])
+            except ValueError:
+                raise CommandError("--spots must be 'all' or a comma-separated list of integers.")
+        else:
+            spot_ids = list(Spot.objects.values_list('spot_id', flat=True)) or [1]
+
+        self.stdout.write(self.style.SUCCESS(f"=== Backfill {start} .. {end}, spots {spot_ids} ==="))
+
+        def on_unit(unit, error):
+            if error == CLAIMED_ELSEWHERE:
+                self.stdout.write(f"{unit.date} spot {unit.spot_id}: skipped, {error}")
+            elif error:
+                self.stderr.write(self.style.ERROR(f"{unit.date} spot {unit.spot_id}: {error}"))
+            else:
+                self.stdout.write(f"{unit.date} spot {unit.spot_id}: done")
+
+        report = run_backfill(
+            start, end, spot_ids,
+            workers=options['workers'],
+            processes=options['processes'],
+            force=options['force'],
+            skip_static=options['skip_static'],
+            use_id_index=options['id_index'],
+            on_unit=on_unit,
+        )
+
+        self.stdout.write(
+            f"Planned {len(report.planned)} units ({report.skipped} already done): "
+            f"{len(report.done)} done, {len(report.failed)} failed, {len(report.claimed)} claimed by other workers."
+        )
+
+        if not options['skip_salary']:
+            def on_shift(shift, error):
+                if error:
+                    self.stderr.write(self.style.ERROR(f"Error calculating salary for shift {shift.id}: {error}"))
+
+            for day in report.completed_dates:
+                count, _ = calculate_and_save_salaries(Shift.objects.filter(date=day), on_shift=on_shift)
+                if count:
+                    self.stdout.write(f"{day}: salaries calculated for {count} shifts.")
+
+        if report.failed:
+            self.stderr.write(self.style.WARNING("Some units failed; re-run the same command to retry them."))
+        else:
+            self.stdout.write(self.style.SUCCESS("=== Backfill complete. ==="))
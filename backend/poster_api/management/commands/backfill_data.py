@@ -1,10 +1,15 @@
 import logging
 from datetime import datetime
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
-from poster_api.services.saving import sync_all_from_date, PosterAPIClient
-from poster_api.services.saving import create_role_lists 
+from poster_api.services.saving import SYNC_WINDOW_DAYS, sync_all_from_date
+from poster_api.services.saving import create_role_lists
+from poster_api.services.backfill import make_api_client
+from poster_api.services.id_index import BackfillIdIndexes
+from poster_api.services.memory import peak_rss_mb
+from poster_api.services.sync import SPOT_PARALLELISM, resolve_spot_ids, run_per_spot, sync_static_data
+from poster_api.services.sync_state import get_watermark, incremental_days
 
 
 logger = logging.getLogger(__name__)
@@ -25,37 +30,121 @@ class Command(BaseCommand):
             default=1,
             help='Specify the spot_id for the sync.'
         )
+        parser.add_argument(
+            '--spots',
+            type=str,
+            help="'all' (every spot in the Spot table) or comma-separated spot IDs; overrides --spot_id."
+        )
+        parser.add_argument(
+            '--parallel',
+            type=int,
+            default=SPOT_PARALLELISM,
+            help='Number of spots synced at the same time.'
+        )
+        parser.add_argument(
+            '--window-days',
+            type=int,
+            default=SYNC_WINDOW_DAYS,
+            help='Days fetched and written per window; memory use grows with the window, not the range.'
+        )
+        parser.add_argument(
+            '--id-index',
+            action='store_true',
+            help='Seed in-memory indexes of stored transaction IDs once and skip existence queries for new IDs.'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help="Start each spot from its sync watermark when it is later than --start_date."
+        )
 
     def handle(self, *args, **options):
         start_date = options['start_date']
-        spot_id = options['spot_id']
-        api_client = PosterAPIClient()
+        parallel = max(options['parallel'], 1)
+        api_client = make_api_client(parallel)
 
         try:
             datetime.strptime(start_date, '%Y-%m-%d')
         except ValueError:
             self.stderr.write(self.style.ERROR("Invalid date format. Use YYYY-MM-DD."))
             return
+        if options['window_days'] < 1:
+            raise CommandError("--window-days must be at least 1.")
 
         self.stdout.write(self.style.SUCCESS(f"=== Starting FULL historical sync ==="))
         self.stdout.write(f"Start Date: {start_date}")
-        self.stdout.write(f"Spot ID: {spot_id}")
-        
+
         self.stdout.write("Step 1: Ensuring roles exist...")
         create_role_lists(api_client)
         self.stdout.write(self.style.SUCCESS("Roles ensured."))
 
-        self.stdout.write(f"Step 2: Starting sync_all_from_date...")
+        self.stdout.write("Step 2: Syncing static data once for all spots...")
+        try:
+            sync_static_data(api_client)
+        except Exception as e:
+            logger.error(f"FATAL: Could not sync static data: {e}", exc_info=True)
+            self.stderr.write(self.style.ERROR(f"FATAL: Could not sync static data. Aborting. Error: {e}"))
+            return
+
+        if options['spots']:
+            try:
+                spot_ids = resolve_spot_ids(options['spots'], api_client)
+            except ValueError:
+                raise CommandError("--spots must be 'all' or a comma-separated list of integers.")
+        else:
+            spot_ids = [options['spot_id']]
+        self.stdout.write(f"Spot IDs: {spot_ids} ({parallel} at a time)")
+
+        start_dates = {spot_id: start_date for spot_id in spot_ids}
+        if options['incremental']:
+            for spot_id in spot_ids:
+                watermark = get_watermark(spot_id)
+                if watermark:
+                    resume_date = incremental_days(watermark)[0].strftime('%Y-%m-%d')
+                    if resume_date > start_date:
+                        self.stdout.write(f"Spot {spot_id}: resuming from watermark {watermark:%Y-%m-%d %H:%M}.")
+                        start_dates[spot_id] = resume_date
+
+        self.stdout.write(f"Step 3: Starting sync_all_from_date per spot...")
         self.stdout.write(self.style.WARNING(
             "This will take a long time. Do not interrupt."
         ))
-        
+
         try:
-            sync_all_from_date(api_client, start_date, spot_id)
-            self.stdout.write(self.style.SUCCESS(
-                "=== FULL historical sync complete! ==="
-            ))
+            id_indexes = None
+            if options['id_index']:
+                self.stdout.write("Seeding transaction ID indexes...")
+                id_indexes = BackfillIdIndexes.seed()
+                self.stdout.write(
+                    f"Indexed {len(id_indexes.transactions)} transactions, "
+                    f"{len(id_indexes.transactions_with_products)} with line items."
+                )
         except Exception as e:
             logger.error(f"FATAL error during backfill: {e}", exc_info=True)
             self.stderr.write(self.style.ERROR(f"FATAL error during backfill: {e}"))
-            self.stderr.write(self.style.ERROR("Check logs. Data may be incomplete."))
\ No newline at end of file
+            return
+
+        def sync_spot(spot_id):
+            return sync_all_from_date(
+                api_client, start_dates[spot_id], spot_id,
+                id_indexes=id_indexes, sync_static=False, window_days=options['window_days'],
+            )
+
+        def on_spot(result):
+            if result.ok:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Spot {result.spot_id}: synced from {start_dates[result.spot_id]} in {result.duration:.1f}s, "
+                    f"peak RSS {result.result or 0:.1f} MB."
+                ))
+            else:
+                self.stderr.write(self.style.ERROR(f"Spot {result.spot_id}: FATAL error during backfill: {result.error}"))
+
+        results = run_per_spot(spot_ids, sync_spot, max_parallel=parallel, on_spot=on_spot)
+        self.stdout.write(f"Peak RSS: {peak_rss_mb():.1f} MB")
+
+        if all(result.ok for result in results):
+            self.stdout.write(self.style.SUCCESS(
+                "=== FULL historical sync complete! ==="
+            ))
+        else:
+            self.stderr.write(self.style.ERROR("Check logs. Data may be incomplete."))
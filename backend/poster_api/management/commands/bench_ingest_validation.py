@@ -0,0 +1,96 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+
+
+from poster_api.serializers import (
+    CategoriesSalesAPISerializer,
+    ProductAPISerializer,
+    ProductSalesAPISerializer,
+)
+from poster_api.services.validation import compile_schema
+
+
+def _product_row(i: int) -> dict:
+    return {
+        "product_id": i,
+        "product_name": f"Product {i}",
+        "category_id": i % 50,
+        "category_name": f"Category {i % 50}",
+        "cost": round(random.uniform(0, 500), 2),
+        "fiscal": bool(i % 2),
+        "workshop": i % 5,
+    }
+
+
+def _product_sales_row(i: int) -> dict:
+    return {
+        "product_id": i,
+        "product_name": f"Product {i}",
+        "category_id": i % 50,
+        "category_name": f"Category {i % 50}",
+        "product_price": str(random.randint(100, 90000)),
+        "count": float(random.randint(1, 40)),
+        "product_profit": round(random.uniform(0, 900), 2),
+    }
+
+
+def _categories_sales_row(i: int) -> dict:
+    return {
+        "category_id": i,
+        "category_name": f"Category {i}",
+        "count": float(random.randint(1, 400)),
+        "profit": round(random.uniform(0, 9000), 2),
+    }
+
+
+DATASETS = {
+    "products": (ProductAPISerializer, _product_row),
+    "products_sales": (ProductSalesAPISerializer, _product_sales_row),
+    "categories_sales": (CategoriesSalesAPISerializer, _categories_sales_row),
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the compiled ingest validation against DRF serializers on synthetic rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100_000,
+            help='Number of synthetic rows per dataset.'
+        )
+        parser.add_argument(
+            '--dataset',
+            choices=sorted(DATASETS),
+            action='append',
+            help='Dataset to benchmark (can be repeated). Defaults to all.'
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        random.seed(0)
+
+        for name in options['dataset'] or sorted(DATASETS):
+            serializer_class, make_row = DATASETS[name]
+            data = [make_row(i) for i in range(rows)]
+
+            start = time.perf_counter()
+            serializer = serializer_class(data=data, many=True)
+            serializer.is_valid(raise_exception=True)
+            drf_rows = serializer.validated_data
+            drf_time = time.perf_counter() - start
+
+            schema = compile_schema(serializer_class)
+            start = time.perf_counter()
+            fast_rows = schema.validate_or_raise(data)
+            fast_time = time.perf_counter() - start
+
+            same = [dict(r) for r in drf_rows] == fast_rows
+            self.stdout.write(
+                f"{name}: {rows} rows | DRF {drf_time:.3f}s | compiled {fast_time:.3f}s | "
+                f"x{drf_time / fast_time:.1f} | identical output: {same}"
+            )
+            if not same:
+                self.stderr.write(self.style.ERROR(f"{name}: compiled output differs from DRF."))
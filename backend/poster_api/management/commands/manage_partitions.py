@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from poster_api.services.partitioning import (
+    PARTITIONED_MODELS,
+    conversion_sql,
+    detach_sql,
+    ensure_partitions_sql,
+    is_partitioned,
+    partition_status,
+    run_statements,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Manages monthly date_close partitions of Transactions, TransactionsProducts and "
+        "TransactionHistory (PostgreSQL only). Run with --months-ahead from cron to keep "
+        "future partitions in place. Partitioned, unique keys include date_close, so "
+        "transaction_id is kept unique by a claim table and triggers instead; line items "
+        "and history need a date_close and it can't change. Stop the worker and cron syncs "
+        "while enabling and restart them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--enable',
+            action='store_true',
+            help='Convert the tables to partitioned tables (one transaction, locks them while copying).'
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='Pre-create partitions for the current month and this many months ahead.'
+        )
+        parser.add_argument(
+            '--detach-before',
+            type=str,
+            help='Detach partitions for months before this one (YYYY-MM).'
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Drop detached partitions instead of moving them to the archive schema.'
+        )
+        parser.add_argument(
+            '--archive-schema',
+            type=str,
+            default='archive',
+            help='Schema that receives detached partitions.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the SQL without executing it.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning is only supported on PostgreSQL.")
+
+        detach_before = None
+        if options['detach_before']:
+            try:
+                detach_before = datetime.strptime(options['detach_before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--detach-before must look like YYYY-MM.")
+
+        months_ahead = options['months_ahead']
+        statements = []
+        with connection.cursor() as cursor:
+            partitioned = all(is_partitioned(cursor, m._meta.db_table) for m in PARTITIONED_MODELS)
+            if options['enable'] and not partitioned:
+                statements += conversion_sql(cursor, months_ahead=months_ahead)
+            elif options['enable']:
+                self.stdout.write("Tables are already partitioned.")
+
+            if partitioned:
+                statements += ensure_partitions_sql(cursor, months_ahead=months_ahead)
+                if detach_before:
+                    statements += detach_sql(
+                        cursor, detach_before,
+                        drop=options['drop'],
+                        archive_schema=options['archive_schema'],
+                    )
+            elif not options['enable']:
+                self.stdout.write(self.style.WARNING("Tables are not partitioned; run with --enable first."))
+                return
+            elif detach_before:
+                self.stdout.write(self.style.WARNING("--detach-before is ignored while enabling; run it again."))
+
+        if options['dry_run']:
+            for sql in statements:
+                self.stdout.write(f"{sql};")
+            return
+
+        if statements:
+            run_statements(statements)
+            self.stdout.write(self.style.SUCCESS(f"Executed {len(statements)} statements."))
+
+        with connection.cursor() as cursor:
+            for table, partitions in partition_status(cursor).items():
+                self.stdout.write(f"{table}: {len(partitions)} partitions")
@@ -1,25 +1,15 @@
 import logging
 from datetime import datetime, timedelta
-from django.core.management.base import BaseCommand
-from django.db import transaction
-
-
-from poster_api.services.saving import (
-    save_cash_shifts_range,
-    save_products_sales,
-    save_categories_sales,
-    save_clients,
-    save_transactions,
-    save_transactions_products,
-    save_transaction_history,
-    save_shift_sales_to_db,
-    save_workshop,
-    save_payments_id,
-    save_products,
-    save_categories,
-    PosterAPIClient
-)
-from salary.services import calculate_and_save_shift_salaries
+from django.core.management.base import BaseCommand, CommandError
+
+
+from poster_api.client import HistoryFetchContext
+from poster_api.models import SyncState
+from poster_api.services.backfill import make_api_client
+from poster_api.services.leases import LeaseHeld
+from poster_api.services.sync import SPOT_PARALLELISM, resolve_spot_ids, run_per_spot, sync_day, sync_static_data
+from poster_api.services.sync_state import get_watermark, incremental_days
+from salary.dirty import recalculate_dirty_shifts
 from shift.models import Shift
 
 logger = logging.getLogger(__name__)
@@ -29,6 +19,9 @@ class Command(BaseCommand):
     Everyday command for CRON
     1. Sync all data from Poster API for previous day 
     2. Calculate and save salaries for all shift for previous day 
+    With --incremental it syncs every day from the spot's watermark instead,
+    so it can run hourly. With --spots several spots are synced by one run:
+    the static catalog once, then the spots' pipelines concurrently.
     """
     help = "Runs the full daily data sync and salary calculation for the previous day."
 
@@ -54,11 +47,27 @@ class Command(BaseCommand):
             default=1,
             help='Specify the spot_id for the sync.'
         )
+        parser.add_argument(
+            '--spots',
+            type=str,
+            help="'all' (every spot in the Spot table) or comma-separated spot IDs; overrides --spot_id."
+        )
+        parser.add_argument(
+            '--parallel',
+            type=int,
+            default=SPOT_PARALLELISM,
+            help='Number of spots synced at the same time.'
+        )
         parser.add_argument(
             '--force-salary',
             action='store_true',
             help='Attempt salary calculation even if data sync fails.'
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help="Sync from the spot's watermark through today (falls back to --date or yesterday on the first run)."
+        )
 
     def handle(self, *args, **options):
         if options['date']:
@@ -71,84 +80,115 @@ class Command(BaseCommand):
         else:
             date_obj = datetime.now().date() - timedelta(days=1)
             date_str = date_obj.strftime('%Y-%m-%d')
-        
-        spot_id = options['spot_id']
-        api_client = PosterAPIClient()
 
-        self.stdout.write(self.style.SUCCESS(f"=== Starting daily sync for {date_str} (Spot ID: {spot_id}) ==="))
+        parallel = max(options['parallel'], 1)
+        api_client = make_api_client(parallel)
 
         try:
             if not options['skip_static']:
-                self.stdout.write("Syncing static data (workshops, payments, products)...")
-                save_workshop(api_client.get_workshop())
-                save_payments_id(api_client.get_payments_id())
-                save_products(api_client.get_products())
-                save_categories(api_client.get_category())
+                self.stdout.write("Syncing static data (spots, workshops, payments, products)...")
+                sync_static_data(api_client)
                 self.stdout.write(self.style.SUCCESS("Static data synced."))
             else:
                 self.stdout.write("Skipping static data sync.")
-
-            self.stdout.write(f"Syncing transactional data for {date_str}...")
-            
-            with transaction.atomic():
-                save_cash_shifts_range(api_client, date_str, spot_id, date_str)
-                
-                products_sales = api_client.get_products_sales(date_str, date_str, spot_id)
-                save_products_sales(products_sales)
-
-                categories_sales = api_client.get_categories_sales(date_str, date_str, spot_id)
-                save_categories_sales(categories_sales)
-                
-                clients_sales = api_client.get_clients_sales(date_str, date_str, spot_id)
-                save_clients(clients_sales)
-                
-                transactions = api_client.get_transactions(date_str, date_str, spot_id)
-                save_transactions(transactions)
-
-                if transactions:
-                    tx_ids = [tx.get("transaction_id") for tx in transactions if tx.get("transaction_id")]
-                    
-                    tx_products = api_client.get_transactions_products(tx_ids)
-                    save_transactions_products(tx_products)
-                    
-                    self.stdout.write(f"Syncing history for {len(tx_ids)} transactions...")
-                    for tx_id in tx_ids:
-                        history = api_client.make_request(
-                            "GET", "dash.getTransactionHistory", params={"transaction_id": tx_id}
-                        ).get("response", [])
-                        save_transaction_history(tx_id, history)
-                
-                save_shift_sales_to_db(api_client, date_str, spot_id)
-
-            self.stdout.write(self.style.SUCCESS(f"Transactional data for {date_str} synced."))
-
         except Exception as e:
-            logger.error(f"Error during data sync for {date_str}: {e}", exc_info=True)
+            logger.error(f"Error during static data sync: {e}", exc_info=True)
             self.stderr.write(self.style.ERROR(f"Error during data sync: {e}"))
             if not options['force_salary']:
                 self.stderr.write(self.style.ERROR("Aborting salary calculation due to sync error."))
-                return 
+                return
+            spot_ids = []
+        else:
+            spot_ids = self._spot_ids(options, api_client)
 
-        if not options['skip_salary']:
-            self.stdout.write(f"Calculating salaries for {date_str}...")
-            
-            shifts_for_day = Shift.objects.filter(date=date_obj)
-            
-            if not shifts_for_day.exists():
-                self.stdout.write(self.style.WARNING(
-                    f"No employee shifts (Shift models) found for {date_str}. No salaries to calculate."
+        plans = {spot_id: self._plan(spot_id, date_obj, options['incremental']) for spot_id in spot_ids}
+
+        def sync_spot(spot_id):
+            days, since = plans[spot_id]
+            # Shift sales of a day reach into the next morning, so consecutive days share histories.
+            histories = HistoryFetchContext(api_client)
+            held = []
+            for day in days:
+                try:
+                    sync_day(api_client, day.strftime('%Y-%m-%d'), spot_id, since=since, histories=histories)
+                except LeaseHeld as e:
+                    # Another process (cron or a manual backfill) is syncing this day right now.
+                    logger.info(f"Spot {spot_id}, {day}: skipped, {e}")
+                    held.append(day)
+            return held
+
+        def on_spot(result):
+            days = plans[result.spot_id][0]
+            if result.ok:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Spot {result.spot_id}: {days[0]}..{days[-1]} synced in {result.duration:.1f}s."
                 ))
+                for day in result.result:
+                    self.stdout.write(self.style.WARNING(
+                        f"Spot {result.spot_id}: {day} skipped, another process is syncing it."
+                    ))
             else:
-                self.stdout.write(f"Found {shifts_for_day.count()} shifts. Calculating salaries...")
-                count = 0
-                for shift in shifts_for_day:
-                    try:
-                        calculate_and_save_shift_salaries(shift)
-                        count += 1
-                    except Exception as e:
-                        self.stderr.write(self.style.ERROR(f"Error calculating salary for shift {shift.id}: {e}"))
-                self.stdout.write(self.style.SUCCESS(f"Salaries calculated and saved for {count} shifts."))
+                self.stderr.write(self.style.ERROR(f"Spot {result.spot_id}: sync failed: {result.error}"))
+
+        if spot_ids:
+            self.stdout.write(self.style.SUCCESS(
+                f"=== Starting daily sync for spots {spot_ids} ({parallel} at a time) ==="
+            ))
+        else:
+            self.stdout.write(self.style.WARNING("No spots to sync."))
+        results = run_per_spot(spot_ids, sync_spot, max_parallel=parallel, on_spot=on_spot)
+        failed = [result.spot_id for result in results if not result.ok]
+        days = sorted({day for days, _ in plans.values() for day in days}) or [date_obj]
+
+        if failed and not options['force_salary']:
+            self.stderr.write(self.style.ERROR(f"Sync failed for spots {failed}."))
+            self.stderr.write(self.style.ERROR("Aborting salary calculation due to sync error."))
+            return
+
+        if not options['skip_salary']:
+            for day in days:
+                self._calculate_salaries(day)
         else:
             self.stdout.write("Skipping salary calculation.")
             
-        self.stdout.write(self.style.SUCCESS(f"=== Daily sync for {date_str} complete. ==="))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"=== Daily sync for {days[0]}..{days[-1]} complete. ==="))
+
+    def _spot_ids(self, options, api_client):
+        if not options['spots']:
+            return [options['spot_id']]
+        try:
+            return resolve_spot_ids(options['spots'], api_client)
+        except ValueError:
+            raise CommandError("--spots must be 'all' or a comma-separated list of integers.")
+
+    def _plan(self, spot_id, date_obj, incremental):
+        """The days to sync for a spot and the transactions watermark to filter them by."""
+        if not incremental:
+            return [date_obj], None
+        watermark = get_watermark(spot_id)
+        if not watermark:
+            self.stdout.write(f"Spot {spot_id}: no watermark yet, running a full day sync.")
+            return [date_obj], None
+        self.stdout.write(f"Spot {spot_id}: incremental sync from watermark {watermark:%Y-%m-%d %H:%M}.")
+        return incremental_days(watermark), get_watermark(spot_id, [SyncState.TRANSACTIONS])
+
+    def _calculate_salaries(self, day):
+        self.stdout.write(f"Calculating salaries for {day}...")
+        
+        shifts_for_day = Shift.objects.filter(date=day)
+        
+        if not shifts_for_day.exists():
+            self.stdout.write(self.style.WARNING(
+                f"No employee shifts (Shift models) found for {day}. No salaries to calculate."
+            ))
+            return
+
+        def on_shift(shift, error):
+            if error:
+                self.stderr.write(self.style.ERROR(f"Error calculating salary for shift {shift.id}: {error}"))
+
+        # Only shifts whose sales, staff or rules changed since their last calculation.
+        count, _ = recalculate_dirty_shifts(day, day, on_shift=on_shift)
+        self.stdout.write(self.style.SUCCESS(
+            f"Salaries calculated and saved for {count} of {shifts_for_day.count()} shifts (the others are up to date)."
+        ))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def dedupe_before_unique(apps, schema_editor):
+    """Collapses duplicates that would violate the new unique keys."""
+    Clients = apps.get_model('poster_api', 'Clients')
+    TransactionsProducts = apps.get_model('poster_api', 'TransactionsProducts')
+    ShiftSale = apps.get_model('poster_api', 'ShiftSale')
+
+    dup_clients = (
+        Clients.objects.values('client_id')
+        .annotate(keep_id=Min('id'), n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for row in dup_clients:
+        extra = Clients.objects.filter(client_id=row['client_id']).exclude(id=row['keep_id'])
+        TransactionsProducts.objects.filter(client__in=extra).update(client_id=row['keep_id'])
+        extra.delete()
+
+    dup_sales = (
+        ShiftSale.objects.values('shift_id', 'date')
+        .annotate(keep_id=Min('id'), n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for row in dup_sales:
+        ShiftSale.objects.filter(
+            shift_id=row['shift_id'], date=row['date']
+        ).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0004_alter_transactions_transaction_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_before_unique, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='clients',
+            name='client_id',
+            field=models.IntegerField(default=1, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='shiftsaleitem',
+            index=models.Index(fields=['shift_sale', 'category_name'], name='shift_item_sale_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionhistory',
+            index=models.Index(fields=['transaction', 'type_history', 'time'], name='tx_history_tx_type_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['date_close', 'spot_id'], name='tx_date_close_spot_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shiftsale',
+            constraint=models.UniqueConstraint(fields=('shift_id', 'date'), name='uniq_shift_sale_shift_date'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:51
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_parent_date_close(apps, schema_editor):
+    """Fills the new column from the parent transaction for existing rows."""
+    Transactions = apps.get_model('poster_api', 'Transactions')
+    parent_close = Subquery(
+        Transactions.objects.filter(pk=OuterRef('transaction_id')).values('date_close')[:1]
+    )
+    for model_name in ('TransactionsProducts', 'TransactionHistory'):
+        model = apps.get_model('poster_api', model_name)
+        model.objects.filter(date_close__isnull=True).update(date_close=parent_close)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0005_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionhistory',
+            name='date_close',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionsproducts',
+            name='date_close',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(copy_parent_date_close, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def drop_dateless_aggregates(apps, schema_editor):
+    """The old rows are snapshots of whatever range was synced last and have no date; resync rebuilds them."""
+    apps.get_model('poster_api', 'ProductSales').objects.all().delete()
+    apps.get_model('poster_api', 'CategoriesSales').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0006_child_date_close'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_dateless_aggregates, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='categoriessales',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='categoriessales',
+            name='spot_id',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='productsales',
+            name='spot_id',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='categoriessales',
+            name='count',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='productsales',
+            name='count',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='categoriessales',
+            index=models.Index(fields=['category', 'date'], name='category_sales_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsales',
+            index=models.Index(fields=['product', 'date'], name='product_sales_product_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoriessales',
+            constraint=models.UniqueConstraint(fields=('date', 'spot_id', 'category'), name='uniq_category_sales_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsales',
+            constraint=models.UniqueConstraint(fields=('date', 'spot_id', 'product'), name='uniq_product_sales_day'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0007_dated_sales_facts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('spot_id', models.IntegerField()),
+                ('status', models.CharField(choices=[('done', 'Done'), ('failed', 'Failed')], max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('transactions', models.IntegerField(default=0)),
+                ('duration', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Backfill Checkpoint',
+                'verbose_name_plural': 'Backfill Checkpoints',
+                'constraints': [models.UniqueConstraint(fields=('date', 'spot_id'), name='uniq_backfill_unit')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0008_backfill_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spot_id', models.IntegerField()),
+                ('dataset', models.CharField(choices=[('cash_shifts', 'Cash shifts'), ('sales_facts', 'Product and category sales'), ('clients', 'Clients'), ('transactions', 'Transactions'), ('shift_sales', 'Shift sales')], max_length=32)),
+                ('watermark', models.DateTimeField(blank=True, null=True)),
+                ('last_window_start', models.DateTimeField(blank=True, null=True)),
+                ('last_window_end', models.DateTimeField(blank=True, null=True)),
+                ('rows', models.IntegerField(default=0)),
+                ('total_rows', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('failed', 'Failed')], default='ok', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sync State',
+                'verbose_name_plural': 'Sync States',
+                'constraints': [models.UniqueConstraint(fields=('spot_id', 'dataset'), name='uniq_sync_state')],
+            },
+        ),
+    ]
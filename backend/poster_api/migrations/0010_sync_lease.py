@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0009_sync_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spot_id', models.IntegerField()),
+                ('day', models.DateField()),
+                ('dataset', models.CharField(choices=[('cash_shifts', 'Cash shifts'), ('sales_facts', 'Product and category sales'), ('clients', 'Clients'), ('transactions', 'Transactions'), ('shift_sales', 'Shift sales')], max_length=32)),
+                ('owner', models.CharField(max_length=100)),
+                ('acquired_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Sync Lease',
+                'verbose_name_plural': 'Sync Leases',
+                'constraints': [models.UniqueConstraint(fields=('spot_id', 'day', 'dataset'), name='uniq_sync_lease')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poster_api', '0010_sync_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shiftsaleitem',
+            name='product',
+            field=models.ForeignKey(blank=True, db_column='product_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='shift_sale_items', to='poster_api.product', to_field='product_id'),
+        ),
+        migrations.AddField(
+            model_name='shiftsaleitem',
+            name='workshop_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
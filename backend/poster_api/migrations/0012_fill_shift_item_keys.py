@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 20:05
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Trim
+
+
+def fill_item_keys(apps, schema_editor):
+    """Fills the integer keys of existing items: numeric workshops as is, products matched by name."""
+    ShiftSaleItem = apps.get_model('poster_api', 'ShiftSaleItem')
+    Product = apps.get_model('poster_api', 'Product')
+    for workshop in ShiftSaleItem.objects.values_list('workshop', flat=True).distinct():
+        if workshop and workshop.strip().isdigit():
+            ShiftSaleItem.objects.filter(workshop=workshop).update(workshop_id=int(workshop))
+    product_id = Subquery(
+        Product.objects.annotate(name=Trim('product_name')).filter(
+            name=Trim(OuterRef('product_name'))
+        ).order_by('product_id').values('product_id')[:1]
+    )
+    ShiftSaleItem.objects.filter(product__isnull=True).update(product_id=product_id)
+
+
+class Migration(migrations.Migration):
+    # Separate from 0011: PostgreSQL can't create its indexes after these updates in one transaction.
+
+    dependencies = [
+        ('poster_api', '0011_shift_item_product_workshop_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_item_keys, migrations.RunPython.noop),
+    ]
@@ -27,15 +27,23 @@ class Category(models.Model):
 
 class CategoriesSales(models.Model):
     """
-    Stores aggregated sales data (profit, count) grouped by Category.
+    Daily sales fact (profit, count) for one Category at one spot.
     """
+    date = models.DateField()
+    spot_id = models.IntegerField(default=1)
     category = models.ForeignKey(Category, on_delete=models.SET_DEFAULT, default=1)    
     profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    count = models.IntegerField(default=0)    
+    count = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     class Meta:
         verbose_name = "Category Sale Aggregate"
         verbose_name_plural = "Category Sale Aggregates"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'spot_id', 'category'], name='uniq_category_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'date'], name='category_sales_cat_date_idx'),
+        ]
 
 class Product(models.Model):
     """Represents an individual product or menu item that can be sold."""
@@ -52,15 +60,23 @@ class Product(models.Model):
 
 class ProductSales(models.Model):
     """
-    Stores aggregated sales data (profit, count) grouped by Product.
+    Daily sales fact (profit, count) for one Product at one spot.
     """
+    date = models.DateField()
+    spot_id = models.IntegerField(default=1)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="sales")
     product_profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    count = models.IntegerField(default=0)
+    count = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     
     class Meta:
         verbose_name = "Product Sale Aggregate"
         verbose_name_plural = "Product Sale Aggregates"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'spot_id', 'product'], name='uniq_product_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'date'], name='product_sales_product_date_idx'),
+        ]
 
 
 class Workshop(models.Model):
@@ -88,7 +104,7 @@ class Payments_ID(models.Model):
 
 class Clients(models.Model):
     """Represents a customer, storing contact info and lifetime value metrics."""
-    client_id = models.IntegerField(default=1)
+    client_id = models.IntegerField(default=1, unique=True)
     firstname = models.CharField(default="")
     lastname = models.CharField(default="")
     name = models.CharField(max_length=255,  blank=True, default="")
@@ -132,6 +148,9 @@ class Transactions(models.Model):
     class Meta:
         verbose_name = "Transaction"
         verbose_name_plural = "Transactions"
+        indexes = [
+            models.Index(fields=['date_close', 'spot_id'], name='tx_date_close_spot_idx'),
+        ]
 
 
 class TransactionsProducts(models.Model):
@@ -147,6 +166,8 @@ class TransactionsProducts(models.Model):
     client = models.ForeignKey(Clients, on_delete=models.CASCADE, related_name="transaction_entries", null=True, blank=True)
     product_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     product_profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Copy of the parent's date_close; the partition key when the table is partitioned.
+    date_close = models.DateTimeField(null=True, blank=True, db_index=True)
     
     class Meta:
         verbose_name = "Transaction Product"
@@ -166,10 +187,15 @@ class TransactionHistory(models.Model):
     value3 = models.CharField(default="")
     value_text = models.JSONField(null=True, blank=True)
     spot_tablet_id = models.IntegerField(null=True, blank=True)
+    # Copy of the parent's date_close; the partition key when the table is partitioned.
+    date_close = models.DateTimeField(null=True, blank=True, db_index=True)
     
     class Meta:
         verbose_name = "Transaction History"
         verbose_name_plural = "Transaction Histories"
+        indexes = [
+            models.Index(fields=['transaction', 'type_history', 'time'], name='tx_history_tx_type_time_idx'),
+        ]
 
 
 class AnalyticsRecord(models.Model):
@@ -249,6 +275,9 @@ class ShiftSale(models.Model):
     class Meta:
         verbose_name = "Aggregated Shift Sale"
         verbose_name_plural = "Aggregated Shift Sales"
+        constraints = [
+            models.UniqueConstraint(fields=['shift_id', 'date'], name='uniq_shift_sale_shift_date'),
+        ]
 
 
 class ShiftSaleItem(models.Model):
@@ -259,11 +288,18 @@ class ShiftSaleItem(models.Model):
     shift_sale = models.ForeignKey(ShiftSale, related_name="items", on_delete=models.CASCADE)
 
     product_name = models.CharField(max_length=255)
+    # Keyed by Poster's product ID; items may arrive before the product is synced, hence no constraint.
+    product = models.ForeignKey(
+        Product, to_field='product_id', db_column='product_id', related_name='shift_sale_items',
+        on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+    )
     count = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     product_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     payed_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     profit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     workshop = models.CharField(max_length=255, blank=True, null=True)
+    # Poster's workshop ID (`Workshop.workshop_id`) as an integer, for joins against salary rules.
+    workshop_id = models.IntegerField(null=True, blank=True, db_index=True)
     category_name = models.CharField(max_length=255, blank=True, null=True)
     delivery_service = models.CharField(max_length=255, blank=True, null=True)
     tips = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -271,6 +307,115 @@ class ShiftSaleItem(models.Model):
     class Meta:
         verbose_name = "Aggregated Shift Item"
         verbose_name_plural = "Aggregated Shift Items"
+        indexes = [
+            models.Index(fields=['shift_sale', 'category_name'], name='shift_item_sale_category_idx'),
+        ]
+
+
+class BackfillCheckpoint(models.Model):
+    """
+    Outcome of one (spot, day) unit of a historical backfill.
+    Units marked done are skipped when an interrupted backfill is resumed.
+    """
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    date = models.DateField()
+    spot_id = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    attempts = models.IntegerField(default=0)
+    transactions = models.IntegerField(default=0)
+    duration = models.FloatField(default=0)
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Backfill {self.date} / spot {self.spot_id}: {self.status}"
+
+    class Meta:
+        verbose_name = "Backfill Checkpoint"
+        verbose_name_plural = "Backfill Checkpoints"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'spot_id'], name='uniq_backfill_unit'),
+        ]
+
+
+class SyncState(models.Model):
+    """
+    Sync progress of one dataset for one spot.
+    `watermark` is the moment up to which the dataset is known to be complete;
+    incremental syncs resume from it.
+    """
+    CASH_SHIFTS = "cash_shifts"
+    SALES_FACTS = "sales_facts"
+    CLIENTS = "clients"
+    TRANSACTIONS = "transactions"
+    SHIFT_SALES = "shift_sales"
+    DATASET_CHOICES = [
+        (CASH_SHIFTS, "Cash shifts"),
+        (SALES_FACTS, "Product and category sales"),
+        (CLIENTS, "Clients"),
+        (TRANSACTIONS, "Transactions"),
+        (SHIFT_SALES, "Shift sales"),
+    ]
+
+    STATUS_OK = "ok"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_OK, "OK"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    spot_id = models.IntegerField()
+    dataset = models.CharField(max_length=32, choices=DATASET_CHOICES)
+    watermark = models.DateTimeField(null=True, blank=True)
+    last_window_start = models.DateTimeField(null=True, blank=True)
+    last_window_end = models.DateTimeField(null=True, blank=True)
+    rows = models.IntegerField(default=0)
+    total_rows = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OK)
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.dataset} / spot {self.spot_id}: {self.watermark}"
+
+    class Meta:
+        verbose_name = "Sync State"
+        verbose_name_plural = "Sync States"
+        constraints = [
+            models.UniqueConstraint(fields=['spot_id', 'dataset'], name='uniq_sync_state'),
+        ]
+
+
+class SyncLease(models.Model):
+    """
+    A time-limited claim on syncing one dataset of one spot for one day.
+
+    A worker holds the leases of a unit while it syncs it, so concurrent
+    workers skip that unit instead of syncing it twice. A lease that is not
+    renewed before `expires_at` (its worker died) can be taken over.
+    """
+    spot_id = models.IntegerField()
+    day = models.DateField()
+    dataset = models.CharField(max_length=32, choices=SyncState.DATASET_CHOICES)
+    owner = models.CharField(max_length=100)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.dataset} / spot {self.spot_id} / {self.day}: {self.owner} until {self.expires_at}"
+
+    class Meta:
+        verbose_name = "Sync Lease"
+        verbose_name_plural = "Sync Leases"
+        constraints = [
+            models.UniqueConstraint(fields=['spot_id', 'day', 'dataset'], name='uniq_sync_lease'),
+        ]
 
 
 class Spot(models.Model):
@@ -0,0 +1,243 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+import requests
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from ..client import PosterAPIClient
+from ..models import BackfillCheckpoint
+from .id_index import BackfillIdIndexes
+from .leases import LeaseHeld
+from .sync import SYNC_FETCH_WORKERS, sync_day, sync_static_data
+
+logger = logging.getLogger(__name__)
+
+# What `run_unit` returns for a unit another worker has already run or is running.
+CLAIMED_ELSEWHERE = "claimed by another worker"
+
+
+@dataclass(frozen=True)
+class BackfillUnit:
+    """One unit of backfill work: all transactional data of one spot for one day."""
+    date: date
+    spot_id: int
+
+
+@dataclass
+class BackfillReport:
+    """Outcome of a backfill run."""
+    planned: List[BackfillUnit] = field(default_factory=list)
+    done: List[BackfillUnit] = field(default_factory=list)
+    failed: List[Tuple[BackfillUnit, str]] = field(default_factory=list)
+    claimed: List[BackfillUnit] = field(default_factory=list)
+    skipped: int = 0
+
+    def merge(self, other: 'BackfillReport'):
+        self.done.extend(other.done)
+        self.failed.extend(other.failed)
+        self.claimed.extend(other.claimed)
+
+    @property
+    def completed_dates(self) -> List[date]:
+        """Dates of this run where every planned unit succeeded here; units left to other workers don't count."""
+        failed_dates = {unit.date for unit, _ in self.failed} | {unit.date for unit in self.claimed}
+        done_dates = {unit.date for unit in self.done}
+        return sorted(done_dates - failed_dates)
+
+
+def plan_units(start: date, end: date, spot_ids: Iterable[int], force: bool = False) -> Tuple[List[BackfillUnit], int]:
+    """
+    Lists the (day, spot) units between `start` and `end`, oldest first.
+
+    Units with a 'done' checkpoint are left out unless `force` is set, so an
+    interrupted run resumes where it stopped.
+
+    Returns:
+        tuple: (units to run, number of units skipped as already done)
+    """
+    spot_ids = list(spot_ids)
+    units = [
+        BackfillUnit(start + timedelta(days=offset), spot_id)
+        for offset in range((end - start).days + 1)
+        for spot_id in spot_ids
+    ]
+    if force:
+        return units, 0
+
+    done: Set[Tuple[date, int]] = set(
+        BackfillCheckpoint.objects.filter(
+            date__range=(start, end), spot_id__in=spot_ids, status=BackfillCheckpoint.STATUS_DONE
+        ).values_list('date', 'spot_id')
+    )
+    pending = [unit for unit in units if (unit.date, unit.spot_id) not in done]
+    return pending, len(units) - len(pending)
+
+
+def make_api_client(workers: int) -> PosterAPIClient:
+    """Builds a client whose keep-alive connection pool is shared by `workers` units, each fetching concurrently."""
+    pool_size = workers * SYNC_FETCH_WORKERS
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return PosterAPIClient(session=session)
+
+
+def _record_checkpoint(unit: BackfillUnit, status: str, transactions: int = 0,
+                       duration: float = 0.0, error: str = ""):
+    values = dict(status=status, transactions=transactions, duration=duration, error=error)
+    updated = BackfillCheckpoint.objects.filter(date=unit.date, spot_id=unit.spot_id).update(
+        attempts=F('attempts') + 1, updated_at=timezone.now(), **values
+    )
+    if not updated:
+        BackfillCheckpoint.objects.create(date=unit.date, spot_id=unit.spot_id, attempts=1, **values)
+
+
+def run_unit(api_client, unit: BackfillUnit, id_indexes: Optional[BackfillIdIndexes] = None,
+             force: bool = False) -> Optional[str]:
+    """
+    Syncs one unit and records its checkpoint.
+
+    The unit's stages commit one by one (see `sync_day`); the 'done'
+    checkpoint is only written after all of them, so a crash never leaves a
+    unit marked done without its data, and re-running it is idempotent.
+
+    Several backfills may cover the same units: a unit another worker
+    finished since planning, or is syncing right now (it holds the day's
+    leases), is left to that worker and not recorded here.
+
+    Returns:
+        Optional[str]: The error message, `CLAIMED_ELSEWHERE`, or None on success.
+    """
+    if not force and BackfillCheckpoint.objects.filter(
+        date=unit.date, spot_id=unit.spot_id, status=BackfillCheckpoint.STATUS_DONE
+    ).exists():
+        return CLAIMED_ELSEWHERE
+
+    started = time.perf_counter()
+    try:
+        count = sync_day(api_client, unit.date.isoformat(), unit.spot_id, id_indexes)
+        _record_checkpoint(
+            unit, BackfillCheckpoint.STATUS_DONE, transactions=count,
+            duration=time.perf_counter() - started,
+        )
+        return None
+    except LeaseHeld as e:
+        logger.info(f"[run_unit] {unit.date} spot {unit.spot_id} skipped: {e}")
+        return CLAIMED_ELSEWHERE
+    except Exception as e:
+        logger.error(f"[run_unit] {unit.date} spot {unit.spot_id} failed: {e}", exc_info=True)
+        _record_checkpoint(
+            unit, BackfillCheckpoint.STATUS_FAILED,
+            duration=time.perf_counter() - started, error=str(e),
+        )
+        return str(e)
+
+
+def _run_unit_in_thread(api_client, unit, id_indexes, force):
+    try:
+        return run_unit(api_client, unit, id_indexes, force)
+    finally:
+        # Django opens one connection per thread; don't leak them from pool threads.
+        connections.close_all()
+
+
+def _run_units(units: List[BackfillUnit], workers: int, id_indexes: Optional[BackfillIdIndexes],
+               on_unit: Optional[Callable[[BackfillUnit, Optional[str]], None]] = None,
+               force: bool = False) -> BackfillReport:
+    api_client = make_api_client(max(workers, 1))
+    report = BackfillReport()
+
+    def collect(unit, error):
+        if error is None:
+            report.done.append(unit)
+        elif error == CLAIMED_ELSEWHERE:
+            report.claimed.append(unit)
+        else:
+            report.failed.append((unit, error))
+        if on_unit:
+            on_unit(unit, error)
+
+    if workers <= 1:
+        for unit in units:
+            collect(unit, run_unit(api_client, unit, id_indexes, force))
+        return report
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill') as pool:
+        futures = {pool.submit(_run_unit_in_thread, api_client, unit, id_indexes, force): unit for unit in units}
+        for future in as_completed(futures):
+            collect(futures[future], future.result())
+    return report
+
+
+def _run_shard(units: List[BackfillUnit], workers: int, use_id_index: bool, force: bool) -> BackfillReport:
+    id_indexes = BackfillIdIndexes.seed() if use_id_index else None
+    try:
+        return _run_units(units, workers, id_indexes, force=force)
+    finally:
+        connections.close_all()
+
+
+def run_backfill(start: date, end: date, spot_ids: Iterable[int], workers: int = 4, processes: int = 1,
+                 force: bool = False, skip_static: bool = False, use_id_index: bool = False,
+                 on_unit: Optional[Callable[[BackfillUnit, Optional[str]], None]] = None) -> BackfillReport:
+    """
+    Backfills every (day, spot) unit between `start` and `end`.
+
+    Static data is synced once up front. The units then run on `workers`
+    threads sharing one HTTP connection pool; with `processes` > 1 the units
+    are sharded across forked processes, each with its own thread pool.
+    Every unit records a checkpoint, and units already done are skipped
+    unless `force` is set. Units are leased while they run, so backfills on
+    several machines can cover the same range and split it between them.
+
+    Args:
+        start: First day (inclusive).
+        end: Last day (inclusive).
+        spot_ids: Spots to backfill.
+        workers: Threads per process; 1 runs the units inline.
+        processes: Number of processes to shard the units across.
+        force: Re-run units that already have a 'done' checkpoint.
+        skip_static: Don't sync workshops, payments, products and categories.
+        use_id_index: Seed transaction ID indexes (once per process).
+        on_unit: Called with (unit, error or None) after each unit; only in
+            single-process runs.
+
+    Returns:
+        BackfillReport: The planned, done, failed and claimed units.
+    """
+    units, skipped = plan_units(start, end, spot_ids, force)
+    report = BackfillReport(planned=units, skipped=skipped)
+    logger.info(
+        f"[run_backfill] {len(units)} units planned ({skipped} already done), "
+        f"{workers} workers x {processes} processes."
+    )
+    if not units:
+        return report
+
+    if not skip_static:
+        sync_static_data(PosterAPIClient())
+
+    processes = min(processes, len(units))
+    if processes <= 1:
+        id_indexes = BackfillIdIndexes.seed() if use_id_index else None
+        report.merge(_run_units(units, workers, id_indexes, on_unit, force))
+        return report
+
+    # Forked children must not share the parent's database socket.
+    connections.close_all()
+    shards = [units[i::processes] for i in range(processes)]
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+        for shard_report in pool.map(
+            _run_shard, shards, [workers] * processes, [use_id_index] * processes, [force] * processes
+        ):
+            report.merge(shard_report)
+    return report
@@ -0,0 +1,93 @@
+import logging
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Iterable, Set, Tuple
+
+from ..models import Transactions, TransactionsProducts
+
+logger = logging.getLogger(__name__)
+
+SEED_CHUNK_SIZE = 50_000
+
+
+class IdIndex:
+    """
+    Compact, read-mostly set of integer IDs for existence pre-checks.
+
+    The seeded IDs live in one sorted `array` (4 bytes per ID when they fit,
+    8 otherwise) and are probed with binary search; IDs added during the run
+    go to a small side set. A hit only means "was present when seeded or added
+    by this run", so callers confirm hits against the database and skip the
+    query entirely for misses.
+
+    Args:
+        ids: Initial IDs.
+        presorted: The IDs are already ascending and unique, so they are
+            streamed straight into the array without an intermediate set.
+    """
+
+    def __init__(self, ids: Iterable[int] = (), presorted: bool = False):
+        values = array('q', ids if presorted else sorted(set(ids)))
+        if values and values[0] >= 0 and values[-1] < 2 ** 32:
+            values = array('I', values)
+        self._sorted = values
+        self._added: Set[int] = set()
+
+    @classmethod
+    def from_queryset(cls, queryset, field: str, chunk_size: int = SEED_CHUNK_SIZE) -> 'IdIndex':
+        """Seeds the index by streaming one integer column with a server-side cursor."""
+        ids = (
+            queryset.exclude(**{f"{field}__isnull": True})
+            .values_list(field, flat=True)
+            .distinct()
+            .order_by(field)
+            .iterator(chunk_size=chunk_size)
+        )
+        index = cls(ids, presorted=True)
+        logger.info(f"[IdIndex] Seeded {len(index)} ids for {queryset.model.__name__}.{field}.")
+        return index
+
+    def __contains__(self, value) -> bool:
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return False
+        if value in self._added:
+            return True
+        i = bisect_left(self._sorted, value)
+        return i < len(self._sorted) and self._sorted[i] == value
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._added)
+
+    def add(self, values: Iterable[int]):
+        """Records IDs written during the run."""
+        self._added.update(int(v) for v in values if v is not None and v not in self)
+
+    def split(self, values: Iterable[int]) -> Tuple[Set[int], Set[int]]:
+        """
+        Splits IDs into `(maybe_existing, new)`.
+
+        Only `maybe_existing` needs an exact database check.
+        """
+        maybe_existing, new = set(), set()
+        for value in values:
+            (maybe_existing if value in self else new).add(value)
+        return maybe_existing, new
+
+
+@dataclass
+class BackfillIdIndexes:
+    """The per-run indexes consulted by the transaction savers."""
+    transactions: IdIndex
+    transactions_with_products: IdIndex
+
+    @classmethod
+    def seed(cls, chunk_size: int = SEED_CHUNK_SIZE) -> 'BackfillIdIndexes':
+        return cls(
+            transactions=IdIndex.from_queryset(Transactions.objects.all(), 'transaction_id', chunk_size),
+            transactions_with_products=IdIndex.from_queryset(
+                TransactionsProducts.objects.all(), 'transaction__transaction_id', chunk_size
+            ),
+        )
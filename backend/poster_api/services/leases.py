@@ -0,0 +1,141 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Iterable, Iterator, List, Tuple
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import SyncLease
+
+logger = logging.getLogger(__name__)
+
+# How long a lease stays valid without renewal; holders renew it every third of this.
+LEASE_TTL = timedelta(minutes=15)
+
+LeaseKey = Tuple[int, date, str]
+
+
+class LeaseHeld(Exception):
+    """Another live worker holds a lease the caller needs."""
+
+    def __init__(self, keys: List[LeaseKey], holders: List[str]):
+        super().__init__(f"Leased by {', '.join(sorted(set(holders))) or 'another worker'}")
+        self.keys = keys
+        self.holders = holders
+
+
+def lease_keys(spot_id: int, days: Iterable[date], datasets: Iterable[str]) -> List[LeaseKey]:
+    """The (spot, day, dataset) keys of a unit of sync work."""
+    return [(spot_id, day, dataset) for day in days for dataset in datasets]
+
+
+def new_owner() -> str:
+    """A unique owner name for one holder; host and pid show where it runs."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _acquire_one(key: LeaseKey, owner: str, now, expires_at) -> bool:
+    spot_id, day, dataset = key
+    # Taking over an expired lease is a conditional update, so only one worker wins it.
+    taken = SyncLease.objects.filter(spot_id=spot_id, day=day, dataset=dataset).filter(
+        Q(expires_at__lte=now) | Q(owner=owner)
+    ).update(owner=owner, acquired_at=now, expires_at=expires_at)
+    if taken:
+        return True
+    try:
+        with transaction.atomic():
+            SyncLease.objects.create(
+                spot_id=spot_id, day=day, dataset=dataset, owner=owner, acquired_at=now, expires_at=expires_at,
+            )
+        return True
+    except IntegrityError:
+        return False
+
+
+def _filter_keys(keys: List[LeaseKey]) -> Q:
+    condition = Q(pk__in=[])
+    for spot_id, day, dataset in keys:
+        condition |= Q(spot_id=spot_id, day=day, dataset=dataset)
+    return condition
+
+
+def acquire_leases(keys: List[LeaseKey], owner: str, ttl: timedelta = LEASE_TTL) -> bool:
+    """
+    Takes all `keys` for `owner`, or none of them.
+
+    Keys whose lease expired are taken over. Keys are acquired in sorted
+    order, so two workers asking for overlapping units can't deadlock.
+
+    Returns:
+        bool: Whether every lease was acquired.
+    """
+    now = timezone.now()
+    acquired = []
+    for key in sorted(set(keys)):
+        if not _acquire_one(key, owner, now, now + ttl):
+            release_leases(acquired, owner)
+            return False
+        acquired.append(key)
+    return True
+
+
+def renew_leases(keys: List[LeaseKey], owner: str, ttl: timedelta = LEASE_TTL) -> int:
+    """Extends the leases `owner` still holds; returns how many it still holds."""
+    return SyncLease.objects.filter(_filter_keys(keys), owner=owner).update(expires_at=timezone.now() + ttl)
+
+
+def release_leases(keys: List[LeaseKey], owner: str):
+    """Gives up the leases `owner` holds; leases taken over by others are left alone."""
+    if keys:
+        SyncLease.objects.filter(_filter_keys(keys), owner=owner).delete()
+
+
+def _keep_renewed(keys: List[LeaseKey], owner: str, ttl: timedelta, stop: threading.Event):
+    try:
+        while not stop.wait(ttl.total_seconds() / 3):
+            if renew_leases(keys, owner, ttl) < len(set(keys)):
+                logger.warning(f"[hold_leases] {owner} lost some of its leases.")
+    except Exception as e:
+        logger.error(f"[hold_leases] Renewing leases of {owner} failed: {e}", exc_info=True)
+    finally:
+        connections.close_all()
+
+
+@contextmanager
+def hold_leases(keys: List[LeaseKey], ttl: timedelta = LEASE_TTL) -> Iterator[str]:
+    """
+    Holds the leases of a unit of work for the duration of the block.
+
+    A background thread renews them while the block runs, so they only
+    expire if the process dies; another worker can then take them over.
+
+    Yields:
+        str: The owner name the leases are held under.
+
+    Raises:
+        LeaseHeld: If another live worker holds any of the leases.
+    """
+    owner = new_owner()
+    if not acquire_leases(keys, owner, ttl):
+        holders = list(
+            SyncLease.objects.filter(_filter_keys(keys)).exclude(owner=owner).values_list('owner', flat=True)
+        )
+        raise LeaseHeld(keys, holders)
+
+    stop = threading.Event()
+    renewer = threading.Thread(
+        target=_keep_renewed, args=(keys, owner, ttl, stop), name="lease-renewer", daemon=True
+    )
+    renewer.start()
+    try:
+        yield owner
+    finally:
+        stop.set()
+        renewer.join()
+        release_leases(keys, owner)
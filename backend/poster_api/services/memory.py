@@ -0,0 +1,14 @@
+import resource
+import sys
+
+
+def peak_rss_mb() -> float:
+    """
+    The peak resident set size of this process so far, in MB.
+
+    It only ever grows, so logging it after each unit of work shows whether
+    memory stays flat or keeps climbing with the amount of data processed.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
@@ -0,0 +1,356 @@
+import logging
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import TransactionHistory, Transactions, TransactionsProducts
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEY = 'date_close'
+DEFAULT_PARTITION_SUFFIX = '_default'
+
+# Parent first: conversion and pre-creation go top-down, detaching goes bottom-up
+# so the line-item/history months leave before the transactions they reference.
+PARTITIONED_MODELS = (Transactions, TransactionsProducts, TransactionHistory)
+
+_PARTITION_RE = re.compile(r'^(?P<table>.+)_p(?P<year>\d{4})(?P<month>\d{2})$')
+
+# Plain table claiming each stored transaction_id once partitioned (see transaction_id_guard_sql).
+TRANSACTION_IDS_TABLE = f"{Transactions._meta.db_table}_ids"
+
+
+def month_start(day: date) -> date:
+    """Returns the first day of the month containing `day`."""
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    """Shifts a month start by `months` (may be negative)."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first: date, last: date) -> List[date]:
+    """Returns every month start from `first` to `last`, both inclusive."""
+    months = []
+    current = month_start(first)
+    last = month_start(last)
+    while current <= last:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def partition_name(table: str, month: date) -> str:
+    """Name of the monthly partition, e.g. `poster_api_transactions_p202501`."""
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(table: str, name: str) -> Optional[date]:
+    """Parses the month back out of a partition name; None for the default partition."""
+    match = _PARTITION_RE.match(name)
+    if not match or match.group('table') != table:
+        return None
+    return date(int(match.group('year')), int(match.group('month')), 1)
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    """`CREATE TABLE ... PARTITION OF` for one month, bounded in UTC."""
+    qn = connection.ops.quote_name
+    return (
+        f"CREATE TABLE IF NOT EXISTS {qn(partition_name(table, month))} PARTITION OF {qn(table)} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+        f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+    )
+
+
+def create_default_partition_sql(table: str) -> str:
+    """Catch-all partition for NULL keys and months that were not pre-created."""
+    qn = connection.ops.quote_name
+    return f"CREATE TABLE IF NOT EXISTS {qn(table + DEFAULT_PARTITION_SUFFIX)} PARTITION OF {qn(table)} DEFAULT"
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = %s",
+        [table],
+    )
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor, table: str) -> List[str]:
+    """Names of the partitions currently attached to `table`."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s ORDER BY c.relname",
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _table_indexes(cursor, table: str) -> List[Tuple[str, str, bool, bool, List[str]]]:
+    cursor.execute(
+        "SELECT i.relname, pg_get_indexdef(ix.indexrelid), ix.indisunique, ix.indisprimary, "
+        "ARRAY(SELECT a.attname FROM unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord) "
+        "      JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum "
+        "      ORDER BY k.ord) "
+        "FROM pg_index ix "
+        "JOIN pg_class i ON i.oid = ix.indexrelid "
+        "JOIN pg_class t ON t.oid = ix.indrelid "
+        "WHERE t.relname = %s ORDER BY i.relname",
+        [table],
+    )
+    return [(name, definition, unique, primary, list(columns))
+            for name, definition, unique, primary, columns in cursor.fetchall()]
+
+
+def _table_foreign_keys(cursor, table: str) -> List[Tuple[str, str, str]]:
+    cursor.execute(
+        "SELECT c.conname, pg_get_constraintdef(c.oid), r.relname "
+        "FROM pg_constraint c "
+        "JOIN pg_class t ON t.oid = c.conrelid "
+        "JOIN pg_class r ON r.oid = c.confrelid "
+        "WHERE c.contype = 'f' AND t.relname = %s ORDER BY c.conname",
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def conversion_sql(cursor, months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+    """
+    Builds the statements that turn the three transaction tables into
+    `PARTITION BY RANGE (date_close)` tables with monthly partitions.
+
+    Each table is renamed aside, recreated with `LIKE`, filled back and
+    dropped. Unique keys get the partition key appended (PostgreSQL requires
+    it), so `transaction_id` is kept unique by `transaction_id_guard_sql`
+    instead. The children's `date_close` is filled from their parent and made
+    NOT NULL, so they keep a primary key, and they reference `Transactions`
+    through a composite `(transaction_id, date_close)` foreign key, which is
+    therefore always checked and guarantees the tracked `date_close` matches
+    the parent's.
+
+    Args:
+        cursor: A cursor on the PostgreSQL database, used to read the catalog.
+        months_ahead: How many months after the current one to pre-create.
+        today: Overrides the current date (for tests).
+
+    Returns:
+        list: SQL statements, meant to run inside one transaction.
+    """
+    qn = connection.ops.quote_name
+    today = today or timezone.now().date()
+    parent_table = Transactions._meta.db_table
+    tables = [model._meta.db_table for model in PARTITIONED_MODELS]
+
+    cursor.execute(f"SELECT MIN({qn(PARTITION_KEY)}) FROM {qn(parent_table)}")
+    oldest = cursor.fetchone()[0]
+    first_month = month_start(oldest.date() if oldest else today)
+    months = month_range(first_month, add_months(month_start(today), months_ahead))
+
+    catalog = {
+        table: (_table_indexes(cursor, table), _table_foreign_keys(cursor, table))
+        for table in tables
+    }
+
+    # Deferred FK checks queued earlier in the transaction would block the DROPs below.
+    statements = ["SET CONSTRAINTS ALL IMMEDIATE"]
+    for model in PARTITIONED_MODELS[1:]:
+        table = model._meta.db_table
+        column = _parent_column(model)
+        statements.append(
+            f"UPDATE {qn(table)} c SET {qn(PARTITION_KEY)} = t.{qn(PARTITION_KEY)} FROM {qn(parent_table)} t "
+            f"WHERE t.{qn(Transactions._meta.pk.column)} = c.{qn(column)} AND c.{qn(PARTITION_KEY)} IS NULL"
+        )
+    for table in tables:
+        statements.append(f"ALTER TABLE {qn(table)} RENAME TO {qn(table + '_legacy')}")
+
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        pk = qn(model._meta.pk.column)
+        statements.append(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(table + '_legacy')} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY INCLUDING STORAGE) "
+            f"PARTITION BY RANGE ({qn(PARTITION_KEY)})"
+        )
+        statements.append(f"ALTER TABLE {qn(table)} ALTER COLUMN {qn(PARTITION_KEY)} SET NOT NULL")
+        statements.extend(create_partition_sql(table, month) for month in months)
+        statements.append(create_default_partition_sql(table))
+        statements.append(f"INSERT INTO {qn(table)} SELECT * FROM {qn(table + '_legacy')}")
+        statements.append(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{model._meta.pk.column}'), "
+            f"COALESCE(MAX({pk}), 0) + 1, false) FROM {qn(table)}"
+        )
+
+    for table in reversed(tables):
+        statements.append(f"DROP TABLE {qn(table + '_legacy')} CASCADE")
+
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        indexes, foreign_keys = catalog[table]
+        for name, definition, unique, primary, columns in indexes:
+            keyed = columns if PARTITION_KEY in columns else columns + [PARTITION_KEY]
+            column_sql = ', '.join(qn(c) for c in keyed)
+            if primary:
+                statements.append(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} PRIMARY KEY ({column_sql})")
+            elif unique:
+                statements.append(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} UNIQUE ({column_sql})")
+            else:
+                statements.append(definition)
+
+        for name, definition, referenced in foreign_keys:
+            if referenced == parent_table:
+                definition = (
+                    f"FOREIGN KEY ({qn(_parent_column(model))}, {qn(PARTITION_KEY)}) "
+                    f"REFERENCES {qn(parent_table)} ({qn(Transactions._meta.pk.column)}, {qn(PARTITION_KEY)}) "
+                    f"DEFERRABLE INITIALLY DEFERRED"
+                )
+            statements.append(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+
+    statements += transaction_id_guard_sql()
+    return statements
+
+
+def _parent_column(model) -> str:
+    """The column of a child table referencing `Transactions`."""
+    return next(
+        f.column for f in model._meta.concrete_fields
+        if f.is_relation and f.related_model is Transactions
+    )
+
+
+def transaction_id_guard_sql() -> List[str]:
+    """
+    Statements keeping `Transactions.transaction_id` unique across partitions.
+
+    Every stored `transaction_id` is claimed in `TRANSACTION_IDS_TABLE`, whose
+    primary key the database enforces for every process, by triggers on the
+    partitioned table: an INSERT whose ID is already claimed is skipped, as
+    `ignore_conflicts` did against the old unique key; changing an ID
+    re-claims it or fails with a unique violation; a DELETE releases it.
+    Changing a transaction's `date_close` is refused, since its line items
+    and history are keyed by it too.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Transactions._meta.db_table)
+    ids = qn(TRANSACTION_IDS_TABLE)
+    claim = qn(f"{TRANSACTION_IDS_TABLE}_claim")
+    release = qn(f"{TRANSACTION_IDS_TABLE}_release")
+    return [
+        f"CREATE TABLE {ids} (transaction_id integer PRIMARY KEY)",
+        f"INSERT INTO {ids} SELECT transaction_id FROM {table} WHERE transaction_id IS NOT NULL",
+        f"""CREATE FUNCTION {claim}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.date_close IS DISTINCT FROM OLD.date_close THEN
+            RAISE EXCEPTION 'date_close of transaction % cannot change once partitioned', OLD.transaction_id;
+        END IF;
+        IF NEW.transaction_id IS NOT DISTINCT FROM OLD.transaction_id THEN
+            RETURN NEW;
+        END IF;
+        DELETE FROM {ids} WHERE transaction_id = OLD.transaction_id;
+    END IF;
+    IF NEW.transaction_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+    INSERT INTO {ids} VALUES (NEW.transaction_id) ON CONFLICT DO NOTHING;
+    IF FOUND THEN
+        RETURN NEW;
+    ELSIF TG_OP = 'UPDATE' THEN
+        RAISE unique_violation USING MESSAGE = 'transaction_id ' || NEW.transaction_id || ' already exists';
+    END IF;
+    RETURN NULL;
+END
+$$""",
+        f"""CREATE FUNCTION {release}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM {ids} WHERE transaction_id = OLD.transaction_id;
+    RETURN OLD;
+END
+$$""",
+        f"CREATE TRIGGER {claim} BEFORE INSERT OR UPDATE ON {table} FOR EACH ROW EXECUTE FUNCTION {claim}()",
+        f"CREATE TRIGGER {release} AFTER DELETE ON {table} FOR EACH ROW EXECUTE FUNCTION {release}()",
+    ]
+
+
+def ensure_partitions_sql(cursor, months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+    """
+    Statements creating any missing partition from the current month up to
+    `months_ahead` months later, for every partitioned table.
+    """
+    today = today or timezone.now().date()
+    months = month_range(today, add_months(month_start(today), months_ahead))
+    statements = []
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        existing = set(list_partitions(cursor, table))
+        statements.extend(
+            create_partition_sql(table, month) for month in months
+            if partition_name(table, month) not in existing
+        )
+    return statements
+
+
+def detach_sql(cursor, before: date, drop: bool = False, archive_schema: str = 'archive') -> List[str]:
+    """
+    Statements detaching every monthly partition older than `before`.
+
+    Children are detached ahead of the parent month they reference. A detached
+    partition loses its foreign keys and is then either dropped or moved to
+    `archive_schema` as a plain table.
+
+    Args:
+        cursor: A cursor on the PostgreSQL database.
+        before: Partitions for months strictly before this month are detached.
+        drop: Drop the detached tables instead of archiving them.
+        archive_schema: Schema that receives archived partitions.
+    """
+    qn = connection.ops.quote_name
+    cutoff = month_start(before)
+    statements = []
+    if not drop:
+        statements.append(f"CREATE SCHEMA IF NOT EXISTS {qn(archive_schema)}")
+
+    for model in reversed(PARTITIONED_MODELS):
+        table = model._meta.db_table
+        for name in list_partitions(cursor, table):
+            month = partition_month(table, name)
+            if month is None or month >= cutoff:
+                continue
+            if model is Transactions:
+                statements.append(
+                    f"DELETE FROM {qn(TRANSACTION_IDS_TABLE)} "
+                    f"WHERE transaction_id IN (SELECT transaction_id FROM {qn(name)})"
+                )
+            statements.append(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+            for fk_name, _, _ in _table_foreign_keys(cursor, name):
+                statements.append(f"ALTER TABLE {qn(name)} DROP CONSTRAINT IF EXISTS {qn(fk_name)}")
+            if drop:
+                statements.append(f"DROP TABLE {qn(name)}")
+            else:
+                statements.append(f"ALTER TABLE {qn(name)} SET SCHEMA {qn(archive_schema)}")
+    return statements
+
+
+def partition_status(cursor) -> Dict[str, List[str]]:
+    """Maps every managed table to its attached partitions (empty if not partitioned)."""
+    status = {}
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        status[table] = list_partitions(cursor, table) if is_partitioned(cursor, table) else []
+    return status
+
+
+def run_statements(statements: List[str]):
+    """Executes the statements in a single transaction."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in statements:
+            logger.info(f"[partitioning] {sql}")
+            cursor.execute(sql)
@@ -0,0 +1,85 @@
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Sum
+
+from ..models import CategoriesSales, ProductSales
+
+
+# Output key -> ORM lookup, per group_by value.
+PRODUCT_GROUPINGS = {
+    'product': {
+        'product_id': 'product__product_id',
+        'product_name': 'product__product_name',
+    },
+    'category': {
+        'category_id': 'product__category__category_id',
+        'category_name': 'product__category__category_name',
+    },
+    'day': {'day': 'date'},
+    'spot': {'spot_id': 'spot_id'},
+}
+
+CATEGORY_GROUPINGS = {
+    'category': {
+        'category_id': 'category__category_id',
+        'category_name': 'category__category_name',
+    },
+    'day': {'day': 'date'},
+    'spot': {'spot_id': 'spot_id'},
+}
+
+
+def _rollup(queryset, groupings: Dict[str, Dict[str, str]], group_by: str, profit_field: str,
+            date_from: date, date_to: date, spot_ids: Optional[Iterable[int]]) -> List[dict]:
+    if group_by not in groupings:
+        raise ValueError(f"group_by must be one of: {', '.join(groupings)}")
+
+    queryset = queryset.filter(date__range=(date_from, date_to))
+    if spot_ids:
+        queryset = queryset.filter(spot_id__in=list(spot_ids))
+
+    keys = groupings[group_by]
+    ordering = ['date'] if group_by == 'day' else ['-total_profit']
+    rows = (
+        queryset.values(*keys.values())
+        .annotate(total_count=Sum('count'), total_profit=Sum(profit_field))
+        .order_by(*ordering)
+    )
+    return [
+        {**{key: row[lookup] for key, lookup in keys.items()}, 'count': row['total_count'], 'profit': row['total_profit']}
+        for row in rows
+    ]
+
+
+def product_sales_rollup(date_from: date, date_to: date, spot_ids: Optional[Iterable[int]] = None,
+                         group_by: str = 'product') -> List[dict]:
+    """
+    Sums the daily product sales facts over a date range.
+
+    Args:
+        date_from: First day of the range (inclusive).
+        date_to: Last day of the range (inclusive).
+        spot_ids: Restricts the rollup to these spots; all spots if empty.
+        group_by: One of 'product', 'category', 'day' or 'spot'.
+
+    Returns:
+        list[dict]: One row per group with the group keys, 'count' and 'profit'.
+
+    Raises:
+        ValueError: If `group_by` is not supported.
+    """
+    return _rollup(ProductSales.objects.all(), PRODUCT_GROUPINGS, group_by, 'product_profit',
+                   date_from, date_to, spot_ids)
+
+
+def category_sales_rollup(date_from: date, date_to: date, spot_ids: Optional[Iterable[int]] = None,
+                          group_by: str = 'category') -> List[dict]:
+    """
+    Sums the daily category sales facts over a date range.
+
+    Same arguments as `product_sales_rollup`; `group_by` is one of
+    'category', 'day' or 'spot'.
+    """
+    return _rollup(CategoriesSales.objects.all(), CATEGORY_GROUPINGS, group_by, 'profit',
+                   date_from, date_to, spot_ids)
@@ -1,16 +1,28 @@
 from decimal import Decimal, InvalidOperation
 from datetime import date, datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional, Set
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 # from django.utils import timezone
 from django.db import transaction
+from django.db.models import Q
 
 
 import json
 import logging
 
-from poster_api.client import PosterAPIClient
+from poster_api.client import (
+    HISTORY_BATCH_SIZE, HISTORY_BUFFER_SIZE, HISTORY_FETCH_WORKERS, HistoryFetchContext, HistoryFetchFailed,
+    PosterAPIClient,
+)
+from salary.dirty import mark_poster_shifts_dirty
 from users.models import Role
 from ..decorators import timing_decorator
+from .id_index import BackfillIdIndexes, IdIndex
+from .leases import LeaseHeld, hold_leases, lease_keys
+from .memory import peak_rss_mb
+from .stages import WRITE, Stage, StageError, run_stages
+from .sync_state import DAILY_DATASETS, WATERMARK_OVERLAP, SyncRecorder, day_window, range_window
+from .validation import compile_schema
 
 
 from ..serializers import (
@@ -28,6 +40,8 @@ from ..models import (
     ProductSales, 
     ShiftSale, 
     ShiftSaleItem, 
+    Spot,
+    SyncState,
     Category,
     Product, 
     Clients,
@@ -41,40 +55,67 @@ from ..models import (
 
 api_client = PosterAPIClient()
 
+PRODUCT_SCHEMA = compile_schema(ProductAPISerializer)
+PRODUCT_SALES_SCHEMA = compile_schema(ProductSalesAPISerializer)
+CATEGORY_SCHEMA = compile_schema(CategoryAPISerializer)
+CATEGORY_SALES_SCHEMA = compile_schema(CategoriesSalesAPISerializer)
+WORKSHOP_SCHEMA = compile_schema(WorkshopSerializer)
+PAYMENT_METHOD_SCHEMA = compile_schema(PaymentMethodSerializer)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 
-@timing_decorator
-def save_shift_sales_to_db(api_client, date_str: str, spot_id: int = None):
+def save_shift_sales_to_db(api_client, date_str: str, spot_id: int = None,
+                           histories: Optional[HistoryFetchContext] = None) -> int:
     """
-    Saves sales by shift in bulk.
-
-    This function fetches sales data, then processes it in memory to prepare
-    all parent (ShiftSale) and child (ShiftSaleItem) records.
+    Fetches sales by shift for a day and saves them (see `save_shift_sales`).
 
     Args:
         api_client: An instance of the API client.
         date_str: The date for which to save sales ("YYYY-MM-DD").
         spot_id: The optional ID of the establishment.
+        histories: The run's shared transaction history context.
+
+    Returns:
+        int: The number of shifts saved.
     """
     try:
-        sales_by_shift = api_client.get_sales_by_shift_with_delivery(date_str, spot_id)
+        sales_by_shift = api_client.get_sales_by_shift_with_delivery(date_str, spot_id, histories=histories)
     except Exception as e:
         logger.error(f"Failed to fetch sales data from API for date {date_str}: {e}")
-        return
+        return 0
+
+    return save_shift_sales(sales_by_shift, date_str)
+
+
+@timing_decorator
+def save_shift_sales(sales_by_shift: dict, date_str: str) -> int:
+    """
+    Saves sales by shift in bulk.
 
+    This function processes the fetched sales data in memory to prepare
+    all parent (ShiftSale) and child (ShiftSaleItem) records. Shifts whose
+    regular sales changed are marked for salary recalculation.
+
+    Args:
+        sales_by_shift: Output of `get_sales_by_shift_with_delivery`.
+        date_str: The date of the sales ("YYYY-MM-DD").
+
+    Returns:
+        int: The number of shifts saved.
+    """
     if not sales_by_shift:
         logger.info(f"No sales data found for date {date_str}.")
-        return
+        return 0
 
     try:
         api_shift_id_strs = list(sales_by_shift.keys())
         api_shift_ids = [int(sid) for sid in api_shift_id_strs]
     except (ValueError, TypeError) as e:
         logger.error(f"Invalid shift_id key from API. Not all keys are integers: {e}. Keys: {sales_by_shift.keys()}")
-        return
+        return 0
 
     shifts_data_prepared = {}
     for shift_id_str in api_shift_id_strs:
@@ -172,6 +213,8 @@ def save_shift_sales_to_db(api_client, date_str: str, spot_id: int = None):
                             'payed_sum': Decimal(product.get('payed_sum', '0.0')),
                             'profit': Decimal(product.get('profit', '0.0')),
                             'workshop': product.get('workshop'),
+                            'workshop_id': _int_or_none(product.get('workshop')),
+                            'product_id': _int_or_none(product.get('product_id')),
                             'delivery_service': product.get('delivery_service') if category == 'delivery' else None,
                             'tips': Decimal(product.get('tips', '0.0')),
                         }
@@ -205,10 +248,27 @@ def save_shift_sales_to_db(api_client, date_str: str, spot_id: int = None):
         if items_to_create:
             ShiftSaleItem.objects.bulk_create(items_to_create)
         if items_to_update:
-            item_update_fields = ['count', 'product_sum', 'payed_sum', 'profit', 'workshop', 'delivery_service', 'tips']
+            item_update_fields = [
+                'count', 'product_sum', 'payed_sum', 'profit', 'workshop', 'workshop_id', 'product_id',
+                'delivery_service', 'tips',
+            ]
             ShiftSaleItem.objects.bulk_update(items_to_update, item_update_fields)
+
+        # Salaries are calculated from regular sales; their shifts need recalculating.
+        mark_poster_shifts_dirty(
+            item.shift_sale.shift_id for item in items_to_create + items_to_update if item.category_name == 'regular'
+        )
             
     logger.info(f"Processed sales for {date_str}. Shifts: {len(shifts_to_create)} created, {len(shifts_to_update)} updated. Items: {len(items_to_create)} created, {len(items_to_update)} updated.")
+    return len(shifts_to_create) + len(shifts_to_update)
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    """Poster IDs arrive as ints or numeric strings; anything else is stored as NULL."""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
 
 
 def _parse_and_make_aware(date_str: Optional[str]) -> Optional[datetime]:
@@ -223,20 +283,21 @@ def _parse_and_make_aware(date_str: Optional[str]) -> Optional[datetime]:
         return None
 
 
-@timing_decorator
-def save_cash_shifts_range(api_client, start_date: str, spot_id: int = None, end_date: str = None):
+def save_cash_shifts_range(api_client, start_date: str, spot_id: int = None, end_date: str = None) -> int:
     """
     Saves cash shifts from an API in bulk for a given date range.
 
     This function fetches all cash shifts for the entire specified date range
-    in a single API call and then uses bulk database operations to create or
-    update the records.
+    in a single API call and saves them with `save_cash_shifts`.
 
     Args:
         api_client: An instance of the Poster API client.
         start_date: The start date of the range (e.g., "2025-10-13").
         end_date: The optional end date. Defaults to start_date.
         spot_id: The optional ID of the establishment.
+
+    Returns:
+        int: The number of shifts saved.
     """
     end_date = end_date or start_date
 
@@ -246,11 +307,25 @@ def save_cash_shifts_range(api_client, start_date: str, spot_id: int = None, end
         )
     except Exception as e:
         logger.error(f"Failed to fetch cash shifts from API: {e}")
-        return
+        return 0
+
+    return save_cash_shifts(all_shifts)
+
+
+@timing_decorator
+def save_cash_shifts(all_shifts: List[Dict]) -> int:
+    """
+    Creates or updates cash shifts in bulk.
+
+    Args:
+        all_shifts: Cash shifts as returned by `get_cash_shifts`.
 
+    Returns:
+        int: The number of shifts saved.
+    """
     if not all_shifts:
         logger.info("No cash shifts found for the specified period.")
-        return
+        return 0
 
     shift_ids = {shift['poster_shift_id'] for shift in all_shifts}
 
@@ -308,6 +383,7 @@ def save_cash_shifts_range(api_client, start_date: str, spot_id: int = None, end
             CashShiftReport.objects.bulk_update(shifts_to_update, fields_for_update)
             
         logger.info(f"Cash shifts saved. Created: {len(shifts_to_create)}, Updated: {len(shifts_to_update)}.")
+        return len(shifts_to_create) + len(shifts_to_update)
 
 
 @timing_decorator
@@ -327,9 +403,7 @@ def save_products(products_data: list[dict]):
         logger.info("[save_products] Received empty list of products. Nothing to do.")
         return
 
-    serializer = ProductAPISerializer(data=products_data, many=True)
-    serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
+    validated_data = PRODUCT_SCHEMA.validate_or_raise(products_data)
 
     with transaction.atomic():
         categories_to_process = {
@@ -393,23 +467,44 @@ def save_products(products_data: list[dict]):
 
 
 
+def _clear_sales_slice(model, date_str: str, spot_id: int):
+    """Deletes the (date, spot) slice of a daily sales fact table that has no valid rows left."""
+    deleted, _ = model.objects.filter(date=date_str, spot_id=spot_id).delete()
+    logger.info(f"[{model.__name__}] No sales for {date_str} at spot {spot_id}; removed {deleted} stored records.")
+
+
 @timing_decorator
-def save_products_sales(products_data: list[dict]):
+def save_products_sales(products_data: list[dict], date_str: str, spot_id: int = 1):
     """
-    Bulk creates or updates product sales records from a list of data.
+    Upserts the daily product sales facts of one spot.
+
+    The rows are the (date, spot) slice: existing facts are updated in place,
+    new ones are created and products that are no longer reported for that
+    day are removed, so re-syncing a day is idempotent. No valid rows clear
+    the slice.
 
     Args:
-        products_data (list[dict]): A list of dictionaries, where each dictionary
-            represents a product sale. Expected keys include 'product_id', 'name',
-            'category_id', 'category_name', 'price', 'count', and 'product_profit'.
+        products_data (list[dict]): Rows from `PosterAPIClient.get_products_sales`
+            for a single day. Expected keys include 'product_id', 'name' (or
+            'product_name'), 'category_id', 'category_name', 'count' and 'product_profit'.
+        date_str (str): The day the rows belong to, 'YYYY-MM-DD'.
+        spot_id (int): The spot the rows belong to.
 
     Raises:
         rest_framework.exceptions.ValidationError: If the input data fails validation.
     """
     if not products_data:
-        logger.info("[save_products_sales] Received empty list. Nothing to process.")
+        _clear_sales_slice(ProductSales, date_str, spot_id)
         return
-    
+
+    products_data = [
+        {
+            **item,
+            "product_name": item.get("product_name") or item.get("name"),
+            "product_price": item.get("product_price", item.get("price", 0)),
+        }
+        for item in products_data
+    ]
     valid_data = [
         item for item in products_data 
         if item.get('product_name') and item.get('category_name')
@@ -419,55 +514,40 @@ def save_products_sales(products_data: list[dict]):
         logger.warning(f"[save_products_sales] Filtered out {len(products_data) - len(valid_data)} items with missing name or category.")
 
     if not valid_data:
-        logger.info("[save_products_sales] No valid data left after filtering.")
+        _clear_sales_slice(ProductSales, date_str, spot_id)
         return
 
-    serializer = ProductSalesAPISerializer(data=valid_data, many=True)
-    serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
+    validated_data = PRODUCT_SALES_SCHEMA.validate_or_raise(valid_data)
+
+    totals: Dict[int, Dict[str, Decimal]] = {}
+    for item in validated_data:
+        bucket = totals.setdefault(item['product_id'], {"count": Decimal(0), "product_profit": Decimal(0)})
+        bucket["count"] += item["count"]
+        bucket["product_profit"] += item["product_profit"]
 
     with transaction.atomic():
         categories_to_process = {
             item['category_id']: {'name': item['category_name']}
-            for item in validated_data if 'category_id' in item and 'category_name' in item
+            for item in validated_data
         }
-        
-        if categories_to_process:
-            category_instances = [
-                Category(category_id=cat_id, category_name=data['name'])
-                for cat_id, data in categories_to_process.items()
-            ]
-            Category.objects.bulk_create(category_instances, ignore_conflicts=True)
-        
+        Category.objects.bulk_create(
+            [Category(category_id=cat_id, category_name=data['name']) for cat_id, data in categories_to_process.items()],
+            ignore_conflicts=True,
+        )
         category_map = {c.category_id: c for c in Category.objects.filter(category_id__in=categories_to_process.keys())}
 
-        all_product_ids = set()
-        for item in validated_data:
-            try:
-                all_product_ids.add(int(item['product_id']))
-            except (ValueError, TypeError):
-                continue
-
-        existing_products_qs = Product.objects.filter(product_id__in=list(all_product_ids))
-        existing_products_map = {int(p.product_id): p for p in existing_products_qs}
-        
+        existing_products_map = {p.product_id: p for p in Product.objects.filter(product_id__in=totals.keys())}
         products_to_create = []
         seen_ids_in_batch = set()
-
         for item in validated_data:
-            try:
-                p_id = int(item['product_id'])
-            except (ValueError, TypeError):
-                continue
-
+            p_id = item['product_id']
             if p_id not in existing_products_map and p_id not in seen_ids_in_batch:
-                category_obj = category_map.get(item.get('category_id'))
                 products_to_create.append(
                     Product(
                         product_id=p_id, 
-                        product_name=item.get("name"),
-                        category=category_obj,
-                        cost=item.get("price", 0),
+                        product_name=item["product_name"],
+                        category=category_map.get(item['category_id']),
+                        cost=item.get("product_price", 0),
                         fiscal=True,
                         workshop=0
                     )
@@ -477,41 +557,30 @@ def save_products_sales(products_data: list[dict]):
         if products_to_create:
             Product.objects.bulk_create(products_to_create, ignore_conflicts=True)
             logger.info(f"[save_products_sales] Created {len(products_to_create)} new products.")
+            existing_products_map = {p.product_id: p for p in Product.objects.filter(product_id__in=totals.keys())}
 
-        final_products_qs = Product.objects.filter(product_id__in=list(all_product_ids))
-        product_map = {int(p.product_id): p for p in final_products_qs}
-        
-        existing_sales_qs = ProductSales.objects.filter(product__product_id__in=list(all_product_ids))
-        existing_sales = {int(s.product.product_id): s for s in existing_sales_qs}
+        existing_sales = {
+            s.product_id: s for s in ProductSales.objects.filter(date=date_str, spot_id=spot_id)
+        }
         
         sales_to_create = []
         sales_to_update = []
         
-        for item in validated_data:
-            try:
-                p_id = int(item['product_id'])
-            except (ValueError, TypeError):
-                continue
-            
-            product_obj = product_map.get(p_id)
-            
+        for p_id, values in totals.items():
+            product_obj = existing_products_map.get(p_id)
             if not product_obj:
-                logger.warning(f"[save_products_sales] Could not find or create product with id {item['product_id']}. Skipping sale.")
+                logger.warning(f"[save_products_sales] Could not find or create product with id {p_id}. Skipping sale.")
                 continue
             
-            if p_id in existing_sales:
-                sale_obj = existing_sales[p_id]
-                sale_obj.product_profit = item.get("product_profit", 0)
-                sale_obj.count = int(item.get("count", 0))
-                sales_to_update.append(sale_obj)
-            else:
+            sale_obj = existing_sales.pop(product_obj.pk, None)
+            if sale_obj is None:
                 sales_to_create.append(
-                    ProductSales(
-                        product=product_obj,
-                        product_profit=item.get("product_profit", 0),
-                        count=int(item.get("count", 0))
-                    )
+                    ProductSales(date=date_str, spot_id=spot_id, product=product_obj, **values)
                 )
+            elif sale_obj.count != values["count"] or sale_obj.product_profit != values["product_profit"]:
+                sale_obj.count = values["count"]
+                sale_obj.product_profit = values["product_profit"]
+                sales_to_update.append(sale_obj)
 
         if sales_to_create:
             ProductSales.objects.bulk_create(sales_to_create)
@@ -520,6 +589,10 @@ def save_products_sales(products_data: list[dict]):
         if sales_to_update:
             ProductSales.objects.bulk_update(sales_to_update, ["product_profit", "count"])
             logger.info(f"[save_products_sales] Updated {len(sales_to_update)} existing sales records.")
+
+        if existing_sales:
+            ProductSales.objects.filter(pk__in=[s.pk for s in existing_sales.values()]).delete()
+            logger.info(f"[save_products_sales] Removed {len(existing_sales)} stale sales records for {date_str}.")
             
 
 @timing_decorator
@@ -550,9 +623,7 @@ def save_categories(categories_data: list[dict]):
         logger.info("[save_categories_sales] No valid data left after filtering.")
         return
 
-    serializer = CategoryAPISerializer(data=valid_data, many=True)
-    serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
+    validated_data = CATEGORY_SCHEMA.validate_or_raise(valid_data)
 
     with transaction.atomic():
         category_ids = {item['category_id'] for item in validated_data}
@@ -588,23 +659,30 @@ def save_categories(categories_data: list[dict]):
 
 
 @timing_decorator
-def save_categories_sales(categories_data: list[dict]):
+def save_categories_sales(categories_data: list[dict], date_str: str, spot_id: int = 1):
     """
-    Bulk creates or updates category sales records from a list of data.
+    Upserts the daily category sales facts of one spot.
+
+    Works like `save_products_sales`: the rows replace the (date, spot) slice.
 
     Args:
-        categories_data (list[dict]): A list of dictionaries, where each
-            represents a category sale. Expected keys include 'category_id',
-            'category_name', 'profit', and 'count'.
+        categories_data (list[dict]): Rows from `PosterAPIClient.get_categories_sales`
+            for a single day. Expected keys include 'category_id', 'name' (or
+            'category_name'), 'profit' and 'count'.
+        date_str (str): The day the rows belong to, 'YYYY-MM-DD'.
+        spot_id (int): The spot the rows belong to.
 
     Raises:
         rest_framework.exceptions.ValidationError: If the input data fails validation.
     """
     if not categories_data:
-        logger.info("[save_categories_sales] Received empty list. Nothing to process.")
+        _clear_sales_slice(CategoriesSales, date_str, spot_id)
         return
 
-    
+    categories_data = [
+        {**item, "category_name": item.get("category_name") or item.get("name")}
+        for item in categories_data
+    ]
     valid_data = [
         item for item in categories_data
         if item.get('category_name') 
@@ -614,13 +692,16 @@ def save_categories_sales(categories_data: list[dict]):
         logger.warning(f"[save_categories_sales] Filtered out {len(categories_data) - len(valid_data)} items with missing category name.")
 
     if not valid_data:
-        logger.info("[save_categories_sales] No valid data left after filtering.")
+        _clear_sales_slice(CategoriesSales, date_str, spot_id)
         return
     
-    
-    serializer = CategoriesSalesAPISerializer(data=valid_data, many=True)
-    serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
+    validated_data = CATEGORY_SALES_SCHEMA.validate_or_raise(valid_data)
+
+    totals: Dict[int, Dict[str, Decimal]] = {}
+    for item in validated_data:
+        bucket = totals.setdefault(item['category_id'], {"count": Decimal(0), "profit": Decimal(0)})
+        bucket["count"] += item["count"]
+        bucket["profit"] += item["profit"]
 
     with transaction.atomic():
         categories_to_ensure = {
@@ -637,33 +718,28 @@ def save_categories_sales(categories_data: list[dict]):
             c.category_id: c for c in Category.objects.filter(category_id__in=categories_to_ensure.keys())
         }
 
-        existing_sales_map = {
-            s.category_id: s for s in CategoriesSales.objects.filter(category_id__in=category_map.keys())
+        existing_sales = {
+            s.category_id: s for s in CategoriesSales.objects.filter(date=date_str, spot_id=spot_id)
         }
 
         sales_to_create = []
         sales_to_update = []
 
-        for item in validated_data:
-            category_id = item['category_id']
+        for category_id, values in totals.items():
             category_obj = category_map.get(category_id)
             if not category_obj:
                 logger.warning(f"[save_categories_sales] Category object for id {category_id} not found. Skipping.")
                 continue
 
-            if category_id in existing_sales_map:
-                sale_obj = existing_sales_map[category_id]
-                sale_obj.profit = item.get("profit", 0)
-                sale_obj.count = int(item.get("count", 0))
-                sales_to_update.append(sale_obj)
-            else:
+            sale_obj = existing_sales.pop(category_obj.pk, None)
+            if sale_obj is None:
                 sales_to_create.append(
-                    CategoriesSales(
-                        category=category_obj,
-                        profit=item.get("profit", 0),
-                        count=int(item.get("count", 0))
-                    )
+                    CategoriesSales(date=date_str, spot_id=spot_id, category=category_obj, **values)
                 )
+            elif sale_obj.count != values["count"] or sale_obj.profit != values["profit"]:
+                sale_obj.count = values["count"]
+                sale_obj.profit = values["profit"]
+                sales_to_update.append(sale_obj)
 
         if sales_to_create:
             CategoriesSales.objects.bulk_create(sales_to_create)
@@ -673,6 +749,10 @@ def save_categories_sales(categories_data: list[dict]):
             CategoriesSales.objects.bulk_update(sales_to_update, ["profit", "count"])
             logger.info(f"[save_categories_sales] Updated {len(sales_to_update)} existing sales records.")
 
+        if existing_sales:
+            CategoriesSales.objects.filter(pk__in=[s.pk for s in existing_sales.values()]).delete()
+            logger.info(f"[save_categories_sales] Removed {len(existing_sales)} stale sales records for {date_str}.")
+
 def parse_poster_datetime(value: Any) -> Optional[datetime]:
     """
     Parses a datetime from various Poster API formats into a timezone-aware datetime object.
@@ -724,12 +804,15 @@ def parse_poster_datetime(value: Any) -> Optional[datetime]:
 
 
 @timing_decorator
-def save_transactions(data: List[Dict]) -> int:
+def save_transactions(data: List[Dict], known_ids: Optional[IdIndex] = None) -> int:
     """
     Bulk saves new transaction records from a list of data.
 
     Args:
         data: A list of dictionaries, where each dictionary represents a transaction.
+        known_ids: Optional per-run index of stored `transaction_id`s. Only its
+            hits are confirmed against the database; it is updated with the
+            newly saved IDs.
 
     Returns:
         The number of newly saved transaction records.
@@ -740,10 +823,13 @@ def save_transactions(data: List[Dict]) -> int:
     incoming_ids = {item.get("transaction_id") or item.get("id") for item in data}
     incoming_ids.discard(None)
 
+    if known_ids is not None:
+        incoming_ids, _ = known_ids.split(incoming_ids)
+
     existing_ids = set(
         Transactions.objects.filter(transaction_id__in=incoming_ids)
         .values_list('transaction_id', flat=True)
-    )
+    ) if incoming_ids else set()
 
     transactions_to_create = []
     for item in data:
@@ -783,11 +869,35 @@ def save_transactions(data: List[Dict]) -> int:
     if transactions_to_create:
         with transaction.atomic():
             Transactions.objects.bulk_create(transactions_to_create, ignore_conflicts=True)
+        if known_ids is not None:
+            known_ids.add(tx.transaction_id for tx in transactions_to_create)
 
     return len(transactions_to_create)
 
 
 
+def _close_date_filter(close_dates: Iterable[Optional[datetime]], exact: bool = False) -> Q:
+    """
+    Limits a line item or history query to its parents' `date_close`, the partition key.
+
+    Rows whose own `date_close` is NULL are always kept, since no date range
+    matches them and leaving them out would store them again. A parent
+    without a `date_close` drops the filter altogether.
+
+    Args:
+        close_dates: The parents' `date_close` values.
+        exact: Match the dates themselves instead of the range they span.
+    """
+    close_dates = set(close_dates)
+    if not close_dates or None in close_dates:
+        return Q()
+    if exact:
+        dated = Q(date_close__in=close_dates)
+    else:
+        dated = Q(date_close__range=(min(close_dates), max(close_dates)))
+    return dated | Q(date_close__isnull=True)
+
+
 @timing_decorator
 def save_transaction_history(transaction_id: int, history_data: List[Dict]) -> int:
     """
@@ -800,47 +910,76 @@ def save_transaction_history(transaction_id: int, history_data: List[Dict]) -> i
     Returns:
         The number of newly saved history records.
     """
-    if not history_data:
+    return save_transaction_histories({transaction_id: history_data})
+
+
+def save_transaction_histories(histories: Dict[int, List[Dict]]) -> int:
+    """
+    Bulk saves new history records for many transactions at once.
+
+    Events already stored for a transaction (same type and time) are
+    skipped, so a batch can be saved again safely.
+
+    Args:
+        histories: History events keyed by transaction ID.
+
+    Returns:
+        The number of newly saved history records.
+    """
+    histories = {int(tx_id): data for tx_id, data in histories.items() if data}
+    if not histories:
         return 0
 
-    try:
-        tx_obj = Transactions.objects.get(transaction_id=transaction_id)
-    except Transactions.DoesNotExist:
+    transactions_map = {tx.transaction_id: tx for tx in Transactions.objects.filter(transaction_id__in=histories)}
+    for transaction_id in histories.keys() - transactions_map.keys():
         logger.warning(f"Transaction {transaction_id} not found for history save")
+    if not transactions_map:
         return 0
 
-    existing_history = TransactionHistory.objects.filter(transaction=tx_obj)
-    
-    existing_keys = {(h.type_history, h.time) for h in existing_history}
+    # date_close is the partition key of TransactionHistory, so filter on it too.
+    date_close_by_pk = {tx.pk: tx.date_close for tx in transactions_map.values()}
+    existing_keys = {
+        (transaction_pk, type_history, time)
+        for transaction_pk, type_history, time, date_close in TransactionHistory.objects.filter(
+            _close_date_filter(date_close_by_pk.values(), exact=True),
+            transaction__in=transactions_map.values(),
+        ).values_list('transaction_id', 'type_history', 'time', 'date_close')
+        if date_close is None or date_close == date_close_by_pk[transaction_pk]
+    }
 
     history_to_create = []
-    for h in history_data:
-        history_time = parse_poster_datetime(h.get("time"))
-        if not history_time:
-            continue  
-
-        current_key = (h.get("type_history"), history_time)
-        if current_key in existing_keys:
+    for transaction_id, history_data in histories.items():
+        tx_obj = transactions_map.get(transaction_id)
+        if tx_obj is None:
             continue
+        for h in history_data:
+            history_time = parse_poster_datetime(h.get("time"))
+            if not history_time:
+                continue
 
-        try:
-            value_text = json.loads(h.get("value_text") or "{}")
-        except (json.JSONDecodeError, TypeError):
-            value_text = {}
-
-        history_to_create.append(
-            TransactionHistory(
-                transaction=tx_obj,
-                type_history=h.get("type_history"),
-                time=history_time,
-                value=float(h.get("value", 0)),
-                value2=float(h.get("value2") or 0),
-                value3=float(h.get("value3") or 0),
-                value_text=value_text,
-                spot_tablet_id=h.get("spot_tablet_id"),
+            current_key = (tx_obj.pk, h.get("type_history"), history_time)
+            if current_key in existing_keys:
+                continue
+
+            try:
+                value_text = json.loads(h.get("value_text") or "{}")
+            except (json.JSONDecodeError, TypeError):
+                value_text = {}
+
+            history_to_create.append(
+                TransactionHistory(
+                    transaction=tx_obj,
+                    type_history=h.get("type_history"),
+                    time=history_time,
+                    value=float(h.get("value", 0)),
+                    value2=float(h.get("value2") or 0),
+                    value3=float(h.get("value3") or 0),
+                    value_text=value_text,
+                    spot_tablet_id=h.get("spot_tablet_id"),
+                    date_close=tx_obj.date_close,
+                )
             )
-        )
-        existing_keys.add(current_key)
+            existing_keys.add(current_key)
 
     if history_to_create:
         with transaction.atomic():
@@ -849,8 +988,57 @@ def save_transaction_history(transaction_id: int, history_data: List[Dict]) -> i
     return len(history_to_create)
 
 
+def stream_transaction_histories(api_client, transaction_ids, batch_size: int = HISTORY_BATCH_SIZE,
+                                 workers: int = HISTORY_FETCH_WORKERS, buffer_size: int = HISTORY_BUFFER_SIZE,
+                                 histories: Optional[HistoryFetchContext] = None) -> int:
+    """
+    Fetches and saves transaction histories as a bounded pipeline.
+
+    Histories are streamed by `histories` (see `HistoryFetchContext.stream`)
+    and written to `TransactionHistory` every `batch_size` transactions,
+    each batch in its own transaction. Memory stays bounded by the buffer
+    and one batch, and a run that dies part way keeps every batch flushed
+    before. When the writes are slower than the API, the fetch workers wait
+    for the writer.
+
+    Histories that can't be fetched are skipped and reported once the rest
+    is saved, so the sync stage fails and its watermark stays before them.
+
+    Args:
+        api_client: The Poster API client.
+        transaction_ids: The transactions whose history to sync.
+        batch_size: Transactions per write batch.
+        workers: Concurrent history requests.
+        buffer_size: Fetched histories that may wait for the writer.
+        histories: The run's shared history context, which keeps each
+            history's payment method and tips for the shift sales report.
+
+    Returns:
+        int: The number of newly saved history records.
+
+    Raises:
+        HistoryFetchFailed: If any of the histories couldn't be fetched.
+    """
+    if histories is None:
+        histories = HistoryFetchContext(api_client)
+    transaction_ids = list(transaction_ids)
+    saved = 0
+
+    def write(batch):
+        nonlocal saved
+        saved += save_transaction_histories(batch)
+
+    histories.stream(transaction_ids, on_batch=write, batch_size=batch_size, workers=workers, buffer_size=buffer_size)
+    logger.info(f"[stream_transaction_histories] Saved {saved} history records.")
+    failed = histories.failed_among(transaction_ids)
+    if failed:
+        raise HistoryFetchFailed(failed)
+    return saved
+
+
+
 @timing_decorator
-def save_transactions_products(products_data: List[Dict]):
+def save_transactions_products(products_data: List[Dict], known_tx_ids: Optional[IdIndex] = None):
     """
     Bulk saves or updates product-transaction link records from a list of data.
 
@@ -860,6 +1048,8 @@ def save_transactions_products(products_data: List[Dict]):
 
     Args:
         products_data: A list of dictionaries, where each represents a product within a transaction.
+        known_tx_ids: Optional per-run index of `transaction_id`s that already
+            have line items. Existing links are only looked up for its hits.
     """
     if not products_data:
         logger.info("[save_transactions_products] Received empty list.")
@@ -901,19 +1091,26 @@ def save_transactions_products(products_data: List[Dict]):
             ) for cid in new_client_ids
         ]
         if new_clients:
-            created_clients = Clients.objects.bulk_create(new_clients)
-            for client in created_clients:
-                client_map[client.client_id] = client 
-
-        existing_links = TransactionsProducts.objects.filter(
-            transaction__transaction_id__in=tx_ids,
-            product__product_id__in=product_ids
-        ).select_related('transaction', 'product', 'client')
-
-        existing_links_map = {
-            (link.transaction.transaction_id, link.product.product_id): link
-            for link in existing_links
-        }
+            # Another sync unit may create the same client concurrently.
+            Clients.objects.bulk_create(new_clients, ignore_conflicts=True)
+            client_map.update(
+                (c.client_id, c) for c in Clients.objects.filter(client_id__in=new_client_ids)
+            )
+
+        linked_tx_ids = known_tx_ids.split(tx_ids)[0] if known_tx_ids is not None else tx_ids
+        existing_links_map = {}
+        if linked_tx_ids:
+            existing_links = TransactionsProducts.objects.filter(
+                transaction__transaction_id__in=linked_tx_ids,
+                product__product_id__in=product_ids
+            ).select_related('transaction', 'product', 'client')
+            if tx_map:
+                existing_links = existing_links.filter(_close_date_filter(tx.date_close for tx in tx_map.values()))
+
+            existing_links_map = {
+                (link.transaction.transaction_id, link.product.product_id): link
+                for link in existing_links
+            }
 
         to_create = []
         to_update = []
@@ -950,12 +1147,15 @@ def save_transactions_products(products_data: List[Dict]):
                     TransactionsProducts(
                         transaction=tx_obj,
                         product=product_obj,
+                        date_close=tx_obj.date_close,
                         **defaults
                     )
                 )
 
         if to_create:
             TransactionsProducts.objects.bulk_create(to_create)
+            if known_tx_ids is not None:
+                known_tx_ids.add(link.transaction.transaction_id for link in to_create)
         if to_update:
             fields_to_update = ["client", "num", "workshop", "payed_sum", "product_cost", "product_profit"]
             TransactionsProducts.objects.bulk_update(to_update, fields_to_update)
@@ -977,9 +1177,7 @@ def save_workshop(workshops_data: List[Dict]):
         logger.info("[save_workshop] Received empty list. Nothing to process.")
         return
 
-    serializer = WorkshopSerializer(data=workshops_data, many=True)
-    serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
+    validated_data = WORKSHOP_SCHEMA.validate_or_raise(workshops_data)
 
     workshop_ids = {item['workshop_id'] for item in validated_data}
     
@@ -1035,9 +1233,7 @@ def save_payments_id(payments_data: List[Dict]):
         logger.info("[save_payments_id] Received empty list. Nothing to process.")
         return
 
-    serializer = PaymentMethodSerializer(data=payments_data, many=True)
-    serializer.is_valid(raise_exception=True)
-    validated_data = serializer.validated_data
+    validated_data = PAYMENT_METHOD_SCHEMA.validate_or_raise(payments_data)
 
     payment_ids = {item['payment_method_id'] for item in validated_data}
 
@@ -1131,7 +1327,7 @@ def save_clients(clients_data: List[Dict]) -> int:
                 clients_to_create.append(Clients(client_id=client_id, **defaults))
 
         if clients_to_create:
-            Clients.objects.bulk_create(clients_to_create)
+            Clients.objects.bulk_create(clients_to_create, ignore_conflicts=True)
             logger.info(f"[save_clients] Created {len(clients_to_create)} new clients.")
 
         if clients_to_update:
@@ -1142,82 +1338,296 @@ def save_clients(clients_data: List[Dict]) -> int:
 
 
 @timing_decorator
-def sync_all_from_date(api_client, start_date: str, spot_id: int = None):
+def save_spots(spots_data: List[Dict]) -> int:
     """
-    Syncs all data from the Poster API for a given date range.
+    Creates or updates spot records, so `--spots all` sees every venue.
+
+    Args:
+        spots_data: Output of `get_spots`: dictionaries with 'spot_id',
+                    'spot_name' and 'spot_address'.
+
+    Returns:
+        int: The number of spots received.
     """
-    end_date = date.today().strftime("%Y-%m-%d")
-    logger.info(f"Starting full data sync from {start_date} to {end_date}.")
+    spots = {}
+    for item in spots_data or []:
+        try:
+            spots[int(item["spot_id"])] = item
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"[save_spots] Skipping spot without a valid spot_id: {item}")
+    if not spots:
+        logger.info("[save_spots] Received empty list. Nothing to process.")
+        return 0
 
-    logger.info("--- Phase 1: Syncing static data ---")
-    try:
-        save_workshop(api_client.get_workshop())
-        save_payments_id(api_client.get_payments_id())
-        save_products(api_client.get_products())
-        save_categories(api_client.get_category())
-    except Exception as e:
-        logger.error(f"FATAL: Could not sync static data. Aborting. Error: {e}", exc_info=True)
-        return
+    existing = {spot.spot_id: spot for spot in Spot.objects.filter(spot_id__in=spots)}
+    to_create, to_update = [], []
+    for spot_id, item in spots.items():
+        name, address = item.get("spot_name") or "", item.get("spot_address") or ""
+        spot = existing.get(spot_id)
+        if spot is None:
+            to_create.append(Spot(spot_id=spot_id, spot_name=name, spot_address=address))
+        elif (spot.spot_name, spot.spot_address) != (name, address):
+            spot.spot_name, spot.spot_address = name, address
+            to_update.append(spot)
+
+    if to_create:
+        Spot.objects.bulk_create(to_create)
+        logger.info(f"[save_spots] Created {len(to_create)} new spots.")
+    if to_update:
+        Spot.objects.bulk_update(to_update, ["spot_name", "spot_address"])
+        logger.info(f"[save_spots] Updated {len(to_update)} existing spots.")
+    return len(spots)
+
+
+def static_stages(api_client) -> List[Stage]:
+    """Stage graph for the catalog shared by every spot: spots, workshops, payment methods, products, categories."""
+    return [
+        Stage("fetch_spots", lambda: api_client.get_spots()),
+        Stage("fetch_workshops", lambda: api_client.get_workshop()),
+        Stage("fetch_payments", lambda: api_client.get_payments_id()),
+        Stage("fetch_products", lambda: api_client.get_products()),
+        Stage("fetch_categories", lambda: api_client.get_category()),
+        Stage("write_spots", lambda fetch_spots: save_spots(fetch_spots), deps=("fetch_spots",), kind=WRITE),
+        Stage("write_workshops", lambda fetch_workshops: save_workshop(fetch_workshops),
+              deps=("fetch_workshops",), kind=WRITE),
+        Stage("write_payments", lambda fetch_payments: save_payments_id(fetch_payments),
+              deps=("fetch_payments",), kind=WRITE),
+        Stage("write_products", lambda fetch_products: save_products(fetch_products),
+              deps=("fetch_products",), kind=WRITE),
+        # Products create missing categories; the category sync then fills in the details.
+        Stage("write_categories", lambda fetch_categories, write_products: save_categories(fetch_categories),
+              deps=("fetch_categories", "write_products"), kind=WRITE),
+    ]
 
-    logger.info(f"--- Phase 2: Fetching range data from {start_date} to {end_date} ---")
-    try:
-        save_cash_shifts_range(api_client, start_date, spot_id, end_date)
-        
-        products_sales = api_client.get_products_sales(date_from=start_date, date_to=end_date, spot_id=spot_id)
-        save_products_sales(products_sales)
 
-        categories_sales = api_client.get_categories_sales(date_from=start_date, date_to=end_date, spot_id=spot_id)
-        save_categories_sales(categories_sales)
-        
-        clients_sales = api_client.get_clients_sales(date_from=start_date, date_to=end_date, spot_id=spot_id)
-        save_clients(clients_sales)
-        
-        all_transactions = api_client.get_transactions(date_from=start_date, date_to=end_date, spot_id=spot_id)
-        save_transactions(all_transactions)
+def closed_since(transactions: List[Dict], since: Optional[datetime]) -> List[Dict]:
+    """Keeps the transactions closed after `since` (minus the overlap) and those without a parsable close time."""
+    if since is None:
+        return transactions
+    threshold = since - WATERMARK_OVERLAP
+    kept = []
+    for tx in transactions:
+        closed = parse_poster_datetime(tx.get("date_close"))
+        if closed is None or closed >= threshold:
+            kept.append(tx)
+    return kept
+
+
+# The SyncState dataset of each stage in `range_stages`.
+RANGE_STAGE_DATASETS = {
+    "fetch_cash_shifts": SyncState.CASH_SHIFTS,
+    "write_cash_shifts": SyncState.CASH_SHIFTS,
+    "fetch_clients": SyncState.CLIENTS,
+    "write_clients": SyncState.CLIENTS,
+    "fetch_transactions": SyncState.TRANSACTIONS,
+    "fetch_transactions_products": SyncState.TRANSACTIONS,
+    "write_transactions": SyncState.TRANSACTIONS,
+    "write_transactions_products": SyncState.TRANSACTIONS,
+    "write_history": SyncState.TRANSACTIONS,
+}
+
+# The write stage that finishes each dataset; its result is the row count.
+RANGE_DATASET_ROWS = {
+    SyncState.CASH_SHIFTS: "write_cash_shifts",
+    SyncState.CLIENTS: "write_clients",
+    SyncState.TRANSACTIONS: "write_history",
+}
+
+
+def range_stages(api_client, date_from: str, date_to: str, spot_id: int = None,
+                 id_indexes: Optional[BackfillIdIndexes] = None, since: Optional[datetime] = None,
+                 histories: Optional[HistoryFetchContext] = None) -> List[Stage]:
+    """
+    Stage graph for the data Poster serves for a date range: cash shifts, clients and transactions.
 
-    except Exception as e:
-        logger.error(f"ERROR: Failed during bulk data fetch for range {start_date}-{end_date}. Error: {e}", exc_info=True)
-    
-    logger.info("--- Phase 3: Handling nested dependencies ---")
-    if all_transactions:
-        transaction_ids = [tx.get("transaction_id") for tx in all_transactions if tx.get("transaction_id")]
-        
+    Line items only wait for the transaction list, and each write waits
+    only for its own fetches and the rows it references. The history is
+    streamed once the transactions are written, and saved batch by batch
+    as it arrives (see `stream_transaction_histories`).
+
+    Args:
+        api_client: The Poster API client.
+        date_from: First day, 'YYYY-MM-DD'.
+        date_to: Last day, 'YYYY-MM-DD'.
+        spot_id: The optional ID of the establishment.
+        id_indexes: Optional existence indexes for the transaction savers.
+        since: Only fetch line items and history of transactions closed after this.
+        histories: The run's shared history context, so other consumers of
+            the same run reuse the payment methods and tips streamed here.
+    """
+    if histories is None:
+        histories = HistoryFetchContext(api_client)
+
+    def selected_ids(transactions):
+        return [tx.get("transaction_id") for tx in closed_since(transactions, since) if tx.get("transaction_id")]
+
+    def fetch_transactions_products(fetch_transactions):
+        tx_ids = selected_ids(fetch_transactions)
+        return api_client.get_transactions_products(tx_ids) if tx_ids else []
+
+    def write_clients(fetch_clients):
+        save_clients(fetch_clients)
+        return len(fetch_clients or [])
+
+    def write_transactions(fetch_transactions):
+        save_transactions(fetch_transactions, known_ids=id_indexes and id_indexes.transactions)
+
+    def write_transactions_products(fetch_transactions_products, write_transactions, write_clients):
+        if fetch_transactions_products:
+            save_transactions_products(
+                fetch_transactions_products, known_tx_ids=id_indexes and id_indexes.transactions_with_products
+            )
+
+    def write_history(fetch_transactions, write_transactions):
+        tx_ids = selected_ids(fetch_transactions)
+        logger.info(f"[range_stages] Streaming history for {len(tx_ids)} transactions ({date_from} - {date_to}).")
+        stream_transaction_histories(api_client, tx_ids, batch_size=HISTORY_BATCH_SIZE, histories=histories)
+        return len(fetch_transactions)
+
+    return [
+        Stage("fetch_cash_shifts", lambda: api_client.get_cash_shifts(date_from, date_to, spot_id)),
+        Stage("fetch_clients", lambda: api_client.get_clients_sales(date_from, date_to, spot_id)),
+        Stage("fetch_transactions", lambda: api_client.get_transactions(date_from, date_to, spot_id) or []),
+        Stage("fetch_transactions_products", fetch_transactions_products, deps=("fetch_transactions",)),
+        Stage("write_cash_shifts", lambda fetch_cash_shifts: save_cash_shifts(fetch_cash_shifts),
+              deps=("fetch_cash_shifts",), kind=WRITE),
+        Stage("write_clients", write_clients, deps=("fetch_clients",), kind=WRITE),
+        Stage("write_transactions", write_transactions, deps=("fetch_transactions",), kind=WRITE),
+        Stage("write_transactions_products", write_transactions_products,
+              deps=("fetch_transactions_products", "write_transactions", "write_clients"), kind=WRITE),
+        # Saves each batch as it arrives, so a run that dies part way keeps the batches before.
+        Stage("write_history", write_history, deps=("fetch_transactions", "write_transactions"), kind=WRITE,
+              atomic=False),
+    ]
+
+
+# Days fetched, written and released together by `sync_all_from_date`.
+SYNC_WINDOW_DAYS = 7
+
+
+def iter_windows(start: date, end: date, days: int = SYNC_WINDOW_DAYS) -> Iterator[Tuple[date, date]]:
+    """Yields consecutive (first day, last day) windows of at most `days` days covering `start`..`end`."""
+    if days < 1:
+        raise ValueError("A sync window must span at least one day.")
+    current = start
+    while current <= end:
+        last = min(current + timedelta(days=days - 1), end)
+        yield current, last
+        current = last + timedelta(days=1)
+
+
+def _sync_window(api_client, first: date, last: date, spot_id: Optional[int],
+                 id_indexes: Optional[BackfillIdIndexes], recorder: SyncRecorder,
+                 fact_recorders: Dict[int, SyncRecorder]):
+    date_from, date_to = first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+    window = range_window(first, last)
+    # Shared by the history and shift sales savers of this window only, so it is released with it.
+    histories = HistoryFetchContext(api_client)
+
+    logger.info(f"--- Phase 2: Syncing range data from {date_from} to {date_to} ---")
+    try:
+        run_stages(
+            recorder.tracked(
+                range_stages(api_client, date_from, date_to, spot_id, id_indexes, histories=histories),
+                window, RANGE_DATASET_ROWS,
+            ),
+            label="sync_all_from_date range",
+        )
+    except StageError as e:
+        logger.error(f"ERROR: Failed during range sync for {date_from}-{date_to}. Error: {e}", exc_info=True)
+        recorder.fail(RANGE_STAGE_DATASETS[e.stage], window, e.__cause__)
+
+    logger.info(f"--- Phase 3: Syncing single-day-only endpoints from {date_from} to {date_to} ---")
+    current_date = first
+    while current_date <= last:
+        date_str = current_date.strftime("%Y-%m-%d")
+        day = day_window(current_date)
+        logger.info(f"Syncing single-day data for {date_str}")
         try:
-            transactions_products = api_client.get_transactions_products(transaction_ids)
-            save_transactions_products(transactions_products)
+            recorder.record(SyncState.SHIFT_SALES, day, save_shift_sales_to_db(api_client, date_str, spot_id, histories))
         except Exception as e:
-            logger.error(f"ERROR: Failed to sync transaction products. Error: {e}", exc_info=True)
-            
-        
-        logger.info(f"Fetching history for {len(transaction_ids)} transactions...")
-        for i, tx_id in enumerate(transaction_ids):
+            logger.error(f"ERROR: Failed to sync shift sales for {date_str}. Error: {e}", exc_info=True)
+            recorder.fail(SyncState.SHIFT_SALES, day, e)
+
+        for fact_spot_id, fact_recorder in fact_recorders.items():
             try:
-                if (i + 1) % 100 == 0:
-                    logger.info(f"  ...fetched history for {i + 1}/{len(transaction_ids)} transactions.")
-                history = api_client.make_request(
-                    "GET", "dash.getTransactionHistory", params={"transaction_id": tx_id}
-                ).get("response", [])
-                save_transaction_history(tx_id, history)
+                products_sales = api_client.get_products_sales(date_str, date_str, fact_spot_id)
+                categories_sales = api_client.get_categories_sales(date_str, date_str, fact_spot_id)
+                save_products_sales(products_sales, date_str, fact_spot_id)
+                save_categories_sales(categories_sales, date_str, fact_spot_id)
+                fact_recorder.record(
+                    SyncState.SALES_FACTS, day, len(products_sales or []) + len(categories_sales or [])
+                )
             except Exception as e:
-                logger.error(f"ERROR: Failed to get history for transaction {tx_id}. Error: {e}")
-                continue 
+                logger.error(f"ERROR: Failed to sync sales facts for {date_str}, spot {fact_spot_id}. Error: {e}", exc_info=True)
+                fact_recorder.fail(SyncState.SALES_FACTS, day, e)
+
+        current_date += timedelta(days=1)
+
+
+@timing_decorator
+def sync_all_from_date(api_client, start_date: str, spot_id: int = None,
+                       id_indexes: Optional[BackfillIdIndexes] = None, sync_static: bool = True,
+                       window_days: int = SYNC_WINDOW_DAYS) -> Optional[float]:
+    """
+    Syncs all data from the Poster API for a given date range.
+
+    The range is processed in windows of `window_days` days: each window is
+    fetched, validated, written and released before the next one starts, so
+    memory depends on the window size and not on the length of the range.
+    Within a window the range data runs as a stage graph, so independent API
+    calls overlap and every write stage commits on its own; transaction
+    histories are streamed once, saved in batches, and their payment
+    methods and tips shared with the shift sales saver. With a `spot_id`, the outcome of every dataset is recorded in
+    `SyncState`, window by window, and each window is leased (see
+    `hold_leases`); a window leased by another worker is skipped.
 
-    logger.info("--- Phase 4: Syncing data from single-day-only endpoints ---")
+    Args:
+        api_client: The Poster API client.
+        start_date: First day to sync, 'YYYY-MM-DD'; the range ends today.
+        spot_id: Restricts the sync to one spot.
+        id_indexes: Optional pre-seeded existence indexes for the transaction savers.
+        sync_static: Set to False when the caller already synced the static
+            catalog, e.g. once for several spots.
+        window_days: Days per window.
+
+    Returns:
+        Optional[float]: The process's peak RSS in MB, or None if the static
+        sync failed and nothing else ran.
+    """
+    end_date = date.today().strftime("%Y-%m-%d")
+    logger.info(f"Starting full data sync from {start_date} to {end_date} in {window_days}-day windows.")
     start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
     end_dt = date.today()
-    current_date = start_dt
-    
-    while current_date <= end_dt:
-        date_str = current_date.strftime("%Y-%m-%d")
-        logger.info(f"Syncing single-day data for {date_str}")
+    recorder = SyncRecorder(spot_id)
+
+    if sync_static:
+        logger.info("--- Phase 1: Syncing static data ---")
         try:
-            save_shift_sales_to_db(api_client, date_str, spot_id)
+            run_stages(static_stages(api_client), label="sync_all_from_date static")
         except Exception as e:
-            logger.error(f"ERROR: Failed to sync shift sales for {date_str}. Error: {e}", exc_info=True)
-        
-        current_date += timedelta(days=1)
+            logger.error(f"FATAL: Could not sync static data. Aborting. Error: {e}", exc_info=True)
+            return None
+    else:
+        logger.info("--- Phase 1: Static data already synced, skipping ---")
+
+    # Sales facts are per spot, so a run without spot_id fetches each known spot separately.
+    fact_spot_ids = [spot_id] if spot_id else list(Spot.objects.values_list('spot_id', flat=True)) or [1]
+    fact_recorders = {fact_spot_id: SyncRecorder(fact_spot_id) for fact_spot_id in fact_spot_ids}
+
+    for first, last in iter_windows(start_dt, end_dt, window_days):
+        days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        try:
+            with hold_leases(lease_keys(spot_id, days, DAILY_DATASETS)) if spot_id else nullcontext():
+                _sync_window(api_client, first, last, spot_id, id_indexes, recorder, fact_recorders)
+        except LeaseHeld as e:
+            logger.warning(f"[sync_all_from_date] Skipping window {first} - {last} of spot {spot_id}: {e}")
+            continue
+        logger.info(f"[sync_all_from_date] Window {first} - {last} done, peak RSS {peak_rss_mb():.1f} MB.")
 
-    logger.info(f"--- Sync Complete: All Poster data synced from {start_date} to {end_date}. ---")
+    peak = peak_rss_mb()
+    logger.info(f"--- Sync Complete: All Poster data synced from {start_date} to {end_date}, peak RSS {peak:.1f} MB. ---")
+    return peak
 
 
 def create_role_lists(api_client):
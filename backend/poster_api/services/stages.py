@@ -0,0 +1,193 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+FETCH = "fetch"
+WRITE = "write"
+
+
+@dataclass
+class Stage:
+    """
+    One node of a sync graph.
+
+    `func` is called with the results of `deps` as keyword arguments, named
+    after the dependency stages. Fetch stages run on a thread pool; write
+    stages run on the calling thread, so they share its database connection
+    and transaction. A write stage that commits in batches itself, so a
+    failure keeps the batches before it, is not `atomic`.
+    """
+    name: str
+    func: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    kind: str = FETCH
+    atomic: bool = True
+
+
+@dataclass
+class StageTiming:
+    name: str
+    kind: str
+    started: float
+    finished: float
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+
+@dataclass
+class StageReport:
+    """Results and timings of a graph run; times are seconds since the run started."""
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, StageTiming] = field(default_factory=dict)
+    total: float = 0.0
+
+    def critical_path(self, stages: Sequence[Stage]) -> List[str]:
+        """
+        The chain of stages that determined the total run time.
+
+        Walks back from the stage that finished last, each time to the
+        dependency that finished last.
+        """
+        deps = {stage.name: stage.deps for stage in stages}
+        timed = list(self.timings.values())
+        if not timed:
+            return []
+        current = max(timed, key=lambda t: t.finished).name
+        path = [current]
+        while deps.get(current):
+            current = max(deps[current], key=lambda name: self.timings[name].finished)
+            path.append(current)
+        return path[::-1]
+
+    def log(self, label: str, stages: Sequence[Stage]):
+        for timing in sorted(self.timings.values(), key=lambda t: t.started):
+            logger.info(
+                f"[{label}] {timing.name:<24} {timing.kind:<5} "
+                f"{timing.started:7.3f}s -> {timing.finished:7.3f}s ({timing.duration:.3f}s)"
+            )
+        logger.info(f"[{label}] total {self.total:.3f}s, critical path: {' -> '.join(self.critical_path(stages))}")
+
+
+class StageError(Exception):
+    """
+    A stage raised; the original exception is chained as `__cause__`.
+
+    `report` holds the results of the stages that finished before the failure.
+    """
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.report: StageReport = StageReport()
+
+
+def _check_graph(stages: Sequence[Stage]) -> List[Stage]:
+    """Validates the graph and returns its stages in dependency order."""
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique.")
+    known = set(names)
+    for stage in stages:
+        missing = set(stage.deps) - known
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {', '.join(sorted(missing))}")
+        if stage.kind not in (FETCH, WRITE):
+            raise ValueError(f"Stage '{stage.name}' has unknown kind '{stage.kind}'.")
+
+    ordered, done, remaining = [], set(), list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if set(stage.deps) <= done]
+        if not ready:
+            raise ValueError(f"Stage graph has a cycle among: {', '.join(s.name for s in remaining)}")
+        ordered.extend(ready)
+        done.update(stage.name for stage in ready)
+        remaining = [stage for stage in remaining if stage.name not in done]
+    return ordered
+
+
+def _run_concurrently(run: Callable[[Stage], Any], pending: List[Stage], report: StageReport,
+                      max_workers: int, label: str):
+    def take_ready(kind: str) -> List[Stage]:
+        ready = [stage for stage in pending if stage.kind == kind and set(stage.deps) <= report.results.keys()]
+        for stage in ready:
+            pending.remove(stage)
+        return ready
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=label) as pool:
+        running = {}
+        try:
+            while pending or running:
+                for stage in take_ready(FETCH):
+                    running[pool.submit(run, stage)] = stage
+
+                writes = take_ready(WRITE)
+                if writes:
+                    # Put back all but the first, so finished fetches get submitted between writes.
+                    pending[:0] = writes[1:]
+                    report.results[writes[0].name] = run(writes[0])
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    report.results[stage.name] = future.result()
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+
+def run_stages(stages: Sequence[Stage], max_workers: int = 4, label: str = "stages") -> StageReport:
+    """
+    Runs a stage graph, each stage as soon as its dependencies are done.
+
+    Independent fetch stages run concurrently on up to `max_workers`
+    threads. Ready write stages run one at a time on the calling thread,
+    in declaration order, while the fetches keep going. With
+    `max_workers` <= 1 everything runs inline in dependency order.
+
+    Args:
+        stages: The graph; order only breaks ties between ready write stages.
+        max_workers: Fetch threads.
+        label: Prefix of the timing log lines.
+
+    Returns:
+        StageReport: Every stage's result and timing.
+
+    Raises:
+        ValueError: If the graph is malformed.
+        StageError: If a stage raised. Stages not yet started are skipped.
+    """
+    ordered = _check_graph(stages)
+    report = StageReport()
+    origin = time.perf_counter()
+
+    def run(stage: Stage):
+        started = time.perf_counter() - origin
+        try:
+            result = stage.func(**{dep: report.results[dep] for dep in stage.deps})
+        except Exception as e:
+            raise StageError(stage.name, e) from e
+        report.timings[stage.name] = StageTiming(stage.name, stage.kind, started, time.perf_counter() - origin)
+        return result
+
+    try:
+        if max_workers <= 1:
+            for stage in ordered:
+                report.results[stage.name] = run(stage)
+        else:
+            _run_concurrently(run, list(stages), report, max_workers, label)
+    except StageError as e:
+        report.total = time.perf_counter() - origin
+        e.report = report
+        raise
+
+    report.total = time.perf_counter() - origin
+    report.log(label, stages)
+    return report
@@ -0,0 +1,226 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Iterable, List, Optional
+
+from django.db import connections
+
+from ..client import HistoryFetchContext
+from ..models import Spot, SyncState
+from .id_index import BackfillIdIndexes
+from .leases import hold_leases, lease_keys
+from .saving import (
+    RANGE_DATASET_ROWS,
+    RANGE_STAGE_DATASETS,
+    range_stages,
+    save_categories_sales,
+    save_products_sales,
+    save_shift_sales,
+    save_spots,
+    static_stages,
+)
+from .stages import WRITE, Stage, StageError, StageReport, run_stages
+from .sync_state import DAILY_DATASETS, SyncRecorder, day_window
+
+logger = logging.getLogger(__name__)
+
+# Concurrent API fetches per sync graph.
+SYNC_FETCH_WORKERS = 4
+
+# Spots synced at the same time by a multi-spot run.
+SPOT_PARALLELISM = 2
+
+# `--spots` value selecting every spot in the Spot table.
+ALL_SPOTS = "all"
+
+# The SyncState dataset of each stage in `day_stages`.
+DAY_STAGE_DATASETS = {
+    **RANGE_STAGE_DATASETS,
+    "fetch_products_sales": SyncState.SALES_FACTS,
+    "fetch_categories_sales": SyncState.SALES_FACTS,
+    "write_sales_facts": SyncState.SALES_FACTS,
+    "fetch_shift_sales": SyncState.SHIFT_SALES,
+    "write_shift_sales": SyncState.SHIFT_SALES,
+}
+
+# The write stage that finishes each dataset; its result is the row count.
+DAY_DATASET_ROWS = {
+    **RANGE_DATASET_ROWS,
+    SyncState.SALES_FACTS: "write_sales_facts",
+    SyncState.SHIFT_SALES: "write_shift_sales",
+}
+
+
+def sync_static_data(api_client, max_workers: int = SYNC_FETCH_WORKERS) -> StageReport:
+    """Syncs the catalog shared by every spot and day: spots, workshops, payment methods, products, categories."""
+    return run_stages(static_stages(api_client), max_workers=max_workers, label="sync_static_data")
+
+
+def day_stages(api_client, date_str: str, spot_id: int, id_indexes: Optional[BackfillIdIndexes] = None,
+               since: Optional[datetime] = None, histories: Optional[HistoryFetchContext] = None) -> List[Stage]:
+    """
+    The stage graph of `sync_day`: `range_stages` for one day plus the single-day endpoints.
+
+    The shift sales fetch waits for the history to be streamed and saved,
+    and takes the payment methods and tips it needs from the shared
+    `histories` context, so each history is requested once.
+    """
+    if histories is None:
+        histories = HistoryFetchContext(api_client)
+
+    def write_sales_facts(fetch_products_sales, fetch_categories_sales):
+        save_products_sales(fetch_products_sales, date_str, spot_id)
+        save_categories_sales(fetch_categories_sales, date_str, spot_id)
+        return len(fetch_products_sales or []) + len(fetch_categories_sales or [])
+
+    def fetch_shift_sales(write_history):
+        return api_client.get_sales_by_shift_with_delivery(date_str, spot_id, histories=histories)
+
+    return range_stages(api_client, date_str, date_str, spot_id, id_indexes, since, histories) + [
+        Stage("fetch_products_sales", lambda: api_client.get_products_sales(date_str, date_str, spot_id)),
+        Stage("fetch_categories_sales", lambda: api_client.get_categories_sales(date_str, date_str, spot_id)),
+        Stage("fetch_shift_sales", fetch_shift_sales, deps=("write_history",)),
+        Stage("write_sales_facts", write_sales_facts,
+              deps=("fetch_products_sales", "fetch_categories_sales"), kind=WRITE),
+        Stage("write_shift_sales", lambda fetch_shift_sales: save_shift_sales(fetch_shift_sales, date_str),
+              deps=("fetch_shift_sales",), kind=WRITE),
+    ]
+
+
+def sync_day(api_client, date_str: str, spot_id: int, id_indexes: Optional[BackfillIdIndexes] = None,
+             since: Optional[datetime] = None, max_workers: int = SYNC_FETCH_WORKERS,
+             histories: Optional[HistoryFetchContext] = None) -> int:
+    """
+    Syncs all transactional data of one spot for one day.
+
+    Static data is expected to be synced already (see `sync_static_data`).
+    The API calls run concurrently without holding a database transaction;
+    each write stage then commits in its own short transaction together
+    with its `SyncState` row (see `day_stages`). The stages are idempotent,
+    so after a failure the committed stages stay and a re-run redoes the rest.
+    The day's datasets are leased for the run, so concurrent processes
+    never sync the same (spot, day) twice (see `hold_leases`).
+
+    Args:
+        api_client: The Poster API client.
+        date_str: The day to sync, 'YYYY-MM-DD'.
+        spot_id: The spot to sync.
+        id_indexes: Optional existence indexes shared by a backfill run.
+        since: The transactions watermark of an incremental sync. Line items
+            and history are only fetched for transactions closed after it.
+        max_workers: Concurrent API fetches; 1 runs the stages inline.
+        histories: A history context shared by the whole run; by default
+            the day gets its own.
+
+    Returns:
+        int: The number of transactions fetched for the day.
+
+    Raises:
+        StageError: If a stage failed; its dataset is marked failed.
+        LeaseHeld: If another worker is syncing the day.
+    """
+    day = date.fromisoformat(date_str)
+    window = day_window(day)
+    recorder = SyncRecorder(spot_id)
+    stages = recorder.tracked(day_stages(api_client, date_str, spot_id, id_indexes, since, histories),
+                              window, DAY_DATASET_ROWS)
+
+    with hold_leases(lease_keys(spot_id, [day], DAILY_DATASETS)):
+        try:
+            report = run_stages(stages, max_workers=max_workers, label=f"sync_day {date_str}/{spot_id}")
+        except StageError as e:
+            recorder.fail(DAY_STAGE_DATASETS[e.stage], window, e.__cause__)
+            raise
+
+    return len(report.results["fetch_transactions"])
+
+
+@dataclass
+class SpotResult:
+    """Outcome of one spot's pipeline in a multi-spot run."""
+    spot_id: int
+    result: Any = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def resolve_spot_ids(spots: str, api_client=None) -> List[int]:
+    """
+    Parses a `--spots` value: 'all' or a comma-separated list of spot IDs.
+
+    'all' reads the Spot table, which `sync_static_data` keeps current. If
+    the table is still empty, the spots are fetched first with `api_client`.
+
+    Raises:
+        ValueError: If the value is neither 'all' nor a list of integers.
+    """
+    if spots.strip().lower() == ALL_SPOTS:
+        known = Spot.objects.order_by('spot_id').values_list('spot_id', flat=True).distinct()
+        if not known.exists() and api_client is not None:
+            save_spots(api_client.get_spots())
+        return list(known)
+
+    spot_ids = [int(spot_id) for spot_id in spots.split(',') if spot_id.strip()]
+    if not spot_ids:
+        raise ValueError("No spot IDs given.")
+    return list(dict.fromkeys(spot_ids))
+
+
+def _run_spot(pipeline: Callable[[int], Any], spot_id: int) -> SpotResult:
+    started = time.perf_counter()
+    try:
+        return SpotResult(spot_id, result=pipeline(spot_id), duration=time.perf_counter() - started)
+    except Exception as e:
+        logger.error(f"[run_per_spot] Spot {spot_id} failed: {e}", exc_info=True)
+        return SpotResult(spot_id, error=str(e), duration=time.perf_counter() - started)
+
+
+def _run_spot_in_thread(pipeline, spot_id):
+    try:
+        return _run_spot(pipeline, spot_id)
+    finally:
+        # Django opens one connection per thread; don't leak them from pool threads.
+        connections.close_all()
+
+
+def run_per_spot(spot_ids: Iterable[int], pipeline: Callable[[int], Any], max_parallel: int = SPOT_PARALLELISM,
+                 on_spot: Optional[Callable[[SpotResult], None]] = None) -> List[SpotResult]:
+    """
+    Runs `pipeline(spot_id)` for every spot, up to `max_parallel` at a time.
+
+    A failing spot doesn't stop the others. The shared catalog is expected
+    to be synced already, once for all spots (see `sync_static_data`).
+
+    Args:
+        spot_ids: The spots to run.
+        pipeline: The per-spot work; its return value ends up in `SpotResult.result`.
+        max_parallel: Spots in flight; 1 runs them inline, in order.
+        on_spot: Called on the calling thread as each spot finishes.
+
+    Returns:
+        List[SpotResult]: One result per spot, in the order of `spot_ids`.
+    """
+    spot_ids = list(spot_ids)
+    results = {}
+
+    def collect(result: SpotResult):
+        results[result.spot_id] = result
+        if on_spot:
+            on_spot(result)
+
+    if max_parallel <= 1 or len(spot_ids) <= 1:
+        for spot_id in spot_ids:
+            collect(_run_spot(pipeline, spot_id))
+    else:
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='spot') as pool:
+            futures = [pool.submit(_run_spot_in_thread, pipeline, spot_id) for spot_id in spot_ids]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    return [results[spot_id] for spot_id in spot_ids]
@@ -0,0 +1,148 @@
+import logging
+from contextlib import nullcontext
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import SyncState
+from .stages import WRITE, Stage
+
+logger = logging.getLogger(__name__)
+
+# Poster close times and our clock can disagree a little, so incremental
+# filters look this far behind the watermark.
+WATERMARK_OVERLAP = timedelta(minutes=15)
+
+# Datasets written by `sync_day`.
+DAILY_DATASETS = (
+    SyncState.CASH_SHIFTS,
+    SyncState.SALES_FACTS,
+    SyncState.CLIENTS,
+    SyncState.TRANSACTIONS,
+    SyncState.SHIFT_SALES,
+)
+
+Window = Tuple[datetime, datetime]
+
+
+def day_window(day: date, now: Optional[datetime] = None) -> Window:
+    """
+    The part of `day` a sync started at `now` can cover.
+
+    Past days are covered completely; today only up to `now`, so the
+    watermark of an hourly sync never runs ahead of the data.
+    """
+    now = now or timezone.now()
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, max(start, min(start + timedelta(days=1), now))
+
+
+def range_window(start_day: date, end_day: date, now: Optional[datetime] = None) -> Window:
+    """Same as `day_window`, for the days `start_day`..`end_day`."""
+    return day_window(start_day, now)[0], day_window(end_day, now)[1]
+
+
+def _advance(spot_id: int, dataset: str, window: Window, rows: int):
+    start, end = window
+    state, _ = SyncState.objects.select_for_update().get_or_create(spot_id=spot_id, dataset=dataset)
+    # Only a window that starts inside the covered range moves the watermark;
+    # syncing a day after a gap must not hide the gap.
+    if state.watermark is None or start <= state.watermark:
+        state.watermark = max(state.watermark or end, end)
+    state.last_window_start, state.last_window_end = start, end
+    state.rows = rows
+    state.total_rows += rows
+    state.status = SyncState.STATUS_OK
+    state.error = ""
+    state.save()
+
+
+def _record_failure(spot_id: int, dataset: str, window: Window, error):
+    SyncState.objects.update_or_create(
+        spot_id=spot_id, dataset=dataset,
+        defaults={
+            'last_window_start': window[0],
+            'last_window_end': window[1],
+            'status': SyncState.STATUS_FAILED,
+            'error': str(error),
+        },
+    )
+
+
+class SyncRecorder:
+    """
+    Records the sync stages of one spot in `SyncState`.
+
+    `record()` writes the state row in the current transaction, so called
+    from inside a stage's write transaction it commits with the stage's data.
+
+    Args:
+        spot_id: The spot being synced; None (a sync of all spots at once)
+            records nothing.
+    """
+
+    def __init__(self, spot_id: Optional[int]):
+        self.spot_id = spot_id
+
+    def record(self, dataset: str, window: Window, rows: int):
+        """Records a successful stage."""
+        if self.spot_id is not None:
+            _advance(self.spot_id, dataset, window, rows)
+
+    def fail(self, dataset: str, window: Window, error):
+        """Records a failed stage; the watermark stays where it was."""
+        logger.error(f"[SyncRecorder] {dataset} for spot {self.spot_id} failed: {error}")
+        if self.spot_id is not None:
+            _record_failure(self.spot_id, dataset, window, error)
+
+    def tracked(self, stages: List[Stage], window: Window, dataset_rows: Dict[str, str]) -> List[Stage]:
+        """
+        Gives every write stage its own short transaction.
+
+        The write stage named in `dataset_rows` for a dataset also records
+        that dataset, with its result as the row count, in the same
+        transaction. What earlier stages wrote stays committed when a later
+        one fails, so the stages must be idempotent. A stage that isn't
+        `atomic` commits its own batches; only its record is then a
+        transaction of its own.
+        """
+        finishes = {stage: dataset for dataset, stage in dataset_rows.items()}
+
+        def wrap(stage: Stage) -> Stage:
+            def run(**inputs):
+                with transaction.atomic() if stage.atomic else nullcontext():
+                    result = stage.func(**inputs)
+                    if stage.name in finishes:
+                        with transaction.atomic():
+                            self.record(finishes[stage.name], window, result or 0)
+                return result
+            return Stage(stage.name, run, stage.deps, stage.kind, stage.atomic)
+
+        return [wrap(stage) if stage.kind == WRITE else stage for stage in stages]
+
+
+def get_watermark(spot_id: int, datasets: Iterable[str] = DAILY_DATASETS) -> Optional[datetime]:
+    """
+    The point up to which all `datasets` of a spot are synced.
+
+    Returns:
+        Optional[datetime]: The lowest watermark, or None if any dataset was never synced.
+    """
+    datasets = list(datasets)
+    watermarks = dict(
+        SyncState.objects.filter(spot_id=spot_id, dataset__in=datasets, watermark__isnull=False)
+        .values_list('dataset', 'watermark')
+    )
+    if len(watermarks) < len(datasets):
+        return None
+    return min(watermarks.values())
+
+
+def incremental_days(watermark: datetime, today: Optional[date] = None) -> List[date]:
+    """The days from the watermark's day through `today` (inclusive)."""
+    today = today or timezone.localdate()
+    first = timezone.localtime(watermark).date()
+    return [first + timedelta(days=offset) for offset in range((today - first).days + 1)]
+
@@ -0,0 +1,295 @@
+import decimal
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.utils.encoding import smart_str
+from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail, ValidationError
+from rest_framework.fields import SkipField, empty
+
+
+_RE_DECIMAL = re.compile(r'\.0*\s*$')
+_RE_SURROGATE = re.compile(r'[\ud800-\udfff]')
+_MAX_STRING_LENGTH = 1000
+
+_BOOL_TRUE = {'t', 'y', 'yes', 'true', 'on', '1', 1, True}
+_BOOL_FALSE = {'f', 'n', 'no', 'false', 'off', '0', 0, 0.0, False}
+_BOOL_NULL = {'null', '', None}
+
+
+class _FieldError(Exception):
+    def __init__(self, message, code='invalid'):
+        self.detail = ErrorDetail(str(message), code=code)
+
+
+def _fail(field: serializers.Field, key: str, **kwargs):
+    raise _FieldError(field.error_messages[key].format(**kwargs), key)
+
+
+def _compile_integer(field: serializers.IntegerField) -> Callable[[Any], int]:
+    def coerce(value):
+        if type(value) is int:
+            return value
+        if isinstance(value, str) and len(value) > _MAX_STRING_LENGTH:
+            _fail(field, 'max_string_length')
+        try:
+            return int(_RE_DECIMAL.sub('', str(value)))
+        except (ValueError, TypeError):
+            _fail(field, 'invalid')
+    return coerce
+
+
+def _compile_char(field: serializers.CharField) -> Callable[[Any], str]:
+    trim = field.trim_whitespace
+    allow_blank = field.allow_blank
+    max_length = field.max_length
+    min_length = field.min_length
+
+    def coerce(value):
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            _fail(field, 'invalid')
+        value = str(value)
+        if trim:
+            value = value.strip()
+        if value == '':
+            if not allow_blank:
+                _fail(field, 'blank')
+            return value
+        if max_length is not None and len(value) > max_length:
+            _fail(field, 'max_length', max_length=max_length)
+        if min_length is not None and len(value) < min_length:
+            _fail(field, 'min_length', min_length=min_length)
+        if '\x00' in value:
+            raise _FieldError('Null characters are not allowed.', 'null_characters_not_allowed')
+        if _RE_SURROGATE.search(value):
+            raise _FieldError('Surrogate characters are not allowed.', 'surrogate_characters_not_allowed')
+        return value
+    return coerce
+
+
+def _compile_decimal(field: serializers.DecimalField) -> Callable[[Any], decimal.Decimal]:
+    max_digits = field.max_digits
+    places = field.decimal_places
+    max_whole_digits = field.max_whole_digits
+    rounding = field.rounding
+    allow_null = field.allow_null
+    exponent = decimal.Decimal('.1') ** places if places is not None else None
+    context = decimal.getcontext().copy()
+    if max_digits is not None:
+        context.prec = max_digits
+
+    def coerce(value):
+        kind = type(value)
+        if kind is str:
+            data = value.strip()
+        elif kind is int or kind is float:
+            data = str(value)
+        else:
+            data = smart_str(value).strip()
+        if data == '' and allow_null:
+            return None
+        if len(data) > _MAX_STRING_LENGTH:
+            _fail(field, 'max_string_length')
+        try:
+            number = decimal.Decimal(data)
+        except decimal.DecimalException:
+            _fail(field, 'invalid')
+        if not number.is_finite():
+            _fail(field, 'invalid')
+
+        _, digits, exp = number.as_tuple()
+        if exp >= 0:
+            total_digits = whole_digits = len(digits) + exp
+            decimal_places = 0
+        elif len(digits) > -exp:
+            total_digits = len(digits)
+            whole_digits = total_digits + exp
+            decimal_places = -exp
+        else:
+            total_digits = decimal_places = -exp
+            whole_digits = 0
+
+        if max_digits is not None and total_digits > max_digits:
+            _fail(field, 'max_digits', max_digits=max_digits)
+        if places is not None and decimal_places > places:
+            _fail(field, 'max_decimal_places', max_decimal_places=places)
+        if max_whole_digits is not None and whole_digits > max_whole_digits:
+            _fail(field, 'max_whole_digits', max_whole_digits=max_whole_digits)
+
+        if exponent is None:
+            return number
+        return number.quantize(exponent, rounding=rounding, context=context)
+    return coerce
+
+
+def _compile_boolean(field: serializers.BooleanField) -> Callable[[Any], bool]:
+    allow_null = field.allow_null
+
+    def coerce(value):
+        key = value.lower() if isinstance(value, str) else value
+        try:
+            if key in _BOOL_TRUE:
+                return True
+            if key in _BOOL_FALSE:
+                return False
+            if allow_null and key in _BOOL_NULL:
+                return None
+        except TypeError:
+            pass
+        _fail(field, 'invalid', input=value)
+    return coerce
+
+
+def _compile_fallback(field: serializers.Field) -> Callable[[Any], Any]:
+    """Wraps the DRF field itself for types without a compiled coercer."""
+    def coerce(value):
+        try:
+            return field.run_validation(value)
+        except ValidationError as exc:
+            detail = exc.detail[0] if isinstance(exc.detail, list) and exc.detail else exc.detail
+            raise _FieldError(detail, getattr(detail, 'code', 'invalid'))
+    return coerce
+
+
+def _is_plain(field: serializers.Field, base: type) -> bool:
+    """Only the exact DRF class with the stock validators can be compiled."""
+    if type(field) is not base:
+        return False
+    stock = (
+        'MaxLengthValidator', 'MinLengthValidator',
+        'ProhibitNullCharactersValidator', 'ProhibitSurrogateCharactersValidator',
+    )
+    return all(type(v).__name__ in stock for v in field.validators)
+
+
+def _compile_field(field: serializers.Field) -> Callable[[Any], Any]:
+    if _is_plain(field, serializers.IntegerField):
+        return _compile_integer(field)
+    if _is_plain(field, serializers.CharField):
+        return _compile_char(field)
+    if _is_plain(field, serializers.DecimalField) and not field.localize:
+        return _compile_decimal(field)
+    if _is_plain(field, serializers.BooleanField):
+        return _compile_boolean(field)
+    return _compile_fallback(field)
+
+
+class CompiledSchema:
+    """
+    A flat validation/coercion plan built once from a DRF `Serializer` class.
+
+    Ingest payloads from Poster are lists of flat dicts, so the per-row work is
+    reduced to a loop over precompiled coercers. Field types that are not
+    compiled natively (or that carry custom validators) fall back to the DRF
+    field's own `run_validation`, so results always match the serializer.
+
+    Args:
+        serializer_class: A `serializers.Serializer` subclass with flat fields.
+    """
+
+    def __init__(self, serializer_class: type):
+        self.serializer_class = serializer_class
+        serializer = serializer_class()
+        if serializer_class.validate is not serializers.Serializer.validate:
+            raise ValueError(f"{serializer_class.__name__}: object-level validate() is not supported.")
+        self._plan: List[Tuple[str, str, bool, bool, Any, Callable[[Any], Any]]] = []
+
+        for name, field in serializer.fields.items():
+            if field.read_only:
+                continue
+            if field.source == '*' or len(field.source_attrs) != 1:
+                raise ValueError(f"{serializer_class.__name__}.{name}: nested sources are not supported.")
+            if hasattr(serializer, f'validate_{name}'):
+                raise ValueError(f"{serializer_class.__name__}.validate_{name}() is not supported.")
+            self._plan.append((
+                name,
+                field.source_attrs[0],
+                field.required,
+                field.allow_null,
+                field.default,
+                _compile_field(field),
+            ))
+
+        messages = serializers.Field.default_error_messages
+        self._required = ErrorDetail(str(messages['required']), code='required')
+        self._null = ErrorDetail(str(messages['null']), code='null')
+        self._not_a_dict = str(serializers.Serializer.default_error_messages['invalid'])
+
+    def validate_row(self, row: Any) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+        """
+        Validates a single row.
+
+        Returns:
+            tuple: `(validated, errors)`. `errors` is empty on success and
+            otherwise has the same shape as `Serializer.errors`.
+        """
+        if not isinstance(row, dict):
+            message = self._not_a_dict.format(datatype=type(row).__name__)
+            return {}, {'non_field_errors': [ErrorDetail(message, code='invalid')]}
+
+        validated = {}
+        errors = {}
+        for name, target, required, allow_null, default, coerce in self._plan:
+            value = row.get(name, empty)
+            if value is empty:
+                if required:
+                    errors[name] = [self._required]
+                elif default is not empty:
+                    validated[target] = default() if callable(default) else default
+                continue
+            if value is None:
+                if allow_null:
+                    validated[target] = None
+                else:
+                    errors[name] = [self._null]
+                continue
+            try:
+                validated[target] = coerce(value)
+            except _FieldError as exc:
+                errors[name] = [exc.detail]
+            except SkipField:
+                continue
+        return validated, errors
+
+    def validate(self, rows: List[Any]) -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, List[str]]]]:
+        """
+        Validates a whole batch without raising.
+
+        Returns:
+            tuple: `(valid_rows, errors_by_index)`. Invalid rows are left out of
+            `valid_rows`; their errors are keyed by position in the input.
+        """
+        valid_rows = []
+        errors_by_index = {}
+        validate_row = self.validate_row
+        for index, row in enumerate(rows):
+            validated, errors = validate_row(row)
+            if errors:
+                errors_by_index[index] = errors
+            else:
+                valid_rows.append(validated)
+        return valid_rows, errors_by_index
+
+    def validate_or_raise(self, rows: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Drop-in replacement for `Serializer(data=rows, many=True).is_valid(raise_exception=True)`.
+
+        Raises:
+            rest_framework.exceptions.ValidationError: With one entry per input
+                row (empty dicts for valid rows), exactly like `many=True`.
+        """
+        valid_rows, errors_by_index = self.validate(rows)
+        if errors_by_index:
+            raise ValidationError([errors_by_index.get(i, {}) for i in range(len(rows))])
+        return valid_rows
+
+
+_schemas: Dict[type, CompiledSchema] = {}
+
+
+def compile_schema(serializer_class: type) -> CompiledSchema:
+    """Returns the cached `CompiledSchema` for a serializer class."""
+    schema = _schemas.get(serializer_class)
+    if schema is None:
+        schema = _schemas[serializer_class] = CompiledSchema(serializer_class)
+    return schema
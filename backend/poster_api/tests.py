@@ -1,21 +1,30 @@
 from decimal import Decimal
+import json
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock, AsyncMock
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 import requests
 from django.test import TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
-import asyncio
-from .client import PosterAPIClient 
+from .client import HistoryFetchContext, PosterAPIClient 
 from django.utils import timezone
 from poster_api.models import (
     ShiftSale, ShiftSaleItem, CashShiftReport, Category, Product,
     ProductSales, CategoriesSales, Clients, Transactions,
-    TransactionsProducts, TransactionHistory, Workshop, Payments_ID, Spot
+    TransactionsProducts, TransactionHistory, Workshop, Payments_ID, Spot,
+    BackfillCheckpoint, SyncLease, SyncState
 )
 from users.models import Role, User
+from shift.models import Shift
+from salary.aggreg import aggregate_sales
 from poster_api.services.saving import (
     save_shift_sales_to_db,
     save_cash_shifts_range,
@@ -26,13 +35,28 @@ from poster_api.services.saving import (
     save_transactions,
     save_transactions_products,
     save_transaction_history,
+    save_transaction_histories,
+    stream_transaction_histories,
     save_workshop,
     save_payments_id,
     save_clients,
+    save_spots,
     sync_all_from_date,
+    iter_windows,
     parse_poster_datetime,
+    _close_date_filter,
     create_role_lists
 )
+from poster_api.serializers import ProductAPISerializer, ProductSalesAPISerializer
+from poster_api.services.validation import compile_schema
+from poster_api.services import partitioning
+from poster_api.services.id_index import BackfillIdIndexes, IdIndex
+from poster_api.services.backfill import CLAIMED_ELSEWHERE, BackfillUnit, plan_units, run_backfill, run_unit
+from poster_api.services.leases import LeaseHeld, acquire_leases, hold_leases, lease_keys, release_leases
+from poster_api.services.stages import WRITE, Stage, StageError, run_stages
+from poster_api.services.sync import resolve_spot_ids, run_per_spot, sync_day
+from poster_api.services.sync_state import day_window, get_watermark, incremental_days
+from rest_framework.exceptions import ValidationError
 
 
 class TestPosterAPIClient(unittest.TestCase):
@@ -167,6 +191,15 @@ class TestPosterAPIClient(unittest.TestCase):
 
         self.assertEqual(result, [])
         
+    @patch('poster_api.client.PosterAPIClient.make_request')
+    def test_get_sales_reports_raise_on_failed_request(self, mock_make_request):
+        mock_make_request.return_value = {"error": "timeout"}
+
+        with self.assertRaises(Exception):
+            self.client.get_products_sales()
+        with self.assertRaises(Exception):
+            self.client.get_categories_sales()
+
     @patch('poster_api.client.PosterAPIClient.make_request')
     def test_get_products(self, mock_make_request):
         raw_api_response = {
@@ -423,12 +456,12 @@ class TestComplexLogic(unittest.TestCase):
 
         self.assertEqual(result, {})
 
-    @patch('poster_api.client.asyncio.run')
+    @patch('poster_api.client.PosterAPIClient.iter_histories')
     @patch('poster_api.client.PosterAPIClient.get_transactions_products')
     @patch('poster_api.client.PosterAPIClient.get_transactions')
     @patch('poster_api.client.PosterAPIClient.get_cash_shifts')
     def test_get_sales_full_scenario_with_tips_and_distribution(
-        self, mock_get_shifts, mock_get_transactions, mock_get_tx_products, mock_asyncio_run
+        self, mock_get_shifts, mock_get_transactions, mock_get_tx_products, mock_iter_histories
     ):
         """Тест: полный сценарий с распределением продаж и чаевых по смене."""
         mock_get_shifts.return_value = [{
@@ -460,7 +493,7 @@ class TestComplexLogic(unittest.TestCase):
         ]
         
         # Мокаем вызов истории для получения типа оплаты и чаевых
-        mock_asyncio_run.return_value = [
+        mock_iter_histories.return_value = [
             # tx_id, actions, payment_method_id, tip_sum
             ('1', [], 2, 0.0),       # Обычная оплата картой (id=2), без чаевых
             ('2', [], 12, 15.50),    # Оплата Glovo CARD (id=12), чаевые 15.50
@@ -498,62 +531,71 @@ class TestAsyncMethods(TestCase):
     def setUp(self):
         self.client = PosterAPIClient(api_token="fake_token", api_url="fake_url")
 
-    def test_fetch_all_histories_empty_input(self):
-        async def run_test():
-            result = await self.client.fetch_all_histories([])
-            self.assertEqual(result, [])
-        
-        asyncio.run(run_test())
-
     @patch('poster_api.client.PosterAPIClient.make_request')
-    def test_fetch_all_histories_success(self, mock_make_request):
+    def test_iter_histories_parses_close_actions(self, mock_make_request):
         def request_side_effect(method, endpoint, params):
             tx_id = params.get("transaction_id")
             if tx_id == '101':
                 return {"response": [{"type_history": "close", "value_text": '{"payment_method_id": "2", "tip_sum": "10.5"}'}]}
             if tx_id == '102':
                 return {"response": [{"type_history": "close", "value_text": '{"payment_method_id": "12"}'}]}
+            if tx_id == 'FAIL':
+                raise Exception("API call failed")
+            if tx_id == 'ERROR':
+                return {"error": "timeout"}
             return {"response": []}
 
         mock_make_request.side_effect = request_side_effect
 
-        async def run_test():
-            transaction_ids = ['101', '102']
-            results = await self.client.fetch_all_histories(transaction_ids)
-            self.assertEqual(len(results), 2)
-            results_dict = {res[0]: res for res in results}
-            self.assertEqual(results_dict['101'][2], 2)
-            self.assertEqual(results_dict['101'][3], 10.5)
-            self.assertEqual(results_dict['102'][2], 12)
-            self.assertEqual(results_dict['102'][3], 0.0)
-            self.assertEqual(mock_make_request.call_count, 2)
+        results = {res[0]: res for res in self.client.iter_histories(['101', '102', 'FAIL', 'ERROR'])}
 
-        asyncio.run(run_test())
+        self.assertEqual(results['101'][2:], (2, 10.5))
+        self.assertEqual(results['102'][2:], (12, 0.0))
+        self.assertEqual(results['FAIL'], ('FAIL', None, None, 0.0))
+        self.assertEqual(results['ERROR'], ('ERROR', None, None, 0.0))
+        self.assertEqual(list(self.client.iter_histories([])), [])
 
     @patch('poster_api.client.PosterAPIClient.make_request')
-    def test_fetch_all_histories_partial_failure(self, mock_make_request):
-        def request_side_effect(method, endpoint, params):
-            tx_id = params.get("transaction_id")
-            if tx_id == '101':
-                return {"response": [{"type_history": "close", "value_text": '{"payment_method_id": "2"}'}]}
-            if tx_id == 'FAIL':
-                raise Exception("API call failed")
-            return {"response": []}
+    def test_iter_histories_is_bounded_and_stops_early(self, mock_make_request):
+        mock_make_request.return_value = {"response": []}
 
-        mock_make_request.side_effect = request_side_effect
-        
-        async def run_test():
-            transaction_ids = ['101', 'FAIL']
-            results = await self.client.fetch_all_histories(transaction_ids)
-            self.assertEqual(len(results), 2)
-            results_dict = {res[0]: res for res in results}
-            self.assertEqual(results_dict['101'][2], 2)
-            failed_result = results_dict['FAIL']
-            self.assertEqual(failed_result[0], 'FAIL')
-            self.assertEqual(failed_result[1], [])
-            self.assertIsNone(failed_result[2])
-        
-        asyncio.run(run_test())
+        histories = self.client.iter_histories(range(100), workers=2, buffer_size=1)
+        first = next(histories)
+        time.sleep(0.1)
+        histories.close()
+
+        self.assertEqual(first[1], [])
+        # One item handed over, one waiting in the buffer, one blocked per worker.
+        self.assertLessEqual(mock_make_request.call_count, 4)
+        self.assertEqual(len(list(self.client.iter_histories(range(10), workers=3))), 10)
+
+    @patch('poster_api.client.PosterAPIClient.make_request')
+    def test_history_context_fetches_each_transaction_once(self, mock_make_request):
+        mock_make_request.return_value = {
+            "response": [{"type_history": "close", "value_text": '{"payment_method_id": "2", "tip_sum": "10.5"}'}]
+        }
+        histories = HistoryFetchContext(self.client)
+
+        batches = []
+
+        self.assertEqual(histories.stream(['101', 102], on_batch=batches.append, batch_size=1), 2)
+        second = histories.get_many([101, 102, 103, None])
+
+        self.assertEqual(sorted(tx_id for batch in batches for tx_id in batch), [101, 102])
+        self.assertEqual(batches[0][next(iter(batches[0]))][0]["type_history"], "close")
+        self.assertEqual(sorted(second), [101, 102, 103])
+        self.assertEqual((second[101].payment_method_id, second[101].tip_sum), (2, 10.5))
+        self.assertEqual((mock_make_request.call_count, histories.requested, len(histories)), (3, 3, 3))
+
+    @patch('poster_api.client.PosterAPIClient.make_request')
+    def test_history_context_retries_failed_fetches(self, mock_make_request):
+        mock_make_request.side_effect = [{"error": "timeout"}, {"response": []}]
+        histories = HistoryFetchContext(self.client)
+
+        self.assertEqual(histories.stream([101]), 0)
+        self.assertEqual((histories.failed_among([101, 102]), len(histories)), ({101}, 0))
+        self.assertEqual(sorted(histories.get_many([101])), [101])
+        self.assertEqual((histories.failed, mock_make_request.call_count), (set(), 2))
         
         
 
@@ -577,6 +619,159 @@ class PosterUtilsTestCase(TestCase):
         self.assertIsNone(parse_poster_datetime("not-a-date"))
 
 
+class IngestValidationTestCase(unittest.TestCase):
+    ROWS = [
+        {"product_id": "600", "product_name": " Soup ", "category_id": 18.0, "category_name": "Kitchen",
+         "cost": 720.5, "fiscal": "yes", "workshop": 2},
+        {"product_id": 601, "product_name": "Tea", "category_id": 18, "category_name": "Bar"},
+        {"product_id": "x", "product_name": "", "category_id": None, "category_name": "Bar", "cost": "1.234"},
+        {"product_id": 602, "product_name": "Cake", "category_name": "Bar", "fiscal": "maybe", "workshop": 1.5},
+        "not a dict",
+    ]
+
+    def test_matches_drf_output_and_errors(self):
+        for row in self.ROWS:
+            serializer = ProductAPISerializer(data=row)
+            drf_valid = serializer.is_valid()
+            validated, errors = compile_schema(ProductAPISerializer).validate_row(row)
+
+            self.assertEqual(drf_valid, not errors, row)
+            if drf_valid:
+                self.assertEqual(dict(serializer.validated_data), validated)
+            else:
+                expected = {k: [str(m) for m in v] for k, v in serializer.errors.items()}
+                self.assertEqual(expected, errors)
+
+    def test_batch_reports_per_row_errors(self):
+        valid_rows, errors = compile_schema(ProductAPISerializer).validate(self.ROWS)
+
+        self.assertEqual([r["product_id"] for r in valid_rows], [600, 601])
+        self.assertEqual(sorted(errors), [2, 3, 4])
+        self.assertIn("category_id", errors[2])
+        self.assertIn("cost", errors[2])
+
+    def test_validate_or_raise_matches_many_serializer(self):
+        rows = [
+            {"product_id": 1, "product_name": "A", "category_id": 1, "category_name": "C", "count": "2.50"},
+            {"product_id": 2, "product_name": "B", "category_id": 1, "category_name": "C", "count": "1e20"},
+        ]
+        serializer = ProductSalesAPISerializer(data=rows, many=True)
+        self.assertFalse(serializer.is_valid())
+
+        with self.assertRaises(ValidationError) as ctx:
+            compile_schema(ProductSalesAPISerializer).validate_or_raise(rows)
+        self.assertEqual(ctx.exception.detail, serializer.errors)
+
+
+class PartitioningHelpersTestCase(unittest.TestCase):
+    def test_month_arithmetic(self):
+        self.assertEqual(partitioning.add_months(date(2024, 11, 1), 3), date(2025, 2, 1))
+        self.assertEqual(partitioning.add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+        self.assertEqual(
+            partitioning.month_range(date(2024, 12, 15), date(2025, 2, 3)),
+            [date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1)],
+        )
+
+    def test_partition_names_round_trip(self):
+        name = partitioning.partition_name("poster_api_transactions", date(2025, 3, 1))
+        self.assertEqual(name, "poster_api_transactions_p202503")
+        self.assertEqual(partitioning.partition_month("poster_api_transactions", name), date(2025, 3, 1))
+        self.assertIsNone(partitioning.partition_month("poster_api_transactions", "poster_api_transactions_default"))
+        self.assertIsNone(partitioning.partition_month("poster_api_transactions", "poster_api_transactionsproducts_p202503"))
+
+    def test_partition_bounds_are_utc_months(self):
+        sql = partitioning.create_partition_sql("poster_api_transactions", date(2024, 12, 1))
+        self.assertIn("FROM ('2024-12-01 00:00:00+00') TO ('2025-01-01 00:00:00+00')", sql)
+
+
+class IdIndexTestCase(unittest.TestCase):
+    def test_membership_and_split(self):
+        index = IdIndex([30, 10, 20, 10])
+        self.assertEqual(len(index), 3)
+        self.assertIn(20, index)
+        self.assertIn("30", index)
+        self.assertNotIn(15, index)
+        self.assertNotIn("abc", index)
+
+        index.add([15, 20, None])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.split([10, 15, 99]), ({10, 15}, {99}))
+
+    def test_uses_compact_array_when_ids_fit(self):
+        self.assertEqual(IdIndex(range(1000))._sorted.itemsize, 4)
+        self.assertEqual(IdIndex([2 ** 40])._sorted.itemsize, 8)
+        self.assertIn(2 ** 40, IdIndex([-1, 2 ** 40]))
+
+
+class StageExecutorTestCase(unittest.TestCase):
+    """Tests for the stage-graph executor."""
+
+    def test_independent_fetches_overlap_and_writes_run_on_caller_thread(self):
+        caller = threading.get_ident()
+        write_threads = []
+
+        def slow(value):
+            time.sleep(0.2)
+            return value
+
+        def write(fetch_a, fetch_b):
+            write_threads.append(threading.get_ident())
+            return fetch_a + fetch_b
+
+        report = run_stages([
+            Stage("fetch_a", lambda: slow(1)),
+            Stage("fetch_b", lambda: slow(2)),
+            Stage("write", write, deps=("fetch_a", "fetch_b"), kind=WRITE),
+        ], max_workers=4)
+
+        self.assertEqual(report.results["write"], 3)
+        self.assertEqual(write_threads, [caller])
+        self.assertLess(report.total, 0.35)
+
+    def test_write_starts_when_its_inputs_are_ready(self):
+        report = run_stages([
+            Stage("fetch_slow", lambda: time.sleep(0.3)),
+            Stage("fetch_fast", lambda: "rows"),
+            Stage("write_fast", lambda fetch_fast: fetch_fast, deps=("fetch_fast",), kind=WRITE),
+            Stage("write_slow", lambda fetch_slow: None, deps=("fetch_slow",), kind=WRITE),
+        ], max_workers=4)
+
+        self.assertLess(report.timings["write_fast"].finished, report.timings["fetch_slow"].finished)
+        self.assertEqual(report.critical_path([
+            Stage("fetch_slow", None), Stage("fetch_fast", None),
+            Stage("write_fast", None, deps=("fetch_fast",)), Stage("write_slow", None, deps=("fetch_slow",)),
+        ]), ["fetch_slow", "write_slow"])
+
+    def test_inline_mode_runs_in_dependency_order(self):
+        calls = []
+        run_stages([
+            Stage("write", lambda fetch: calls.append("write"), deps=("fetch",), kind=WRITE),
+            Stage("fetch", lambda: calls.append("fetch")),
+        ], max_workers=1)
+        self.assertEqual(calls, ["fetch", "write"])
+
+    def test_malformed_graphs_are_rejected(self):
+        with self.assertRaises(ValueError):
+            run_stages([Stage("a", lambda b: None, deps=("b",)), Stage("b", lambda a: None, deps=("a",))])
+        with self.assertRaises(ValueError):
+            run_stages([Stage("a", lambda missing: None, deps=("missing",))])
+
+    def test_failure_reports_stage_and_finished_results(self):
+        def boom(write_ok):
+            raise RuntimeError("API down")
+
+        with self.assertRaises(StageError) as ctx:
+            run_stages([
+                Stage("fetch_ok", lambda: 1),
+                Stage("write_ok", lambda fetch_ok: fetch_ok, deps=("fetch_ok",), kind=WRITE),
+                Stage("fetch_bad", boom, deps=("write_ok",)),
+            ], max_workers=2)
+
+        self.assertEqual(ctx.exception.stage, "fetch_bad")
+        self.assertIsInstance(ctx.exception.__cause__, RuntimeError)
+        self.assertEqual(ctx.exception.report.results, {"fetch_ok": 1, "write_ok": 1})
+
+
 class PosterSavingServiceTestCase(TestCase):
     def setUp(self):
         self.api_client = MagicMock()
@@ -587,7 +782,8 @@ class PosterSavingServiceTestCase(TestCase):
         mock_response = {
             "123": {
                 "regular": [
-                    {"payed_sum": "100.00", "profit": "50.00", "product_name": "Burger", "count": 1, "category": "Food"}
+                    {"payed_sum": "100.00", "profit": "50.00", "product_name": "Burger", "count": 1, "category": "Food",
+                     "product_id": "17", "workshop": "3"}
                 ],
                 "delivery": [],
                 "tips": "10.00"
@@ -605,6 +801,7 @@ class PosterSavingServiceTestCase(TestCase):
         item = ShiftSaleItem.objects.get(shift_sale=shift)
         self.assertEqual(item.product_name, "Burger")
         self.assertEqual(item.profit, Decimal("50.00"))
+        self.assertEqual((item.product_id, item.workshop_id), (17, 3))
 
         mock_response["123"]["regular"][0]["payed_sum"] = "200.00" 
         save_shift_sales_to_db(self.api_client, date_str)
@@ -651,35 +848,68 @@ class PosterSavingServiceTestCase(TestCase):
         product.refresh_from_db()
         self.assertEqual(product.product_name, "Pepsi")
 
-    @unittest.skip
     def test_save_products_sales(self):
         data = [{
             "product_id": 1, 
-            "product_name": "Pizza", 
+            "name": "Pizza", 
             "category_id": 20, 
             "category_name": "Food",
+            "price": 300,
             "count": 5,
             "product_profit": "150.00"
         }]
         
-        save_products_sales(data)
+        save_products_sales(data, "2025-10-01", 1)
         
-        sale = ProductSales.objects.get(product_id=1)
+        sale = ProductSales.objects.get(product__product_id=1)
+        self.assertEqual(sale.date, date(2025, 10, 1))
+        self.assertEqual(sale.spot_id, 1)
         self.assertEqual(sale.count, 5)
         self.assertEqual(sale.product_profit, Decimal("150.00"))
-        self.assertTrue(Product.objects.filter(product_id=1).exists())
+        self.assertEqual(Product.objects.get(product_id=1).product_name, "Pizza")
+
+    def test_save_products_sales_replaces_day_slice(self):
+        row = {"product_id": 1, "name": "Pizza", "category_id": 20, "category_name": "Food"}
+        save_products_sales([{**row, "count": 5, "product_profit": 150},
+                             {**row, "product_id": 2, "name": "Pasta", "count": 1, "product_profit": 40}],
+                            "2025-10-01", 1)
+        save_products_sales([{**row, "count": 3, "product_profit": 90}], "2025-10-02", 1)
+        save_products_sales([{**row, "count": 7, "product_profit": 210}], "2025-10-01", 2)
+
+        save_products_sales([{**row, "count": 6, "product_profit": 180}], "2025-10-01", 1)
+
+        day = ProductSales.objects.filter(date="2025-10-01", spot_id=1)
+        self.assertEqual([(s.product.product_id, s.count) for s in day], [(1, 6)])
+        self.assertEqual(ProductSales.objects.count(), 3)
 
     def test_save_categories_sales(self):
         data = [{
             "category_id": 30,
-            "category_name": "Beer",
+            "name": "Beer",
             "profit": "500.00",
             "count": 10
         }]
-        save_categories_sales(data)
+        save_categories_sales(data, "2025-10-01", 2)
         
         sale = CategoriesSales.objects.get(category__category_id=30)
         self.assertEqual(sale.profit, Decimal("500.00"))
+        self.assertEqual((sale.date, sale.spot_id), (date(2025, 10, 1), 2))
+
+        data[0]["profit"] = "450.00"
+        save_categories_sales(data, "2025-10-01", 2)
+        self.assertEqual(CategoriesSales.objects.get().profit, Decimal("450.00"))
+
+    def test_resyncing_a_day_without_sales_clears_it(self):
+        row = {"product_id": 1, "name": "Pizza", "category_id": 20, "category_name": "Food", "count": 5, "product_profit": 150}
+        save_products_sales([row], "2025-10-01", 1)
+        save_products_sales([row], "2025-10-02", 1)
+        save_categories_sales([{"category_id": 20, "name": "Food", "profit": 150, "count": 5}], "2025-10-01", 1)
+
+        save_products_sales([], "2025-10-01", 1)
+        save_categories_sales([{"category_id": 20, "name": "", "profit": 150, "count": 5}], "2025-10-01", 1)
+
+        self.assertEqual([s.date for s in ProductSales.objects.all()], [date(2025, 10, 2)])
+        self.assertFalse(CategoriesSales.objects.exists())
 
     def test_save_transactions_full_flow(self):
         """
@@ -734,10 +964,49 @@ class PosterSavingServiceTestCase(TestCase):
 
         link = TransactionsProducts.objects.get(transaction__transaction_id=999, product__product_id=50)
         self.assertEqual(link.num, 2.0)
+        self.assertEqual(link.date_close, tx.date_close)
         
         client = Clients.objects.get(client_id=777)
         self.assertEqual(client.firstname, "John")
         
+    def test_transaction_savers_skip_lookups_for_unknown_ids(self):
+        def tx(i):
+            return {"transaction_id": i, "date_start": "2023-11-01 12:00:00", "date_close": "2023-11-01 12:30:00",
+                    "reason": "", "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1, "processing_status": 10}
+
+        save_transactions([tx(1)])
+        category = Category.objects.create(category_id=1, category_name="Test")
+        Product.objects.create(product_id=50, product_name="Steak", category=category)
+        save_transactions_products([{"transaction_id": 1, "product_id": 50, "num": 1}])
+        indexes = BackfillIdIndexes.seed(chunk_size=1)
+        self.assertIn(1, indexes.transactions)
+        self.assertIn(1, indexes.transactions_with_products)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(save_transactions([tx(2), tx(3)], known_ids=indexes.transactions), 2)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+        self.assertIn(3, indexes.transactions)
+
+        self.assertEqual(save_transactions([tx(1), tx(2), tx(4)], known_ids=indexes.transactions), 1)
+        self.assertEqual(Transactions.objects.count(), 4)
+
+        save_transactions_products(
+            [{"transaction_id": i, "product_id": 50, "num": 2} for i in (1, 2)],
+            known_tx_ids=indexes.transactions_with_products,
+        )
+        self.assertEqual(TransactionsProducts.objects.count(), 2)
+        self.assertEqual(TransactionsProducts.objects.get(transaction__transaction_id=1).num, 2)
+        self.assertIn(2, indexes.transactions_with_products)
+
+    def test_stale_index_hits_are_confirmed_in_db(self):
+        stale = IdIndex([5])
+        saved = save_transactions([{"transaction_id": 5, "date_start": "2023-11-01 12:00:00",
+                                    "date_close": "2023-11-01 12:30:00", "reason": "", "status": 2,
+                                    "pay_type": 1, "spot_id": 1, "service_mode": 1, "processing_status": 10}],
+                                  known_ids=stale)
+        self.assertEqual(saved, 1)
+        self.assertTrue(Transactions.objects.filter(transaction_id=5).exists())
+
     def test_save_transaction_history(self):
         tx = Transactions.objects.create(
             transaction_id=888, 
@@ -755,6 +1024,44 @@ class PosterSavingServiceTestCase(TestCase):
         
         h_obj = TransactionHistory.objects.get(transaction=tx)
         self.assertEqual(h_obj.type_history, "open")
+        self.assertEqual(h_obj.date_close, tx.date_close)
+
+    def test_children_without_date_close_are_not_saved_again(self):
+        save_transactions([{"transaction_id": 7, "date_start": "2023-11-01 12:00:00", "date_close": "2023-11-01 12:30:00",
+                            "reason": "", "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1,
+                            "processing_status": 10}])
+        category = Category.objects.create(category_id=1, category_name="Test")
+        Product.objects.create(product_id=50, product_name="Steak", category=category)
+        save_transactions_products([{"transaction_id": 7, "product_id": 50, "num": 1}])
+        save_transaction_history(7, [{"type_history": "open", "time": "2023-11-01 12:00:00", "value": 0}])
+        # Rows stored before the children tracked their parent's date_close.
+        TransactionsProducts.objects.update(date_close=None)
+        TransactionHistory.objects.update(date_close=None)
+
+        save_transactions_products([{"transaction_id": 7, "product_id": 50, "num": 3}])
+        self.assertEqual(save_transaction_history(7, [{"type_history": "open", "time": "2023-11-01 12:00:00", "value": 0}]), 0)
+
+        self.assertEqual(TransactionsProducts.objects.get().num, 3)
+        self.assertEqual(TransactionHistory.objects.count(), 1)
+        self.assertEqual(_close_date_filter([None, timezone.now()]), Q())
+
+    @patch('poster_api.client.PosterAPIClient.make_request')
+    def test_stream_transaction_histories_flushes_in_batches(self, mock_make_request):
+        for tx_id in range(1, 6):
+            Transactions.objects.create(transaction_id=tx_id, date_start=timezone.now(), date_close=timezone.now())
+        mock_make_request.side_effect = lambda method, endpoint, params: {"response": [
+            {"type_history": "close", "time": "2024-01-01 12:00:00", "value": params["transaction_id"]},
+        ]}
+        client = PosterAPIClient(api_token="fake_token", api_url="fake_url")
+
+        with patch("poster_api.services.saving.save_transaction_histories",
+                   wraps=save_transaction_histories) as mock_save:
+            saved = stream_transaction_histories(client, range(1, 7), batch_size=2, workers=2, buffer_size=1)
+
+        self.assertEqual(saved, 5)
+        self.assertEqual(mock_save.call_count, 3)
+        self.assertEqual(TransactionHistory.objects.count(), 5)
+        self.assertEqual(save_transaction_histories({1: mock_make_request(None, None, {"transaction_id": 1})["response"]}), 0)
 
     def test_static_data_savers(self):
         save_workshop([{"workshop_id": 1, "workshop_name": "Kitchen"}])
@@ -773,7 +1080,7 @@ class PosterSavingServiceTestCase(TestCase):
     @patch("poster_api.services.saving.save_payments_id")
     @patch("poster_api.services.saving.save_products")
     @patch("poster_api.services.saving.save_categories")
-    @patch("poster_api.services.saving.save_cash_shifts_range")
+    @patch("poster_api.services.saving.save_cash_shifts")
     @patch("poster_api.services.saving.save_shift_sales_to_db")
     def test_sync_all_from_date(self, mock_shifts, mock_cash, mock_cat, mock_prod, mock_pay, mock_work):
         self.api_client.get_transactions.return_value = [] 
@@ -793,6 +1100,336 @@ class PosterSavingServiceTestCase(TestCase):
         
 
 
+class BackfillTestCase(TestCase):
+    """Tests for the checkpointed backfill orchestrator (inline, one worker)."""
+
+    def setUp(self):
+        self.start = date(2024, 1, 1)
+        self.end = date(2024, 1, 3)
+
+    def test_plan_units_skips_done_checkpoints(self):
+        BackfillCheckpoint.objects.create(date=date(2024, 1, 2), spot_id=1, status=BackfillCheckpoint.STATUS_DONE)
+        BackfillCheckpoint.objects.create(date=date(2024, 1, 3), spot_id=1, status=BackfillCheckpoint.STATUS_FAILED)
+
+        units, skipped = plan_units(self.start, self.end, [1, 2])
+
+        self.assertEqual(skipped, 1)
+        self.assertEqual(len(units), 5)
+        self.assertNotIn(BackfillUnit(date(2024, 1, 2), 1), units)
+        self.assertIn(BackfillUnit(date(2024, 1, 3), 1), units)
+
+        forced, skipped = plan_units(self.start, self.end, [1, 2], force=True)
+        self.assertEqual((len(forced), skipped), (6, 0))
+
+    @patch("poster_api.services.backfill.sync_static_data")
+    @patch("poster_api.services.backfill.sync_day", return_value=7)
+    def test_run_backfill_records_checkpoints_and_resumes(self, mock_sync_day, mock_static):
+        report = run_backfill(self.start, self.end, [1], workers=1)
+
+        self.assertEqual(len(report.done), 3)
+        self.assertEqual(report.completed_dates, [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)])
+        mock_static.assert_called_once()
+        self.assertEqual(
+            [c.args[1:3] for c in mock_sync_day.call_args_list],
+            [("2024-01-01", 1), ("2024-01-02", 1), ("2024-01-03", 1)],
+        )
+        checkpoint = BackfillCheckpoint.objects.get(date=date(2024, 1, 2), spot_id=1)
+        self.assertEqual(checkpoint.status, BackfillCheckpoint.STATUS_DONE)
+        self.assertEqual((checkpoint.transactions, checkpoint.attempts), (7, 1))
+
+        mock_sync_day.reset_mock()
+        mock_static.reset_mock()
+        report = run_backfill(self.start, self.end, [1], workers=1)
+
+        self.assertEqual((len(report.planned), report.skipped), (0, 3))
+        mock_sync_day.assert_not_called()
+        mock_static.assert_not_called()
+
+    @patch("poster_api.services.backfill.sync_static_data")
+    @patch("poster_api.services.backfill.sync_day")
+    def test_failed_unit_keeps_partial_progress_and_is_retried(self, mock_sync_day, mock_static):
+        def flaky(api_client, date_str, spot_id, id_indexes=None):
+            Clients.objects.create(client_id=int(date_str[-2:]), firstname="Partial")
+            if date_str == "2024-01-02":
+                raise RuntimeError("API timeout")
+            return 1
+        mock_sync_day.side_effect = flaky
+
+        report = run_backfill(self.start, self.end, [1], workers=1)
+
+        self.assertEqual(len(report.done), 2)
+        self.assertEqual(report.failed, [(BackfillUnit(date(2024, 1, 2), 1), "API timeout")])
+        self.assertEqual(report.completed_dates, [date(2024, 1, 1), date(2024, 1, 3)])
+        self.assertTrue(Clients.objects.filter(client_id=2).exists())
+        failed = BackfillCheckpoint.objects.get(date=date(2024, 1, 2), spot_id=1)
+        self.assertEqual((failed.status, failed.error), (BackfillCheckpoint.STATUS_FAILED, "API timeout"))
+
+        mock_sync_day.side_effect = lambda *args, **kwargs: 0
+        report = run_backfill(self.start, self.end, [1], workers=1)
+
+        self.assertEqual(report.planned, [BackfillUnit(date(2024, 1, 2), 1)])
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts, failed.error), (BackfillCheckpoint.STATUS_DONE, 2, ""))
+
+
+class SyncStateTestCase(TestCase):
+    """Tests for the per-(spot, dataset) sync watermarks."""
+
+    def setUp(self):
+        # A real client, so histories go through the shared fetch context.
+        self.api_client = PosterAPIClient(api_token="fake_token", api_url="fake_url")
+        for method in ("get_cash_shifts", "get_products_sales", "get_categories_sales", "get_clients_sales",
+                       "get_transactions", "get_transactions_products", "get_sales_by_shift_with_delivery"):
+            setattr(self.api_client, method, MagicMock(return_value=[]))
+        self.api_client.make_request = MagicMock(return_value={"response": []})
+
+    def _tx(self, tx_id, date_close):
+        return {"transaction_id": tx_id, "date_start": date_close, "date_close": date_close, "reason": "",
+                "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1, "processing_status": 10}
+
+    def test_day_window(self):
+        now = datetime(2024, 1, 2, 9, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(day_window(date(2024, 1, 1), now),
+                         (datetime(2024, 1, 1, tzinfo=dt_timezone.utc), datetime(2024, 1, 2, tzinfo=dt_timezone.utc)))
+        self.assertEqual(day_window(date(2024, 1, 2), now)[1], now)
+        self.assertEqual(incremental_days(now, today=date(2024, 1, 4)),
+                         [date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 4)])
+
+    def test_sync_day_advances_watermarks_contiguously(self):
+        self.api_client.get_transactions.return_value = [self._tx(1, "2024-01-01 12:00:00")]
+
+        sync_day(self.api_client, "2024-01-01", 1)
+
+        self.assertEqual(SyncState.objects.filter(spot_id=1).count(), 5)
+        self.assertEqual(get_watermark(1), datetime(2024, 1, 2, tzinfo=dt_timezone.utc))
+        tx_state = SyncState.objects.get(spot_id=1, dataset=SyncState.TRANSACTIONS)
+        self.assertEqual((tx_state.rows, tx_state.total_rows, tx_state.status), (1, 1, SyncState.STATUS_OK))
+
+        sync_day(self.api_client, "2024-01-03", 1)
+
+        self.assertEqual(get_watermark(1), datetime(2024, 1, 2, tzinfo=dt_timezone.utc))
+        tx_state.refresh_from_db()
+        self.assertEqual(tx_state.last_window_start, datetime(2024, 1, 3, tzinfo=dt_timezone.utc))
+
+        sync_day(self.api_client, "2024-01-02", 1)
+
+        self.assertEqual(get_watermark(1), datetime(2024, 1, 3, tzinfo=dt_timezone.utc))
+        self.assertIsNone(get_watermark(2))
+
+    def test_failed_stage_keeps_watermark(self):
+        sync_day(self.api_client, "2024-01-01", 1)
+        self.api_client.get_transactions.side_effect = Exception("API down")
+
+        with self.assertRaises(Exception):
+            sync_day(self.api_client, "2024-01-02", 1)
+
+        state = SyncState.objects.get(spot_id=1, dataset=SyncState.TRANSACTIONS)
+        self.assertEqual((state.status, state.error), (SyncState.STATUS_FAILED, "API down"))
+        self.assertEqual(state.watermark, datetime(2024, 1, 2, tzinfo=dt_timezone.utc))
+
+    @patch("poster_api.services.sync.save_shift_sales", side_effect=Exception("Bad payload"))
+    def test_failed_write_stage_keeps_committed_stages(self, mock_save_shift_sales):
+        self.api_client.get_transactions.return_value = [self._tx(1, "2024-01-01 12:00:00")]
+
+        with self.assertRaises(StageError):
+            sync_day(self.api_client, "2024-01-01", 1, max_workers=1)
+
+        self.assertTrue(Transactions.objects.filter(transaction_id=1).exists())
+        states = dict(SyncState.objects.filter(spot_id=1).values_list('dataset', 'status'))
+        self.assertEqual(states[SyncState.CASH_SHIFTS], SyncState.STATUS_OK)
+        self.assertEqual(states[SyncState.SHIFT_SALES], SyncState.STATUS_FAILED)
+        self.assertIsNone(get_watermark(1))
+        self.assertIsNotNone(get_watermark(1, [SyncState.CASH_SHIFTS, SyncState.CLIENTS]))
+
+    def test_incremental_sync_skips_history_of_transactions_before_watermark(self):
+        self.api_client.get_transactions.return_value = [
+            self._tx(1, "2024-01-01 10:00:00"), self._tx(2, "2024-01-01 13:00:00"),
+        ]
+
+        sync_day(self.api_client, "2024-01-01", 1, since=datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(Transactions.objects.count(), 2)
+        self.api_client.get_transactions_products.assert_called_once_with([2])
+        self.api_client.make_request.assert_called_once_with(
+            "GET", "dash.getTransactionHistory", params={"transaction_id": 2}
+        )
+
+    def test_history_batches_saved_before_a_failure_are_kept(self):
+        self.api_client.get_transactions.return_value = [self._tx(tx_id, "2024-01-01 12:00:00") for tx_id in (1, 2, 3)]
+        self.api_client.make_request.side_effect = lambda method, endpoint, params: {"response": [
+            {"type_history": "open", "time": "2024-01-01 11:00:00", "value": params["transaction_id"]},
+        ]}
+        batches = []
+
+        def save_then_fail(batch):
+            batches.append(batch)
+            if len(batches) > 1:
+                raise Exception("Connection lost")
+            return save_transaction_histories(batch)
+
+        with patch("poster_api.services.saving.HISTORY_BATCH_SIZE", 1), \
+                patch("poster_api.services.saving.save_transaction_histories", side_effect=save_then_fail):
+            with self.assertRaises(StageError):
+                sync_day(self.api_client, "2024-01-01", 1, max_workers=1)
+
+        self.assertEqual(TransactionHistory.objects.count(), 1)
+        state = SyncState.objects.get(spot_id=1, dataset=SyncState.TRANSACTIONS)
+        self.assertEqual((state.status, state.error), (SyncState.STATUS_FAILED, "Connection lost"))
+
+    def test_failed_history_holds_the_watermark_and_is_retried(self):
+        self.api_client.get_transactions.return_value = [self._tx(1, "2024-01-01 12:00:00"), self._tx(2, "2024-01-01 13:00:00")]
+        close = {"type_history": "close", "time": "2024-01-01 12:00:00", "value_text": '{"payment_method_id": "2"}'}
+        self.api_client.make_request.side_effect = lambda method, endpoint, params: (
+            {"error": "timeout"} if params["transaction_id"] == 2 else {"response": [close]}
+        )
+
+        with self.assertRaises(StageError):
+            sync_day(self.api_client, "2024-01-01", 1, max_workers=1)
+
+        self.assertEqual(list(TransactionHistory.objects.values_list('transaction__transaction_id', flat=True)), [1])
+        self.assertIsNone(get_watermark(1, [SyncState.TRANSACTIONS]))
+
+        self.api_client.make_request.side_effect = lambda method, endpoint, params: {"response": [close]}
+        sync_day(self.api_client, "2024-01-01", 1, since=get_watermark(1, [SyncState.TRANSACTIONS]), max_workers=1)
+
+        self.assertEqual(TransactionHistory.objects.filter(transaction__transaction_id=2).count(), 1)
+        self.assertEqual(get_watermark(1, [SyncState.TRANSACTIONS]), datetime(2024, 1, 2, tzinfo=dt_timezone.utc))
+
+    def test_sync_all_from_date_runs_in_bounded_windows(self):
+        self.assertEqual(list(iter_windows(date(2024, 1, 1), date(2024, 1, 10), 4)), [
+            (date(2024, 1, 1), date(2024, 1, 4)), (date(2024, 1, 5), date(2024, 1, 8)),
+            (date(2024, 1, 9), date(2024, 1, 10)),
+        ])
+        start = date.today() - timedelta(days=9)
+
+        peak = sync_all_from_date(self.api_client, start.isoformat(), 1, sync_static=False, window_days=4)
+
+        fetched = [c.args[:2] for c in self.api_client.get_transactions.call_args_list]
+        self.assertEqual([date.fromisoformat(d) for d, _ in fetched],
+                         [start, start + timedelta(days=4), start + timedelta(days=8)])
+        self.assertEqual(date.fromisoformat(fetched[-1][1]), date.today())
+        self.assertEqual(self.api_client.get_sales_by_shift_with_delivery.call_count, 10)
+        self.assertGreater(peak, 0)
+        self.assertEqual(SyncState.objects.get(spot_id=1, dataset=SyncState.TRANSACTIONS).total_rows, 0)
+        self.assertIsNotNone(get_watermark(1))
+
+    def test_sync_day_shares_history_with_shift_sales(self):
+        self.api_client.get_transactions.return_value = [self._tx(1, "2024-01-01 12:00:00")]
+        histories = HistoryFetchContext(self.api_client)
+
+        def shift_sales(date_str, spot_id, histories):
+            self.assertEqual((histories.get_many(["1"])[1].payment_method_id, histories.requested), (None, 1))
+            return {}
+        self.api_client.get_sales_by_shift_with_delivery = MagicMock(side_effect=shift_sales)
+
+        sync_day(self.api_client, "2024-01-01", 1, histories=histories)
+
+        self.api_client.make_request.assert_called_once_with(
+            "GET", "dash.getTransactionHistory", params={"transaction_id": 1}
+        )
+        self.assertEqual(histories.requested, 1)
+
+
+class SyncLeaseTestCase(TestCase):
+    """Tests for the (spot, day, dataset) leases that keep concurrent syncs apart."""
+
+    def setUp(self):
+        self.day = date(2024, 1, 1)
+        self.keys = lease_keys(1, [self.day], [SyncState.TRANSACTIONS, SyncState.CLIENTS])
+
+    def test_acquire_is_exclusive_and_all_or_nothing(self):
+        self.assertTrue(acquire_leases(self.keys[:1], "worker-a"))
+        self.assertFalse(acquire_leases(self.keys, "worker-b"))
+        # worker-b didn't keep the lease it could take.
+        self.assertEqual(list(SyncLease.objects.values_list('owner', flat=True)), ["worker-a"])
+
+        self.assertTrue(acquire_leases(self.keys, "worker-a"))
+        release_leases(self.keys, "worker-b")
+        self.assertEqual(SyncLease.objects.filter(owner="worker-a").count(), 2)
+        release_leases(self.keys, "worker-a")
+        self.assertTrue(acquire_leases(self.keys, "worker-b"))
+
+    def test_expired_lease_is_taken_over(self):
+        acquire_leases(self.keys, "crashed-worker")
+        self.assertFalse(acquire_leases(self.keys, "worker-b"))
+
+        SyncLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(acquire_leases(self.keys, "worker-b"))
+        self.assertEqual(set(SyncLease.objects.values_list('owner', flat=True)), {"worker-b"})
+
+    def test_hold_leases_releases_on_exit(self):
+        with hold_leases(self.keys) as owner:
+            self.assertEqual(SyncLease.objects.filter(owner=owner).count(), 2)
+            with self.assertRaises(LeaseHeld):
+                with hold_leases(self.keys[1:]):
+                    pass
+        self.assertFalse(SyncLease.objects.exists())
+
+    def test_sync_day_and_backfill_skip_leased_day(self):
+        api_client = MagicMock()
+        acquire_leases(lease_keys(1, [self.day], [SyncState.SHIFT_SALES]), "other-node")
+
+        with self.assertRaises(LeaseHeld):
+            sync_day(api_client, "2024-01-01", 1)
+        api_client.get_transactions.assert_not_called()
+        self.assertFalse(SyncState.objects.exists())
+
+        self.assertEqual(run_unit(api_client, BackfillUnit(self.day, 1)), CLAIMED_ELSEWHERE)
+        self.assertFalse(BackfillCheckpoint.objects.exists())
+
+        BackfillCheckpoint.objects.create(date=self.day, spot_id=2, status=BackfillCheckpoint.STATUS_DONE)
+        self.assertEqual(run_unit(api_client, BackfillUnit(self.day, 2)), CLAIMED_ELSEWHERE)
+
+
+class MultiSpotSyncTestCase(TestCase):
+    """Tests for syncing several spots in one run."""
+
+    def test_save_spots_and_resolve_spot_ids(self):
+        api_client = MagicMock()
+        api_client.get_spots.return_value = [
+            {"spot_id": "2", "spot_name": "Second", "spot_address": None},
+            {"spot_id": 1, "spot_name": "Main", "spot_address": "Street 1"},
+        ]
+
+        self.assertEqual(resolve_spot_ids("all", api_client), [1, 2])
+        self.assertEqual(resolve_spot_ids("3, 1,3"), [3, 1])
+        with self.assertRaises(ValueError):
+            resolve_spot_ids("1,x")
+
+        self.assertEqual(save_spots([{"spot_id": 2, "spot_name": "Renamed", "spot_address": ""}, {"name": "?"}]), 1)
+        self.assertEqual(Spot.objects.get(spot_id=2).spot_name, "Renamed")
+        self.assertEqual(resolve_spot_ids("ALL", api_client), [1, 2])
+        api_client.get_spots.assert_called_once()
+
+    def test_run_per_spot_reports_each_spot(self):
+        def pipeline(spot_id):
+            if spot_id == 2:
+                raise ValueError("spot 2 is down")
+            return spot_id * 10
+        reported = []
+
+        results = run_per_spot([1, 2, 3], pipeline, max_parallel=2, on_spot=lambda r: reported.append(r.spot_id))
+
+        self.assertEqual([(r.spot_id, r.result, r.error) for r in results],
+                         [(1, 10, None), (2, None, "spot 2 is down"), (3, 30, None)])
+        self.assertEqual(sorted(reported), [1, 2, 3])
+
+    @patch("poster_api.management.commands.sync_daily_data.sync_day")
+    @patch("poster_api.management.commands.sync_daily_data.sync_static_data")
+    def test_sync_daily_data_syncs_static_once_for_all_spots(self, mock_static, mock_sync_day):
+        Spot.objects.create(spot_id=1)
+        Spot.objects.create(spot_id=2)
+        mock_sync_day.side_effect = lambda api_client, day, spot_id, **kwargs: 0
+
+        call_command("sync_daily_data", "--date", "2024-01-01", "--spots", "all", "--parallel", "1",
+                     "--skip-salary", stdout=MagicMock(), stderr=MagicMock())
+
+        mock_static.assert_called_once()
+        self.assertEqual(sorted(c.args[1:3] for c in mock_sync_day.call_args_list),
+                         [("2024-01-01", 1), ("2024-01-01", 2)])
+
+
 class PosterApiViewsTest(APITestCase):
     """Tests for Poster API ViewSets using reverse() to match urls.py."""
 
@@ -979,4 +1616,284 @@ class PosterApiViewsTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         data = response.data[0]
-        self.assertEqual(data['spot_name'], "Main Spot")
\ No newline at end of file
+        self.assertEqual(data['spot_name'], "Main Spot")
+
+    def test_sales_report_rolls_up_local_facts(self):
+        other = Product.objects.create(product_id=101, product_name="Fries", category=self.category)
+        for day, spot, product, count, profit in [
+            (date(2025, 10, 1), 1, self.product, 2, "100.00"),
+            (date(2025, 10, 2), 1, self.product, 3, "150.00"),
+            (date(2025, 10, 2), 2, self.product, 1, "50.00"),
+            (date(2025, 10, 2), 1, other, 4, "40.00"),
+            (date(2025, 10, 5), 1, self.product, 9, "450.00"),
+        ]:
+            ProductSales.objects.create(date=day, spot_id=spot, product=product, count=count, product_profit=profit)
+        url = reverse('sales_report-products')
+
+        response = self.client.get(url, {"dateFrom": "2025-10-01", "dateTo": "2025-10-02", "spot_id": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r["product_id"], r["count"], r["profit"]) for r in response.data],
+            [(100, Decimal("5.00"), Decimal("250.00")), (101, Decimal("4.00"), Decimal("40.00"))],
+        )
+
+        response = self.client.get(url, {"dateFrom": "2025-10-01", "dateTo": "2025-10-05", "group_by": "day"})
+        self.assertEqual([(r["day"], r["profit"]) for r in response.data], [
+            (date(2025, 10, 1), Decimal("100.00")),
+            (date(2025, 10, 2), Decimal("240.00")),
+            (date(2025, 10, 5), Decimal("450.00")),
+        ])
+
+        response = self.client.get(url, {"dateFrom": "2025-10-01", "group_by": "category"})
+        self.assertEqual(response.data, [
+            {"category_id": 1, "category_name": "Test Cat", "count": Decimal("2.00"), "profit": Decimal("100.00")},
+        ])
+
+    def test_sales_report_categories(self):
+        drinks = Category.objects.create(category_id=2, category_name="Drinks")
+        CategoriesSales.objects.create(date=date(2025, 10, 1), spot_id=1, category=self.category, count=2, profit="30.00")
+        CategoriesSales.objects.create(date=date(2025, 10, 2), spot_id=2, category=self.category, count=1, profit="20.00")
+        CategoriesSales.objects.create(date=date(2025, 10, 2), spot_id=1, category=drinks, count=5, profit="80.00")
+
+        response = self.client.get(reverse('sales_report-categories'), {"dateFrom": "2025-10-01", "dateTo": "2025-10-02"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(r["category_name"], r["profit"]) for r in response.data],
+                         [("Drinks", Decimal("80.00")), ("Test Cat", Decimal("50.00"))])
+
+        response = self.client.get(reverse('sales_report-categories'),
+                                   {"dateFrom": "2025-10-01", "dateTo": "2025-10-02", "group_by": "spot"})
+        self.assertEqual([(r["spot_id"], r["count"]) for r in response.data],
+                         [(1, Decimal("7.00")), (2, Decimal("1.00"))])
+
+    def test_sales_report_validates_params(self):
+        url = reverse('sales_report-categories')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"dateFrom": "2025-10-01", "group_by": "product"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "EXPLAIN checks need Postgres (set TEST_DATABASE_URL).")
+class QueryPlanRegressionTest(APITestCase):
+    """
+    Runs the real view/saver/salary code paths against large seeded tables and
+    EXPLAINs every SELECT they issue. A sequential scan on a seeded table means
+    a hot lookup lost its index.
+    """
+    ROWS = 20000
+    LARGE_TABLES = {
+        Transactions._meta.db_table,
+        TransactionHistory._meta.db_table,
+        Clients._meta.db_table,
+        ShiftSale._meta.db_table,
+        ShiftSaleItem._meta.db_table,
+        Shift._meta.db_table,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        base = datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        n = cls.ROWS
+
+        Transactions.objects.bulk_create(
+            [
+                Transactions(
+                    transaction_id=i,
+                    date_start=base + timedelta(minutes=30 * i),
+                    date_close=base + timedelta(minutes=30 * i + 20),
+                    spot_id=1 + i % 2,
+                )
+                for i in range(1, n + 1)
+            ],
+            batch_size=5000,
+        )
+        tx_pks = list(Transactions.objects.values_list('id', flat=True))
+        TransactionHistory.objects.bulk_create(
+            [
+                TransactionHistory(transaction_id=pk, type_history=kind, time=base + timedelta(seconds=pk))
+                for pk in tx_pks for kind in ('open', 'close')
+            ],
+            batch_size=5000,
+        )
+        Clients.objects.bulk_create(
+            [Clients(client_id=i, name=f"Client {i}") for i in range(1, n + 1)],
+            batch_size=5000,
+        )
+
+        sales = ShiftSale.objects.bulk_create(
+            [ShiftSale(shift_id=i, date=base.date() + timedelta(days=i)) for i in range(1, n // 4 + 1)],
+            batch_size=5000,
+        )
+        ShiftSaleItem.objects.bulk_create(
+            [
+                ShiftSaleItem(shift_sale=sale, product_name=f"P{k}", category_name=cat, workshop="1")
+                for sale in sales for k, cat in enumerate(('regular', 'regular', 'delivery', 'delivery'))
+            ],
+            batch_size=5000,
+        )
+        Shift.objects.bulk_create(
+            [Shift(shift_id=i, date=base.date() + timedelta(days=i)) for i in range(1, n // 4 + 1)],
+            batch_size=5000,
+        )
+
+        with connection.cursor() as cursor:
+            for table in cls.LARGE_TABLES:
+                cursor.execute(f'ANALYZE "{table}"')
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def _seq_scans(self, plan):
+        found = []
+        if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in self.LARGE_TABLES:
+            found.append(plan['Relation Name'])
+        for child in plan.get('Plans', []):
+            found.extend(self._seq_scans(child))
+        return found
+
+    def assertNoSeqScans(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            func(*args, **kwargs)
+
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, "Code path issued no SELECTs to check.")
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                raw = cursor.fetchone()[0]
+                plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]['Plan']
+                scans = self._seq_scans(plan)
+                self.assertFalse(scans, f"Seq Scan on {scans} for query:\n{sql}")
+
+    def test_salary_aggregation_lookups(self):
+        shift = Shift.objects.get(shift_id=100)
+        self.assertNoSeqScans(aggregate_sales, shift)
+
+    def test_shift_sales_saver_lookups(self):
+        api_client = MagicMock()
+        api_client.get_sales_by_shift_with_delivery.return_value = {
+            "100": {"regular": [{"product_name": "P0", "payed_sum": "10", "profit": "1", "count": 1}], "delivery": []}
+        }
+        day = ShiftSale.objects.get(shift_id=100).date.strftime("%Y-%m-%d")
+        self.assertNoSeqScans(save_shift_sales_to_db, api_client, day)
+
+    def test_transaction_history_saver_lookups(self):
+        history = [{"type_history": "print", "time": "2024-01-01 12:00:00", "value": 1}]
+        self.assertNoSeqScans(save_transaction_history, 1234, history)
+
+    def test_clients_saver_lookups(self):
+        self.assertNoSeqScans(save_clients, [{"client_id": 4321, "firstname": "Ann", "name": "Ann"}])
+
+    def test_transactions_by_close_date_and_spot(self):
+        start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        self.assertNoSeqScans(
+            lambda: list(Transactions.objects.filter(date_close__range=(start, start + timedelta(days=1)), spot_id=1))
+        )
+
+    def test_shift_calendar_view_lookups(self):
+        self.assertNoSeqScans(self.client.get, reverse('shift-list'), {'month': 3, 'year': 2025})
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Partitioning needs Postgres (set TEST_DATABASE_URL).")
+class PartitioningTest(TestCase):
+    TODAY = date(2025, 2, 10)
+    FEBRUARY = datetime(2025, 2, 7, 11, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        category = Category.objects.create(category_id=1, category_name="Test")
+        Product.objects.create(product_id=50, product_name="Steak", category=category)
+        save_transactions([
+            {"transaction_id": i, "date_start": f"2025-0{m}-05 10:00:00", "date_close": f"2025-0{m}-05 11:00:00",
+             "reason": "", "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1, "processing_status": 10}
+            for i, m in [(1, 1), (2, 1), (3, 2)]
+        ])
+        save_transactions_products([{"transaction_id": i, "product_id": 50, "num": 1} for i in (1, 2, 3)])
+        save_transaction_history(1, [{"type_history": "open", "time": "2025-01-05 10:00:00", "value": 0}])
+        # Stored before the children tracked their parent's date_close.
+        TransactionHistory.objects.update(date_close=None)
+
+        with connection.cursor() as cursor:
+            partitioning.run_statements(partitioning.conversion_sql(cursor, months_ahead=1, today=self.TODAY))
+
+    def scanned_partitions(self, queryset):
+        plan = queryset.explain()
+        return {name for name in partitioning.list_partitions(connection.cursor(), queryset.model._meta.db_table)
+                if name in plan}
+
+    def test_conversion_keeps_rows_and_prunes_by_month(self):
+        with connection.cursor() as cursor:
+            status = partitioning.partition_status(cursor)
+        self.assertEqual(status["poster_api_transactions"], [
+            "poster_api_transactions_default", "poster_api_transactions_p202501",
+            "poster_api_transactions_p202502", "poster_api_transactions_p202503",
+        ])
+        self.assertEqual(TransactionsProducts.objects.count(), 3)
+        history = TransactionHistory.objects.get()
+        self.assertEqual(history.transaction.transaction_id, 1)
+        self.assertEqual(history.date_close, history.transaction.date_close)
+
+        january = Transactions.objects.filter(date_close__gte="2025-01-01", date_close__lt="2025-02-01")
+        self.assertEqual(january.count(), 2)
+        self.assertEqual(self.scanned_partitions(january), {"poster_api_transactions_p202501"})
+
+        lines = TransactionsProducts.objects.filter(date_close__gte="2025-02-01", date_close__lt="2025-03-01")
+        self.assertEqual(self.scanned_partitions(lines), {"poster_api_transactionsproducts_p202502"})
+
+    def test_savers_and_deletes_work_on_partitioned_tables(self):
+        save_transactions([{"transaction_id": 4, "date_start": "2025-02-06 10:00:00", "date_close": "2025-02-06 11:00:00",
+                            "reason": "", "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1, "processing_status": 10}])
+        save_transactions_products([{"transaction_id": i, "product_id": 50, "num": 2} for i in (1, 4)])
+
+        self.assertEqual(TransactionsProducts.objects.count(), 4)
+        self.assertEqual(TransactionsProducts.objects.get(transaction__transaction_id=1).num, 2)
+
+        Transactions.objects.get(transaction_id=1).delete()
+        self.assertFalse(TransactionHistory.objects.exists())
+        self.assertEqual(TransactionsProducts.objects.count(), 3)
+
+    def test_transaction_ids_stay_unique_across_partitions(self):
+        moved = {"transaction_id": 1, "date_start": "2025-02-07 10:00:00", "date_close": "2025-02-07 11:00:00",
+                 "reason": "", "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1, "processing_status": 10}
+
+        # A stale index lets the moved transaction through to the insert; the database drops it.
+        save_transactions([moved], known_ids=IdIndex())
+        Transactions.objects.bulk_create([Transactions(transaction_id=1, date_start=self.FEBRUARY,
+                                                       date_close=self.FEBRUARY)], ignore_conflicts=True)
+        self.assertEqual(Transactions.objects.filter(transaction_id=1).count(), 1)
+
+        second = Transactions.objects.get(transaction_id=2)
+        second.transaction_id = 1
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            second.save()
+
+        Transactions.objects.get(transaction_id=1).delete()
+        save_transactions([moved])
+        self.assertEqual(Transactions.objects.get(transaction_id=1).date_close, self.FEBRUARY)
+
+    def test_children_need_their_parents_date_close(self):
+        tx = Transactions.objects.get(transaction_id=3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TransactionHistory.objects.create(transaction=tx, type_history="open", time=tx.date_start)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TransactionHistory.objects.create(transaction=tx, type_history="open", time=tx.date_start,
+                                              date_close=self.FEBRUARY)
+
+    def test_create_ahead_and_detach_to_archive(self):
+        with connection.cursor() as cursor:
+            ahead = partitioning.ensure_partitions_sql(cursor, months_ahead=2, today=self.TODAY)
+            self.assertEqual(len(ahead), 3)
+            self.assertIn("_p202504", ahead[0])
+            partitioning.run_statements(ahead)
+            partitioning.run_statements(partitioning.detach_sql(cursor, date(2025, 2, 1), archive_schema="archive_test"))
+
+            self.assertEqual(Transactions.objects.count(), 1)
+            self.assertEqual(TransactionsProducts.objects.count(), 1)
+            cursor.execute('SELECT COUNT(*) FROM archive_test.poster_api_transactions_p202501')
+            self.assertEqual(cursor.fetchone()[0], 2)
+            self.assertNotIn("poster_api_transactions_p202501",
+                             partitioning.list_partitions(cursor, "poster_api_transactions"))
+
+        # The archived transactions' IDs are released.
+        save_transactions([{"transaction_id": 1, "date_start": "2025-02-07 10:00:00", "date_close": "2025-02-07 11:00:00",
+                            "reason": "", "status": 2, "pay_type": 1, "spot_id": 1, "service_mode": 1,
+                            "processing_status": 10}])
+        self.assertTrue(Transactions.objects.filter(transaction_id=1).exists())
@@ -4,6 +4,7 @@ from .views import (
     CashShiftViewSet,
     PaymentMethodsView,
     ProductViewSet,
+    SalesReportViewSet,
     ShiftSalesView,
     TransactionsHistoryViewSet,
     WorkshopViewSet,
@@ -18,6 +19,7 @@ router.register(r'payment_methods', PaymentMethodsView, basename='payment_method
 router.register(r'workshop', WorkshopViewSet, basename='workshop')
 router.register(r'products', ProductViewSet, basename='products')
 router.register(r'spots', SpotViewSet, basename='spots')
+router.register(r'sales_report', SalesReportViewSet, basename='sales_report')
 
 
 urlpatterns = [
@@ -1,5 +1,6 @@
 from datetime import datetime as dt
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from asgiref.sync import  async_to_sync
 from rest_framework.permissions import AllowAny
@@ -9,6 +10,7 @@ from django.views.decorators.cache import cache_page
 from .models import Product, ShiftSale, Spot, Workshop
 
 from .client import PosterAPIClient
+from .services.reports import category_sales_rollup, product_sales_rollup
 from .serializers import (
     CashShiftSerializer,
     PaymentMethodSerializer, 
@@ -204,6 +206,41 @@ class TransactionsHistoryViewSet(viewsets.ViewSet):
             return Response({"error": "Failed to fetch transactions"}, status=500)
 
 
+class SalesReportViewSet(viewsets.ViewSet):
+    """
+    Period sales reports built from the local daily sales facts
+    (`ProductSales` / `CategoriesSales`), without calling Poster.
+
+    Query Params:
+        dateFrom (str): The first day, 'YYYY-MM-DD'.
+        dateTo (str): The last day, 'YYYY-MM-DD'. Defaults to `dateFrom`.
+        spot_id (list[int], optional): Spots to include. Defaults to all.
+        group_by (str, optional): Grouping of the rollup, see the action.
+    """
+
+    def _rollup(self, request, rollup, default_group):
+        try:
+            date_from = dt.strptime(request.query_params["dateFrom"], "%Y-%m-%d").date()
+            date_to = dt.strptime(request.query_params.get("dateTo") or request.query_params["dateFrom"], "%Y-%m-%d").date()
+            spot_ids = [int(s) for s in request.query_params.getlist("spot_id")]
+            rows = rollup(date_from, date_to, spot_ids, request.query_params.get("group_by", default_group))
+        except KeyError:
+            return Response({"error": "dateFrom is required."}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(rows, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def products(self, request):
+        """Product sales over the period; group_by: product (default), category, day or spot."""
+        return self._rollup(request, product_sales_rollup, "product")
+
+    @action(detail=False, methods=["get"])
+    def categories(self, request):
+        """Category sales over the period; group_by: category (default), day or spot."""
+        return self._rollup(request, category_sales_rollup, "category")
+
+
 class PaymentMethodsView(viewsets.ViewSet):
     def list(self, request, *args, **kwargs):
         client = PosterAPIClient()
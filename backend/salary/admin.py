@@ -1,9 +1,11 @@
 from django.contrib import admin
 
 from .models import (
+    DirtyShift,
     SalaryRule, 
     SalaryRuleProduct, 
 )
 
 admin.site.register(SalaryRule)
-admin.site.register(SalaryRuleProduct)
\ No newline at end of file
+admin.site.register(SalaryRuleProduct)
+admin.site.register(DirtyShift)
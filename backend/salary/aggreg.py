@@ -1,77 +1,126 @@
 from collections import defaultdict
 from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
 import time
 import logging
 
+from django.db.models import Min, Sum
+from django.db.models.functions import Trim
+
 from shift.models import  Shift, ShiftEmployee
-from salary.models import SalaryRule, SalaryRuleProduct
+from salary.rule_index import SalaryRuleIndex, get_rule_index
+from salary.trace import TRACE_SAMPLE_RATE, CalculationTrace, start_trace
 from poster_api.models import ShiftSale, ShiftSaleItem
 
 logger = logging.getLogger(__name__)
 
-def aggregate_sales(shift: Shift):
-    start_total = time.time()
-    logger.info(f"=== Starting salary aggregation for shift {shift.id} (Date: {shift.date}) ===")
 
-    try:
-        shift_sale = ShiftSale.objects.get(shift_id=shift.shift_id)
-    except ShiftSale.DoesNotExist:
-        logger.error(f"ShiftSale not found for shift_id {shift.shift_id}. Calculation impossible.")
+def aggregate_sales_for_shifts(shifts: Iterable[Shift], index: Optional[SalaryRuleIndex] = None,
+                               trace: Optional[float] = None) -> Dict[int, dict]:
+    """
+    Calculates the salaries of several shifts at once.
+
+    The compiled rule index is fetched once (see `get_rule_index`). The
+    sales of all shifts are summed per (workshop, product) by the database,
+    and the employee assignments loaded in one query; every shift is then
+    calculated in memory, exactly as `aggregate_sales` does for one shift.
+
+    Args:
+        shifts: The shifts to calculate.
+        index: A rule snapshot to calculate with instead of the current index.
+        trace: The fraction of shifts to trace (see `salary.trace`), 1 for
+            all of them; defaults to `TRACE_SAMPLE_RATE`. The results of a
+            traced shift carry its trace under "trace".
+
+    Returns:
+        dict: {shift id: the `aggregate_sales` result of the shift}; shifts
+        without a ShiftSale map to an empty dict.
+    """
+    shifts = list(shifts)
+    if not shifts:
         return {}
 
-    sales_qs = ShiftSaleItem.objects.filter(
-        shift_sale=shift_sale,
-        category_name='regular'
-    )
-    logger.info(f"Found sales records (regular): {sales_qs.count()} "
-                f"for ShiftSale {shift_sale.id}")
-
-    sales_agg = defaultdict(lambda: {'sum': Decimal(0), 'count': Decimal(0)})
-    workshop_revenue_check = defaultdict(Decimal)
-    
-    for s in sales_qs:
-        key = (s.workshop, s.product_name.strip())
-        sale_sum = Decimal(s.payed_sum)
-        sales_agg[key]['sum'] += sale_sum
-        sales_agg[key]['count'] += Decimal(s.count)
-        workshop_revenue_check[s.workshop] += sale_sum
-
-    logger.info(f"Aggregated {len(sales_agg)} unique keys (workshop+product)")
-    
-    logger.info("--- WORKSHOP REVENUE CHECK (before applying rules) ---")
-    for w_id, total_sum in workshop_revenue_check.items():
-        logger.info(f"    Workshop ID {w_id}: Total revenue = {total_sum:.2f}")
-    logger.info("------------------------------------------------------")
-
-    role_rules = SalaryRule.objects.prefetch_related('workshops', 'role').all()
-    
-    all_srp = SalaryRuleProduct.objects.select_related('product').all()
-
-    srp_map = defaultdict(dict)
-    for srp in all_srp:
-        srp_map[srp.salary_rule_id][srp.product.product_name.strip()] = Decimal(srp.fixed or 0)
-
-    logger.info(f"Total salary rules loaded: {len(role_rules)}")
-    logger.info(f"Total bonus products loaded: {len(all_srp)}")
-
-    shift_employees = ShiftEmployee.objects.filter(
-        shift=shift
+    sales = load_sales(shifts)
+
+    employees_by_shift = defaultdict(list)
+    for se in ShiftEmployee.objects.filter(
+        shift_id__in=[shift.id for shift in shifts]
     ).select_related(
-        "employee", 
-        "role", 
+        "employee",
+        "role",
         "role__pay_group"
-    )
+    ).order_by('pk'):
+        employees_by_shift[se.shift_id].append(se)
+
+    if index is None:
+        index = get_rule_index()
+    sample = TRACE_SAMPLE_RATE if trace is None else trace
+
+    started = time.time()
+    results = {}
+    for shift in shifts:
+        if shift.shift_id not in sales:
+            logger.error(f"ShiftSale not found for shift_id {shift.shift_id}. Calculation impossible.")
+            results[shift.id] = {}
+            continue
+        shift_sale, sales_agg = sales[shift.shift_id]
+        results[shift.id] = _calculate_shift(
+            shift, shift_sale, sales_agg, employees_by_shift[shift.id], index,
+            start_trace(shift, sample, index.version) if sample else None,
+        )
+    logger.debug("[aggregate_sales_for_shifts] %d shifts calculated in %.3f sec.", len(shifts), time.time() - started)
+    return results
+
+
+def load_sales(shifts: Iterable[Shift]) -> Dict[int, Tuple[ShiftSale, Dict[tuple, dict]]]:
+    """
+    Loads the regular sales of several shifts, summed per (workshop, product) by the database.
+
+    Returns:
+        dict: {Poster shift id: (its ShiftSale, {(Poster workshop ID, Poster product ID):
+        {'sum', 'count', 'name'}})}; shifts without a ShiftSale are left out.
+    """
+    shift_sales = {}
+    for shift_sale in ShiftSale.objects.filter(
+        shift_id__in=[shift.shift_id for shift in shifts if shift.shift_id is not None]
+    ).order_by('pk'):
+        shift_sales.setdefault(shift_sale.shift_id, shift_sale)
+
+    sales_by_sale = defaultdict(dict)
+    for row in ShiftSaleItem.objects.filter(
+        shift_sale_id__in=[shift_sale.id for shift_sale in shift_sales.values()],
+        category_name='regular'
+    ).values('shift_sale_id', 'workshop_id', 'product_id').annotate(
+        total_sum=Sum('payed_sum'), total_count=Sum('count'), name=Min(Trim('product_name'))
+    ).order_by('shift_sale_id', 'workshop_id', 'product_id'):
+        sales_by_sale[row['shift_sale_id']][(row['workshop_id'], row['product_id'])] = {
+            'sum': row['total_sum'], 'count': row['total_count'], 'name': row['name']
+        }
+
+    return {
+        poster_shift_id: (shift_sale, sales_by_sale[shift_sale.id])
+        for poster_shift_id, shift_sale in shift_sales.items()
+    }
+
+
+def aggregate_sales(shift: Shift, trace: Optional[float] = None):
+    """Calculates the salaries of one shift; see `aggregate_sales_for_shifts` for several."""
+    return aggregate_sales_for_shifts([shift], trace=trace)[shift.id]
+
+
+def _calculate_shift(shift: Shift, shift_sale: ShiftSale, sales_agg: Dict[tuple, dict],
+                     shift_employees: List[ShiftEmployee], index: SalaryRuleIndex,
+                     trace: Optional[CalculationTrace] = None) -> dict:
+    # Runs for every shift of a month: nothing is formatted here unless the shift is traced.
+    if trace is not None:
+        trace.inputs(sales_agg, shift_employees)
 
     employees_by_role_id = defaultdict(list)
     employees_by_pay_group = defaultdict(list) 
-    role_map = {}
 
     for se in shift_employees:
         employees_by_role_id[se.role_id].append(se.employee)
         
-        if se.role_id not in role_map:
-            role_map[se.role_id] = se.role
-        
         pay_group_id = se.role.pay_group_id
         
         if pay_group_id:
@@ -79,18 +128,11 @@ def aggregate_sales(shift: Shift):
         else:
             employees_by_pay_group[f"role_{se.role_id}"].append(se)
 
-    logger.info(f"Employees on shift: {len(shift_employees)}")
-    for role_id, emps in employees_by_role_id.items():
-        role_name = role_map[role_id].name
-        emp_names = [e.name for e in emps]
-        logger.info(f"Role {role_id} ({role_name}): {len(emps)} empl. -> {emp_names}")
-
     result = {}
     for role_id, employees in employees_by_role_id.items():
-        role_rule_list = [r for r in role_rules if r.role_id == role_id]
-        
+        fixed_per_shift = index.fixed_by_role.get(role_id, 0)
+
         for emp in employees:
-            fixed_per_shift = sum(Decimal(r.fixed_per_shift or 0) for r in role_rule_list)
             
             result[emp.id] = {
                 "employee": emp,
@@ -99,9 +141,6 @@ def aggregate_sales(shift: Shift):
                 "percent_total": Decimal(0),
                 "fixed_bonus_total": Decimal(0),
             }
-            logger.info(f"Employee {emp.name} (ID {emp.id}) "
-                        f"received fixed {fixed_per_shift} -> "
-                        f"total_salary={fixed_per_shift}")
 
     for group_key, shift_employees_in_group in employees_by_pay_group.items():
         
@@ -110,50 +149,46 @@ def aggregate_sales(shift: Shift):
         bonus_breakdown_map = defaultdict(lambda: {'count': Decimal(0), 'total': Decimal(0)})
 
         role_ids_in_group = {se.role_id for se in shift_employees_in_group}
-        rules_for_this_group = [r for r in role_rules if r.role_id in role_ids_in_group]
+        rules_for_this_group = index.group_rules(role_ids_in_group)
         
         if not rules_for_this_group:
             continue
 
-        group_name = f"Role {role_ids_in_group}"
-        if isinstance(group_key, int):
-            first_role = role_map[list(role_ids_in_group)[0]]
-            if first_role.pay_group:
-                group_name = f"PayGroup '{first_role.pay_group.name}'"
+        group_trace = None
+        if trace is not None:
+            group_trace = trace.group(group_key, role_ids_in_group, rules_for_this_group,
+                                      [se.employee_id for se in shift_employees_in_group])
 
-        logger.info(f"--- Calculation for group: {group_name} (Key: {group_key}) ---")
-        logger.info(f"    Employees in group: {[se.employee.name for se in shift_employees_in_group]}")
-        logger.info(f"    Active rules: {[r.id for r in rules_for_this_group]}")
-        
-        prepped_rules = []
-        for r in rules_for_this_group:
-            prepped_rules.append({
-                'rule': r,
-                'percent': Decimal(r.percent or 0) / 100,
-                'workshops': {w.id for w in r.workshops.all()},
-                'bonus_products': srp_map.get(r.id, {})
-            })
-
-        for (w_id_str, product_name), sale_data in sales_agg.items():
-            try:
-                w_id_int = int(w_id_str) 
-            except (ValueError, TypeError):
+        group_rule_ids = set(rules_for_this_group)
+        # The group's rules on each workshop, resolved once per workshop.
+        workshop_rules = {}
+
+        for (w_id_int, product_id), sale_data in sales_agg.items():
+            if w_id_int is None:
+                continue
+
+            if w_id_int not in workshop_rules:
+                workshop_rules[w_id_int] = [
+                    (rule_id, percent) for rule_id, percent in index.by_workshop.get(w_id_int, ())
+                    if rule_id in group_rule_ids
+                ]
+            rules_on_workshop = workshop_rules[w_id_int]
+            if not rules_on_workshop:
                 continue
 
             product_sum = sale_data["sum"]
             item_count = sale_data["count"]
+            product_name = sale_data["name"]
+            product_bonuses = index.bonuses.get(product_id, {})
 
             count_added_to_breakdown = False
 
-            for p_rule in prepped_rules:
-                
-                if w_id_int not in p_rule['workshops']:
-                    continue
-                
-                if p_rule['percent'] > 0:
-                    total_percent_for_group += product_sum * p_rule['percent']
+            for rule_id, percent in rules_on_workshop:
+                percent_amount = product_sum * percent if percent > 0 else Decimal(0)
+                total_percent_for_group += percent_amount
 
-                bonus_per_item = p_rule['bonus_products'].get(product_name, Decimal(0))
+                bonus_per_item = product_bonuses.get(rule_id, Decimal(0))
+                total_bonus_for_product = Decimal(0)
                 
                 if bonus_per_item > 0:
                     total_bonus_for_product = item_count * bonus_per_item
@@ -167,27 +202,20 @@ def aggregate_sales(shift: Shift):
                     
                     breakdown['total'] += total_bonus_for_product
 
-        logger.info(f"--- Total for group {group_name}: "
-                    f"Accrued % = {total_percent_for_group:.2f}. "
-                    f"Accrued bonuses = {total_bonus_for_group:.2f} ---")
-        
+                if group_trace is not None and (percent_amount or total_bonus_for_product):
+                    trace.hit(group_trace, w_id_int, product_id, rule_id, percent_amount, total_bonus_for_product)
+
         if total_percent_for_group > 0 or total_bonus_for_group > 0:
             
             splitting_employees_list = [se.employee for se in shift_employees_in_group]
             num_to_split_between = len(splitting_employees_list)
 
+            if group_trace is not None:
+                trace.split(group_trace, total_percent_for_group, total_bonus_for_group, num_to_split_between)
+
             if num_to_split_between == 0:
                 continue
 
-            # if isinstance(group_key, int):
-            #     logger.info(f" PayGroup: splitting pot {num_to_split_between} times.")
-            #     total_percent_for_group = total_percent_for_group / num_to_split_between
-            #     total_bonus_for_group = total_bonus_for_group / num_to_split_between
-            #     for product_name in bonus_breakdown_map:
-            #          bonus_breakdown_map[product_name]['total'] /= num_to_split_between
-            # else:
-            #     logger.info(f" Standard role.")
-
             percent_per_employee = total_percent_for_group / num_to_split_between
             bonus_per_employee = total_bonus_for_group / num_to_split_between
             
@@ -195,10 +223,6 @@ def aggregate_sales(shift: Shift):
                 {'product_name': name, 'count': data['count'], 'total': data['total']}
                 for name, data in bonus_breakdown_map.items()
             ]
-            
-            logger.info(f"  Splitting {total_percent_for_group:.2f} % and {total_bonus_for_group:.2f} bonuses "
-                        f"among {num_to_split_between} people = "
-                        f"{percent_per_employee:.2f} / {bonus_per_employee:.2f} each.")
 
             for emp in splitting_employees_list:
                 emp_key = emp.id
@@ -209,22 +233,9 @@ def aggregate_sales(shift: Shift):
                 result[emp_key]["details"]["percent"] = result[emp_key]["percent_total"]
                 result[emp_key]["details"]["bonus"] = result[emp_key]["fixed_bonus_total"]
                 result[emp_key]["details"]["bonus_breakdown"] = final_bonus_breakdown
-                
-                logger.info(
-                    f"  -> Employee {emp.name} (ID {emp.id}): "
-                    f"accrued {percent_per_employee:.2f} + {bonus_per_employee:.2f}"
-                )
-    
-    logger.info("--- FINAL CALCULATION BY EMPLOYEES ---")
-    for emp_id, data in result.items():
-        total = data["total_salary"]
-        logger.info(
-            f"RESULT Employee {data['employee'].name} (ID {emp_id}): "
-            f"fixed {data['details'].get('fixed', 0):.2f}, "
-            f"percent {data['percent_total']:.2f}, "
-            f"bonus {data['fixed_bonus_total']:.2f} -> "
-            f"TOTAL {total:.2f}"
-        )
 
-    logger.info(f"=== End of aggregation for shift {shift.id} (time: {round(time.time()-start_total, 2)} sec) ===")
+    if trace is not None:
+        shift_trace = trace.as_dict()
+        for data in result.values():
+            data["trace"] = shift_trace
     return result
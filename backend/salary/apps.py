@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SalaryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'salary'
+
+    def ready(self):
+        # Connects the receivers that invalidate the compiled rule index.
+        from . import signals  # noqa: F401
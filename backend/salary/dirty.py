@@ -0,0 +1,113 @@
+import logging
+from datetime import date
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from poster_api.models import ShiftSale, ShiftSaleItem
+from shift.models import Shift
+from .models import DirtyShift
+from .services import calculate_and_save_salaries
+
+logger = logging.getLogger(__name__)
+
+# Dirty shifts recalculated together by `recalculate_dirty_shifts`.
+DIRTY_BATCH_SIZE = 200
+
+
+def mark_shifts_dirty(shift_ids: Iterable[int], reason: str) -> int:
+    """
+    Marks shifts for recalculation; marking a dirty shift again moves its mark forward.
+
+    Shifts deleted in the meantime are ignored.
+
+    Returns:
+        int: The number of shifts marked.
+    """
+    shift_ids = set(Shift.objects.filter(id__in=set(shift_ids)).values_list('id', flat=True))
+    if not shift_ids:
+        return 0
+    now = timezone.now()
+    DirtyShift.objects.bulk_create(
+        [DirtyShift(shift_id=shift_id, reason=reason, marked_at=now) for shift_id in shift_ids],
+        update_conflicts=True,
+        unique_fields=['shift'],
+        update_fields=['reason', 'marked_at'],
+    )
+    logger.info(f"[mark_shifts_dirty] {len(shift_ids)} shifts marked ({reason}).")
+    return len(shift_ids)
+
+
+def mark_poster_shifts_dirty(poster_shift_ids: Iterable[int], reason: str = DirtyShift.REASON_SALES) -> int:
+    """Marks the shifts of the given Poster shift IDs, e.g. after their sales were saved."""
+    return mark_shifts_dirty(
+        Shift.objects.filter(shift_id__in=set(poster_shift_ids)).values_list('id', flat=True), reason
+    )
+
+
+def shifts_touched_by(role_ids: Iterable[int], workshop_ids: Iterable[int] = (),
+                      product_ids: Iterable[int] = (), all_role_shifts: bool = False) -> Set[int]:
+    """
+    The shifts a rule change can alter: shifts staffed with one of `role_ids`.
+
+    Unless `all_role_shifts` is set (e.g. for a fixed pay per shift), only
+    shifts with regular sales in one of the Poster `workshop_ids` or of one
+    of the Poster `product_ids` are included.
+    """
+    shifts = Shift.objects.filter(shiftemployee__role_id__in=set(role_ids))
+    if not all_role_shifts:
+        workshop_ids, product_ids = set(workshop_ids), set(product_ids)
+        if not workshop_ids and not product_ids:
+            return set()
+        items = ShiftSaleItem.objects.filter(category_name='regular').filter(
+            Q(workshop_id__in=workshop_ids) | Q(product_id__in=product_ids)
+        )
+        shifts = shifts.filter(
+            shift_id__in=ShiftSale.objects.filter(id__in=items.values('shift_sale_id')).values('shift_id')
+        )
+    return set(shifts.values_list('id', flat=True))
+
+
+def _dirty_shifts(date_from: Optional[date] = None, date_to: Optional[date] = None):
+    dirty = Shift.objects.filter(salary_dirty__isnull=False)
+    if date_from:
+        dirty = dirty.filter(date__gte=date_from)
+    if date_to:
+        dirty = dirty.filter(date__lte=date_to)
+    return dirty
+
+
+def dirty_shift_count(date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+    """The number of dirty shifts, optionally between `date_from` and `date_to`."""
+    return _dirty_shifts(date_from, date_to).count()
+
+
+def recalculate_dirty_shifts(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                             on_shift: Optional[Callable] = None) -> Tuple[int, List[int]]:
+    """
+    Recalculates only the dirty shifts, optionally those between `date_from` and `date_to`.
+
+    Shifts are recalculated in batches of `DIRTY_BATCH_SIZE`, oldest first.
+    Each successful recalculation clears the shift's mark, unless the shift
+    was marked again while it ran; failed shifts stay dirty.
+
+    Args:
+        date_from: First shift date (inclusive).
+        date_to: Last shift date (inclusive).
+        on_shift: Called with (shift, error or None) after each shift.
+
+    Returns:
+        tuple: (number of shifts recalculated, IDs of the shifts that failed)
+    """
+    processed, failed = 0, []
+    # Failed shifts stay dirty, so page through the ids read up front instead of re-querying.
+    shift_ids = list(_dirty_shifts(date_from, date_to).order_by('date', 'id').values_list('id', flat=True))
+    for start in range(0, len(shift_ids), DIRTY_BATCH_SIZE):
+        batch = Shift.objects.filter(id__in=shift_ids[start:start + DIRTY_BATCH_SIZE]).order_by('date', 'id')
+        batch_processed, batch_failed = calculate_and_save_salaries(batch, on_shift=on_shift)
+        processed += batch_processed
+        failed.extend(batch_failed)
+
+    logger.info(f"[recalculate_dirty_shifts] {processed} dirty shifts recalculated, {len(failed)} failed.")
+    return processed, failed
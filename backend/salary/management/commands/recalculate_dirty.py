@@ -0,0 +1,36 @@
+import logging
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from salary.dirty import dirty_shift_count, recalculate_dirty_shifts
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Recalculates the salaries of the shifts whose sales, staff or rules
+    changed since their last calculation; every other shift is left as is.
+    """
+    help = "Recalculates the salaries of dirty shifts only."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=str, help='First shift date (YYYY-MM-DD). Defaults to the oldest dirty shift.')
+        parser.add_argument('--end', type=str, help='Last shift date (YYYY-MM-DD). Defaults to the newest dirty shift.')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else None
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else None
+        except ValueError:
+            raise CommandError("Dates must be in YYYY-MM-DD format.")
+
+        self.stdout.write(f"Recalculating {dirty_shift_count(start, end)} dirty shifts...")
+
+        def on_shift(shift, error):
+            if error:
+                self.stderr.write(self.style.ERROR(f"Error calculating salary for shift {shift.id}: {error}"))
+
+        processed, failed = recalculate_dirty_shifts(start, end, on_shift=on_shift)
+        self.stdout.write(self.style.SUCCESS(f"Recalculated {processed} shifts, {len(failed)} failed."))
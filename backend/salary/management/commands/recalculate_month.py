@@ -0,0 +1,49 @@
+import logging
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from salary.services import RECALC_WORKERS, recalculate_shifts_parallel
+from shift.models import Shift
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Recalculates every shift of a month on a pool of workers sharing one
+    rule snapshot, then saves all salary records in one bulk phase.
+    """
+    help = "Recalculates the salaries of a whole month in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', type=str, help='The month to recalculate (YYYY-MM).')
+        parser.add_argument('--workers', type=int, default=RECALC_WORKERS, help='Worker threads.')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes, used instead of threads if > 1.')
+        parser.add_argument('--trace', action='store_true', help="Store each shift's calculation trace in its records.")
+
+    def handle(self, *args, **options):
+        try:
+            month = datetime.strptime(options['month'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError("Month must be in YYYY-MM format.")
+
+        shifts = list(Shift.objects.filter(date__year=month.year, date__month=month.month).order_by('date', 'id'))
+        if not shifts:
+            self.stdout.write(self.style.WARNING(f"No shifts found for {options['month']}."))
+            return
+
+        done = 0
+
+        def on_chunk(chunk):
+            nonlocal done
+            done += len(chunk)
+            self.stdout.write(f"Calculated {done}/{len(shifts)} shifts...")
+
+        processed, failed = recalculate_shifts_parallel(
+            shifts, workers=options['workers'], processes=options['processes'], on_chunk=on_chunk,
+            trace=options['trace'],
+        )
+        for shift_id in failed:
+            self.stderr.write(self.style.ERROR(f"Error calculating salary for shift {shift_id}."))
+        self.stdout.write(self.style.SUCCESS(f"Salaries saved for {processed} shifts, {len(failed)} failed."))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_uncalculated_shifts(apps, schema_editor):
+    """Marks staffed shifts without salary records, so the first dirty recalculation picks them up."""
+    Shift = apps.get_model('shift', 'Shift')
+    DirtyShift = apps.get_model('salary', 'DirtyShift')
+    now = timezone.now()
+    shift_ids = Shift.objects.filter(shiftemployee__isnull=False, salaryrecord__isnull=True).values_list('id', flat=True)
+    DirtyShift.objects.bulk_create(
+        [DirtyShift(shift_id=shift_id, reason='staff', marked_at=now) for shift_id in set(shift_ids)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salary', '0004_salaryrecord_details'),
+        ('shift', '0004_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyShift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('sales', 'Sales changed'), ('staff', 'Staff changed'), ('rules', 'Rules changed')], max_length=16)),
+                ('marked_at', models.DateTimeField(db_index=True)),
+                ('shift', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='salary_dirty', to='shift.shift')),
+            ],
+            options={
+                'verbose_name': 'Dirty Shift',
+                'verbose_name_plural': 'Dirty Shifts',
+            },
+        ),
+        migrations.RunPython(mark_uncalculated_shifts, migrations.RunPython.noop),
+    ]
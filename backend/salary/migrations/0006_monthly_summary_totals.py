@@ -0,0 +1,67 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:49
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_summaries(apps, schema_editor):
+    """Fills the summaries from the existing salary records; from here on they are maintained on write."""
+    SalaryRecord = apps.get_model('salary', 'SalaryRecord')
+    MonthlySalarySummary = apps.get_model('salary', 'MonthlySalarySummary')
+    MonthlySalarySummary.objects.all().delete()
+    totals = SalaryRecord.objects.annotate(month=TruncMonth('shift__date')).values('employee_id', 'month').annotate(
+        shift_count=Count('id'),
+        total_amount=Sum('total_salary'),
+        fixed_amount=Sum('fixed_part'),
+        percent_amount=Sum('percent_part'),
+        bonus_amount=Sum('bonus_part'),
+        write_off_amount=Sum('write_off'),
+    ).order_by()
+    MonthlySalarySummary.objects.bulk_create([MonthlySalarySummary(**row) for row in totals], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salary', '0005_dirty_shift'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlysalarysummary',
+            name='bonus_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='monthlysalarysummary',
+            name='fixed_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='monthlysalarysummary',
+            name='percent_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='monthlysalarysummary',
+            name='shift_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='monthlysalarysummary',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='monthlysalarysummary',
+            name='write_off_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='monthlysalarysummary',
+            name='month',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
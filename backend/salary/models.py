@@ -76,16 +76,54 @@ class SalaryRecord(models.Model):
         
     def __str__(self):
         return f"Salary of {self.employee.name} for shift {self.shift.date}: {self.total_salary}"    
+
+
+
+class DirtyShift(models.Model):
+    """
+    Marks a shift whose saved salaries are out of date.
+
+    A shift is marked when its sales items, its employee assignments or a
+    salary rule that applies to it change; recalculating it clears the mark.
+    """
+    REASON_SALES = "sales"
+    REASON_STAFF = "staff"
+    REASON_RULES = "rules"
+    REASON_CHOICES = [
+        (REASON_SALES, "Sales changed"),
+        (REASON_STAFF, "Staff changed"),
+        (REASON_RULES, "Rules changed"),
+    ]
+
+    shift = models.OneToOneField(Shift, on_delete=models.CASCADE, related_name='salary_dirty')
+    reason = models.CharField(max_length=16, choices=REASON_CHOICES)
+    marked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Shift {self.shift_id} dirty ({self.reason})"
+
+    class Meta:
+        verbose_name = "Dirty Shift"
+        verbose_name_plural = "Dirty Shifts"
         
         
         
 class MonthlySalarySummary(models.Model):
     """
-    Aggregated model storing the total salary paid to an employee for one month.    
+    Aggregated model storing the total salary paid to an employee for one month.
+
+    Maintained from the employee's SalaryRecords whenever they are written
+    (see `salary.summaries`), so month totals are one indexed read.
     """
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
-    month = models.DateField()  # 2025-09-01
+    month = models.DateField(db_index=True)  # 2025-09-01
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)        
+    fixed_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    percent_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    bonus_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    write_off_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    shift_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.employee.name} - {self.month.strftime('%B %Y')}: {self.total_amount}"
@@ -94,4 +132,4 @@ class MonthlySalarySummary(models.Model):
         verbose_name = "Monthly Salary Summary"
         verbose_name_plural = "Monthly Salary Summaries"
         unique_together = ('employee', 'month')
-        ordering = ['-month', 'employee__name']
\ No newline at end of file
+        ordering = ['-month', 'employee__name']
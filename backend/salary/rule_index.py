@@ -0,0 +1,157 @@
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from .models import SalaryRule, SalaryRuleProduct
+
+logger = logging.getLogger(__name__)
+
+# Cache keys: the current version token, and the index built for each version.
+VERSION_KEY = "salary:rule_index:version"
+INDEX_KEY = "salary:rule_index:{version}"
+
+# How long an index stays in Redis; the version token itself never expires.
+INDEX_TIMEOUT = 24 * 60 * 60
+
+
+@dataclass
+class SalaryRuleIndex:
+    """
+    The salary rules compiled for lookups by id.
+
+    `by_workshop` lists, per Poster workshop ID, the (rule id, percent as a
+    fraction) of every rule paying on it, and `bonuses` maps a Poster
+    product ID to the bonus per item of each rule. Calculating a shift is
+    then an integer join of its sales against these maps instead of a scan
+    of every rule per sales row.
+    """
+    version: str = ""
+    rule_ids_by_role: Dict[int, List[int]] = field(default_factory=dict)
+    fixed_by_role: Dict[int, Decimal] = field(default_factory=dict)
+    by_workshop: Dict[int, List[Tuple[int, Decimal]]] = field(default_factory=dict)
+    bonuses: Dict[int, Dict[int, Decimal]] = field(default_factory=dict)
+
+    def group_rules(self, role_ids) -> List[int]:
+        """The ids of the rules of `role_ids`, in rule order."""
+        return sorted(rule_id for role_id in role_ids for rule_id in self.rule_ids_by_role.get(role_id, ()))
+
+
+def compile_rule_index(rules: Iterable[Tuple[int, int, Optional[Decimal], Optional[Decimal], Iterable[int]]],
+                       bonuses: Iterable[Tuple[int, int, Optional[Decimal]]], version: str = "") -> SalaryRuleIndex:
+    """
+    Compiles an index from plain rule data, saved or not.
+
+    Args:
+        rules: (rule id, role id, fixed per shift, percent, Poster workshop IDs) per rule.
+        bonuses: (rule id, Poster product ID, bonus per item) per product bonus.
+        version: The version token the index is valid for.
+    """
+    rule_ids_by_role = defaultdict(list)
+    fixed_by_role = {}
+    by_workshop = defaultdict(list)
+    for rule_id, role_id, fixed_per_shift, percent, workshop_ids in sorted(rules, key=lambda rule: rule[0]):
+        rule_ids_by_role[role_id].append(rule_id)
+        fixed_by_role[role_id] = fixed_by_role.get(role_id, 0) + Decimal(fixed_per_shift or 0)
+        for workshop_id in workshop_ids:
+            by_workshop[workshop_id].append((rule_id, Decimal(percent or 0) / 100))
+
+    bonuses_by_product = defaultdict(dict)
+    for rule_id, product_id, fixed in bonuses:
+        bonuses_by_product[product_id][rule_id] = Decimal(fixed or 0)
+
+    return SalaryRuleIndex(
+        version=version,
+        rule_ids_by_role=dict(rule_ids_by_role),
+        fixed_by_role=fixed_by_role,
+        by_workshop={workshop_id: sorted(entries) for workshop_id, entries in by_workshop.items()},
+        bonuses=dict(bonuses_by_product),
+    )
+
+
+def build_rule_index(version: str = "") -> SalaryRuleIndex:
+    """Compiles the rule index from the database."""
+    rules = list(SalaryRule.objects.prefetch_related('workshops').order_by('pk'))
+    bonuses = list(SalaryRuleProduct.objects.values_list('salary_rule_id', 'product__product_id', 'fixed'))
+
+    logger.info(f"[build_rule_index] Compiled {len(rules)} salary rules, {len(bonuses)} product bonuses.")
+    return compile_rule_index(
+        [
+            (rule.id, rule.role_id, rule.fixed_per_shift, rule.percent,
+             [workshop.workshop_id for workshop in rule.workshops.all()])
+            for rule in rules
+        ],
+        bonuses,
+        version,
+    )
+
+
+_local_index: Optional[SalaryRuleIndex] = None
+_local_lock = threading.Lock()
+
+
+def _current_version() -> Optional[str]:
+    try:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        return version
+    except Exception as e:
+        logger.warning(f"[get_rule_index] Cache unavailable, compiling rules from the database: {e}")
+        return None
+
+
+def get_rule_index() -> SalaryRuleIndex:
+    """
+    The current rule index.
+
+    The process keeps the last index it used and revalidates it with one
+    cache read of the version token; other processes share the compiled
+    index through the cache. Without a reachable cache there is no way to
+    see other processes' rule edits, so the index is compiled every time.
+    """
+    global _local_index
+    version = _current_version()
+    if version is None:
+        return build_rule_index()
+
+    local = _local_index
+    if local is not None and local.version == version:
+        return local
+
+    with _local_lock:
+        if _local_index is not None and _local_index.version == version:
+            return _local_index
+        index = None
+        try:
+            index = cache.get(INDEX_KEY.format(version=version))
+        except Exception as e:
+            logger.warning(f"[get_rule_index] Could not read the cached rule index: {e}")
+        if index is None:
+            index = build_rule_index(version)
+            try:
+                cache.set(INDEX_KEY.format(version=version), index, INDEX_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"[get_rule_index] Could not cache the rule index: {e}")
+        _local_index = index
+        return index
+
+
+def invalidate_rule_index():
+    """
+    Drops the compiled index in this process and, through a new version token, in every other.
+
+    Bulk `QuerySet.update()`s of rules send no signals; call this after them.
+    """
+    global _local_index
+    _local_index = None
+    try:
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    except Exception as e:
+        logger.warning(f"[invalidate_rule_index] Could not bump the rule index version: {e}")
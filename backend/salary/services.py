@@ -1,62 +1,261 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from decimal import Decimal
-from .models import SalaryRecord
-from .aggreg import aggregate_sales
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import DirtyShift, SalaryRecord
+from .aggreg import aggregate_sales, aggregate_sales_for_shifts
+from .rule_index import SalaryRuleIndex, get_rule_index
+from .summaries import refresh_monthly_summaries
 import logging
 
 logger = logging.getLogger(__name__)
 
-def calculate_and_save_shift_salaries(shift):
+# Records per INSERT ... ON CONFLICT statement.
+SALARY_BATCH_SIZE = 500
+
+# Default threads for `recalculate_shifts_parallel`.
+RECALC_WORKERS = 4
+
+# Fewest shifts a worker is handed; smaller months are split across fewer workers.
+RECALC_MIN_CHUNK = 20
+
+# The SalaryRecord columns a recalculation overwrites.
+RECALCULATED_FIELDS = [
+    'total_salary', 'details', 'fixed_part', 'percent_part', 'bonus_part', 'write_off', 'comment', 'updated_at',
+]
+
+
+def calculate_and_save_shift_salaries(shift, trace: bool = False):
     logger.info(f"Вызов calculate_and_save_shift_salaries для смены {shift.id}")
     
-    salary_data = aggregate_sales(shift)
-    
-    for emp_id, data in salary_data.items():
-        old_record = SalaryRecord.objects.filter(employee_id=emp_id, shift=shift).first()
-        old_details = old_record.details if old_record and old_record.details else {}
-
-        new_calculated_details = data['details']
-        
-        manual_details = {
-            'write_off': old_details.get('write_off', 0),
-            'comment': old_details.get('comment', '')
-        }
-        
-        final_details = {**manual_details, **new_calculated_details}
-        
-        fixed = Decimal(final_details.get('fixed', 0))
-        percent = Decimal(final_details.get('percent', 0))
-        bonus = Decimal(final_details.get('bonus', 0))
-        write_off = Decimal(final_details.get('write_off', 0))
-        
-        total_salary = fixed + percent + bonus - write_off
-
-        json_safe_details = {
-            'fixed': float(fixed),
-            'percent': float(percent),
-            'bonus': float(bonus),
-            'write_off': float(write_off),
-            'comment': final_details.get('comment', ''),
-            'bonus_breakdown': [
-                {
-                    'product_name': item['product_name'],
-                    'count': float(item['count']),
-                    'total': float(item['total'])
-                } for item in final_details.get('bonus_breakdown', [])
+    started = timezone.now()
+    save_shift_salaries(shift, aggregate_sales(shift, trace=1 if trace else None))
+    _clear_dirty([shift.id], started)
+
+
+def calculate_and_save_salaries(shifts: Iterable, on_shift: Optional[Callable] = None) -> Tuple[int, List[int]]:
+    """
+    Calculates and saves the salaries of several shifts, e.g. a day or a month.
+
+    The salaries are calculated together by `aggregate_sales_for_shifts`
+    and written together by `save_salaries`. Saved shifts are no longer
+    dirty (see `salary.dirty`).
+
+    Args:
+        shifts: The shifts to recalculate.
+        on_shift: Called with (shift, error or None) for each shift once the records are written.
+
+    Returns:
+        tuple: (number of shifts saved, IDs of the shifts that failed)
+    """
+    shifts = list(shifts)
+    started = timezone.now()
+    errors = save_salaries(shifts, aggregate_sales_for_shifts(shifts))
+    _clear_dirty([shift.id for shift in shifts if shift.id not in errors], started)
+
+    for shift in shifts:
+        if on_shift:
+            on_shift(shift, errors.get(shift.id))
+    return len(shifts) - len(errors), list(errors)
+
+
+def _calculate_chunk(shifts: List, index: SalaryRuleIndex,
+                     trace: Optional[float] = None) -> Tuple[Dict[int, dict], Optional[Exception]]:
+    try:
+        return aggregate_sales_for_shifts(shifts, index=index, trace=trace), None
+    except Exception as e:
+        logger.error(f"Error calculating salaries of {len(shifts)} shifts: {e}", exc_info=True)
+        return {}, e
+
+
+def _calculate_chunk_in_worker(shifts: List, index: SalaryRuleIndex, trace: Optional[float] = None):
+    try:
+        return _calculate_chunk(shifts, index, trace)
+    finally:
+        # Every worker thread or process opens its own connection; don't leak them.
+        connections.close_all()
+
+
+def recalculate_shifts_parallel(shifts: Iterable, workers: int = RECALC_WORKERS, processes: int = 1,
+                                on_chunk: Optional[Callable[[List], None]] = None,
+                                trace: bool = False) -> Tuple[int, List[int]]:
+    """
+    Recalculates many shifts, e.g. a month, on a pool of workers, then saves them together.
+
+    Shifts are independent given the rules, so they are split into chunks
+    calculated in parallel against one rule snapshot compiled up front:
+    on `workers` threads, or on `processes` forked processes. Each worker
+    uses its own database connection. The results are written by the
+    calling thread in one `save_salaries` bulk phase.
+
+    Args:
+        shifts: The shifts to recalculate.
+        workers: Threads to calculate on; 1 calculates inline, as does a month
+            of at most `RECALC_MIN_CHUNK` shifts.
+        processes: Processes to calculate on instead of threads, if > 1.
+        on_chunk: Called on the calling thread with each chunk of shifts once it is calculated.
+        trace: Trace every shift and store the traces with its records (see `salary.trace`).
+
+    Returns:
+        tuple: (number of shifts saved, IDs of the shifts that failed)
+    """
+    shifts = list(shifts)
+    if not shifts:
+        return 0, []
+    started = timezone.now()
+    index = get_rule_index()
+    sample = 1 if trace else None
+
+    parallelism = processes if processes > 1 else max(workers, 1)
+    chunk_size = max(RECALC_MIN_CHUNK, -(-len(shifts) // parallelism))
+    chunks = [shifts[i:i + chunk_size] for i in range(0, len(shifts), chunk_size)]
+
+    results, errors = {}, {}
+
+    def collect(chunk, chunk_results, error):
+        if error is not None:
+            errors.update((shift.id, error) for shift in chunk)
+        results.update(chunk_results)
+        if on_chunk:
+            on_chunk(chunk)
+
+    if len(chunks) == 1:
+        collect(chunks[0], *_calculate_chunk(chunks[0], index, sample))
+    else:
+        if processes > 1:
+            # Forked children must not share the parent's database socket.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=len(chunks), mp_context=multiprocessing.get_context('fork'))
+        else:
+            pool = ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix='salary')
+        with pool:
+            futures = {pool.submit(_calculate_chunk_in_worker, chunk, index, sample): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                collect(futures[future], *future.result())
+
+    calculated = [shift for shift in shifts if shift.id not in errors]
+    errors.update(save_salaries(calculated, results))
+    _clear_dirty([shift.id for shift in shifts if shift.id not in errors], started)
+
+    logger.info(f"[recalculate_shifts_parallel] {len(shifts) - len(errors)} of {len(shifts)} shifts saved "
+                f"({len(chunks)} chunks on {parallelism} {'processes' if processes > 1 else 'threads'}).")
+    return len(shifts) - len(errors), list(errors)
+
+
+def _clear_dirty(shift_ids: List[int], started):
+    # A shift marked again after the calculation started stays dirty.
+    DirtyShift.objects.filter(shift_id__in=shift_ids, marked_at__lte=started).delete()
+
+
+def save_shift_salaries(shift, salary_data: dict):
+    """Saves an `aggregate_sales` result as the shift's SalaryRecords, keeping manual write-offs and comments."""
+    errors = save_salaries([shift], {shift.id: salary_data})
+    if errors:
+        raise errors[shift.id]
+
+
+def _salary_record(shift, emp_id, data: dict, old_details: dict) -> SalaryRecord:
+    new_calculated_details = data['details']
+
+    manual_details = {
+        'write_off': old_details.get('write_off', 0),
+        'comment': old_details.get('comment', '')
+    }
+
+    final_details = {**manual_details, **new_calculated_details}
+
+    fixed = Decimal(final_details.get('fixed', 0))
+    percent = Decimal(final_details.get('percent', 0))
+    bonus = Decimal(final_details.get('bonus', 0))
+    write_off = Decimal(final_details.get('write_off', 0))
+
+    total_salary = fixed + percent + bonus - write_off
+
+    json_safe_details = {
+        'fixed': float(fixed),
+        'percent': float(percent),
+        'bonus': float(bonus),
+        'write_off': float(write_off),
+        'comment': final_details.get('comment', ''),
+        'bonus_breakdown': [
+            {
+                'product_name': item['product_name'],
+                'count': float(item['count']),
+                'total': float(item['total'])
+            } for item in final_details.get('bonus_breakdown', [])
+        ]
+    }
+    # Only a traced calculation stores its trace; an untraced one drops the previous one.
+    if data.get('trace'):
+        json_safe_details['trace'] = data['trace']
+
+    return SalaryRecord(
+        employee_id=emp_id,
+        shift=shift,
+        total_salary=total_salary,
+        details=json_safe_details,
+        fixed_part=fixed,
+        percent_part=percent,
+        bonus_part=bonus,
+        write_off=write_off,
+        comment=final_details.get('comment', ''),
+    )
+
+
+def save_salaries(shifts: Iterable, salaries: Dict[int, dict]) -> Dict[int, Exception]:
+    """
+    Upserts the SalaryRecords of several shifts in one statement per batch.
+
+    The manual write-offs and comments of the existing records are loaded
+    in one query and merged into the new records, which are then written
+    with `bulk_create(update_conflicts=True)` on the (shift, employee) key,
+    together with the month summaries they change.
+    A shift whose records can't be built is left out and reported.
+
+    Args:
+        shifts: The shifts to save.
+        salaries: {shift id: the `aggregate_sales` result of the shift}.
+
+    Returns:
+        dict: {shift id: error} for the shifts that weren't saved.
+    """
+    shifts = list(shifts)
+    old_details = {
+        (shift_id, employee_id): details or {}
+        for shift_id, employee_id, details in SalaryRecord.objects.filter(
+            shift_id__in=[shift.id for shift in shifts]
+        ).values_list('shift_id', 'employee_id', 'details')
+    }
+
+    records, errors = [], {}
+    for shift in shifts:
+        try:
+            shift_records = [
+                _salary_record(shift, emp_id, data, old_details.get((shift.id, emp_id), {}))
+                for emp_id, data in salaries.get(shift.id, {}).items()
             ]
-        }
-
-        SalaryRecord.objects.update_or_create(
-            employee_id=emp_id, 
-            shift=shift,
-            defaults={
-                'total_salary': total_salary,
-                'details': json_safe_details,
-                
-                'fixed_part': fixed,
-                'percent_part': percent,
-                'bonus_part': bonus,
-                'write_off': write_off,
-                'comment': final_details.get('comment', '')
-            }
-        )
-    logger.info(f"ЗП для смены {shift.id} сохранена.")
\ No newline at end of file
+        except Exception as e:
+            logger.error(f"Error saving salaries of shift {shift.id}: {e}", exc_info=True)
+            errors[shift.id] = e
+            continue
+        records.extend(shift_records)
+
+    try:
+        with transaction.atomic():
+            SalaryRecord.objects.bulk_create(
+                records,
+                batch_size=SALARY_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['shift', 'employee'],
+                update_fields=RECALCULATED_FIELDS,
+            )
+            # bulk_create sends no signals, so the month summaries are refreshed here.
+            refresh_monthly_summaries({(record.employee_id, record.shift.date) for record in records})
+    except Exception as e:
+        logger.error(f"Error saving salaries of {len(shifts)} shifts: {e}", exc_info=True)
+        return {shift.id: e for shift in shifts}
+
+    logger.info(f"ЗП для {len(shifts) - len(errors)} смен сохранена ({len(records)} записей).")
+    return errors
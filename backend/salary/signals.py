@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from poster_api.models import Product, Workshop
+from shift.models import Shift, ShiftEmployee
+from users.models import PayGroup, Role
+from .dirty import mark_shifts_dirty, shifts_touched_by
+from .models import DirtyShift, SalaryRecord, SalaryRule, SalaryRuleProduct
+from .rule_index import invalidate_rule_index
+from .summaries import refresh_monthly_summaries
+
+
+@receiver(post_save, sender=SalaryRule)
+@receiver(post_delete, sender=SalaryRule)
+@receiver(post_save, sender=SalaryRuleProduct)
+@receiver(post_delete, sender=SalaryRuleProduct)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=PayGroup)
+@receiver(post_delete, sender=PayGroup)
+@receiver(m2m_changed, sender=SalaryRule.workshops.through)
+def rules_changed(sender, **kwargs):
+    """Invalidates the compiled rule index once the change is committed, so no process caches the old rules under the new version."""
+    transaction.on_commit(invalidate_rule_index)
+
+
+def _mark_on_commit(shift_ids, reason):
+    # Deferred, so shifts deleted by the same transaction are skipped instead of re-referenced.
+    if shift_ids:
+        transaction.on_commit(lambda: mark_shifts_dirty(shift_ids, reason))
+
+
+@receiver(post_save, sender=ShiftEmployee)
+@receiver(post_delete, sender=ShiftEmployee)
+def staff_changed(sender, instance, **kwargs):
+    _mark_on_commit({instance.shift_id}, DirtyShift.REASON_STAFF)
+
+
+def _rule_shifts(rule_id, role_id, fixed_per_shift):
+    """The shifts `rule_id` applies to: every shift of its role for a fixed pay, else those with sales it pays on."""
+    return shifts_touched_by(
+        [role_id],
+        workshop_ids=SalaryRule.workshops.through.objects.filter(salaryrule_id=rule_id).values_list(
+            'workshop__workshop_id', flat=True
+        ),
+        product_ids=SalaryRuleProduct.objects.filter(salary_rule_id=rule_id).values_list(
+            'product__product_id', flat=True
+        ),
+        all_role_shifts=bool(fixed_per_shift),
+    )
+
+
+@receiver(pre_save, sender=SalaryRule)
+@receiver(pre_delete, sender=SalaryRule)
+def rule_changing(sender, instance, **kwargs):
+    # The shifts the rule applies to before the change; after a delete its workshops and bonuses are gone.
+    before = SalaryRule.objects.filter(pk=instance.pk).values('role_id', 'fixed_per_shift').first() if instance.pk else None
+    instance._dirty_shifts = _rule_shifts(instance.pk, before['role_id'], before['fixed_per_shift']) if before else set()
+
+
+@receiver(post_save, sender=SalaryRule)
+def rule_saved(sender, instance, **kwargs):
+    shift_ids = getattr(instance, '_dirty_shifts', set()) | _rule_shifts(
+        instance.pk, instance.role_id, instance.fixed_per_shift
+    )
+    _mark_on_commit(shift_ids, DirtyShift.REASON_RULES)
+
+
+@receiver(post_delete, sender=SalaryRule)
+def rule_deleted(sender, instance, **kwargs):
+    _mark_on_commit(getattr(instance, '_dirty_shifts', set()), DirtyShift.REASON_RULES)
+
+
+@receiver(m2m_changed, sender=SalaryRule.workshops.through)
+def rule_workshops_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # Changed from the workshop's side: `pk_set` holds rules.
+        if action == 'pre_clear':
+            instance._cleared_rules = set(instance.salaryrule_set.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove', 'post_clear'):
+            rule_ids = getattr(instance, '_cleared_rules', set()) if action == 'post_clear' else pk_set
+            role_ids = SalaryRule.objects.filter(pk__in=rule_ids).values_list('role_id', flat=True)
+            _mark_on_commit(shifts_touched_by(role_ids, workshop_ids=[instance.workshop_id]), DirtyShift.REASON_RULES)
+    elif action == 'pre_clear':
+        instance._cleared_workshops = set(instance.workshops.values_list('workshop_id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if action == 'post_clear':
+            workshop_ids = getattr(instance, '_cleared_workshops', set())
+        else:
+            workshop_ids = Workshop.objects.filter(pk__in=pk_set).values_list('workshop_id', flat=True)
+        _mark_on_commit(shifts_touched_by([instance.role_id], workshop_ids=workshop_ids), DirtyShift.REASON_RULES)
+
+
+@receiver(pre_save, sender=SalaryRuleProduct)
+def bonus_changing(sender, instance, **kwargs):
+    instance._old_product_id = SalaryRuleProduct.objects.filter(pk=instance.pk).values_list(
+        'product__product_id', flat=True
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=SalaryRuleProduct)
+@receiver(post_delete, sender=SalaryRuleProduct)
+def bonus_changed(sender, instance, **kwargs):
+    # Looked up instead of followed: in a cascade the rule or product may already be gone.
+    role_ids = SalaryRule.objects.filter(pk=instance.salary_rule_id).values_list('role_id', flat=True)
+    product_ids = set(Product.objects.filter(pk=instance.product_id).values_list('product_id', flat=True))
+    if getattr(instance, '_old_product_id', None):
+        product_ids.add(instance._old_product_id)
+    _mark_on_commit(shifts_touched_by(role_ids, product_ids=product_ids), DirtyShift.REASON_RULES)
+
+
+@receiver(post_save, sender=SalaryRecord)
+@receiver(post_delete, sender=SalaryRecord)
+def salary_record_changed(sender, instance, **kwargs):
+    """Keeps the record's MonthlySalarySummary in line once the change is committed."""
+    try:
+        key = (instance.employee_id, instance.shift.date)
+    except Shift.DoesNotExist:
+        return
+    transaction.on_commit(lambda: refresh_monthly_summaries([key]))
@@ -0,0 +1,200 @@
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from shift.models import Shift, ShiftEmployee
+from users.models import Employee
+from .aggreg import load_sales
+from .rule_index import SalaryRuleIndex, compile_rule_index, get_rule_index
+
+logger = logging.getLogger(__name__)
+
+# A column of the sales matrix: (Poster workshop ID, Poster product ID or None).
+SalesColumn = Tuple[int, Optional[int]]
+
+
+@dataclass
+class MonthSales:
+    """
+    A month of shift inputs, loaded once and evaluated against any rule set.
+
+    The sales form a sparse shift x (workshop, product) matrix: `columns`
+    names the columns and each row of `rows` holds the (column, sum, count)
+    entries of one shift. `assignments` lists each shift's (employee id,
+    role id, pay group key) in assignment order.
+    """
+    columns: List[SalesColumn] = field(default_factory=list)
+    rows: Dict[int, List[Tuple[int, Decimal, Decimal]]] = field(default_factory=dict)
+    assignments: Dict[int, List[Tuple[int, int, object]]] = field(default_factory=dict)
+    employee_names: Dict[int, str] = field(default_factory=dict)
+
+
+def load_month_sales(year: int, month: int) -> MonthSales:
+    """Loads the regular sales and employee assignments of every shift of a month in a fixed number of queries."""
+    shifts = list(Shift.objects.filter(date__year=year, date__month=month).only('id', 'shift_id'))
+    sales = load_sales(shifts)
+
+    data = MonthSales()
+    column_ids: Dict[SalesColumn, int] = {}
+    for shift in shifts:
+        if shift.shift_id not in sales:
+            continue
+        row = []
+        for column, sale_data in sales[shift.shift_id][1].items():
+            if column[0] is None:
+                continue
+            if column not in column_ids:
+                column_ids[column] = len(data.columns)
+                data.columns.append(column)
+            row.append((column_ids[column], sale_data['sum'], Decimal(sale_data['count'])))
+        data.rows[shift.id] = row
+        data.assignments[shift.id] = []
+
+    for shift_id, employee_id, role_id, pay_group_id in ShiftEmployee.objects.filter(
+        shift_id__in=list(data.rows)
+    ).values_list('shift_id', 'employee_id', 'role_id', 'role__pay_group_id').order_by('pk'):
+        data.assignments[shift_id].append((employee_id, role_id, pay_group_id or f"role_{role_id}"))
+
+    data.employee_names = dict(Employee.objects.filter(
+        id__in={employee_id for assigned in data.assignments.values() for employee_id, _, _ in assigned}
+    ).values_list('id', 'name'))
+    return data
+
+
+class _RuleSetCoefficients:
+    """
+    One rule set as per-column coefficient vectors, one pair per set of roles paid together.
+
+    The percent and bonus pot of a pay group on a shift is then the sparse
+    dot product of the shift's sums and counts with the group's vectors.
+    """
+
+    def __init__(self, index: SalaryRuleIndex, columns: List[SalesColumn]):
+        self.index = index
+        self.columns = columns
+        self._vectors: Dict[FrozenSet[int], Tuple[Dict[int, Decimal], Dict[int, Decimal]]] = {}
+
+    def vectors(self, role_ids: FrozenSet[int]) -> Tuple[Dict[int, Decimal], Dict[int, Decimal]]:
+        if role_ids not in self._vectors:
+            group_rule_ids = set(self.index.group_rules(role_ids))
+            percent_by_column, bonus_by_column = {}, {}
+            if group_rule_ids:
+                for column_id, (workshop_id, product_id) in enumerate(self.columns):
+                    rules_on_workshop = [
+                        (rule_id, percent) for rule_id, percent in self.index.by_workshop.get(workshop_id, ())
+                        if rule_id in group_rule_ids
+                    ]
+                    if not rules_on_workshop:
+                        continue
+                    product_bonuses = self.index.bonuses.get(product_id, {})
+                    percent = sum((percent for _, percent in rules_on_workshop if percent > 0), Decimal(0))
+                    bonus = sum((product_bonuses.get(rule_id, Decimal(0)) for rule_id, _ in rules_on_workshop
+                                 if product_bonuses.get(rule_id, Decimal(0)) > 0), Decimal(0))
+                    if percent:
+                        percent_by_column[column_id] = percent
+                    if bonus:
+                        bonus_by_column[column_id] = bonus
+            self._vectors[role_ids] = (percent_by_column, bonus_by_column)
+        return self._vectors[role_ids]
+
+
+def evaluate_month(index: SalaryRuleIndex, data: MonthSales) -> Dict[int, Decimal]:
+    """
+    The month's salary per employee under the rules of `index`, before write-offs.
+
+    Follows `aggregate_sales`: each employee gets the fixed pay of their
+    role, and each pay group (or role without one) splits the percent and
+    bonus pot of its rules evenly among its members on the shift.
+    """
+    coefficients = _RuleSetCoefficients(index, data.columns)
+    totals: Dict[int, Decimal] = defaultdict(Decimal)
+    for shift_id, row in data.rows.items():
+        shift_salaries: Dict[int, Decimal] = {}
+        groups = defaultdict(list)
+        for employee_id, role_id, group_key in data.assignments[shift_id]:
+            shift_salaries[employee_id] = Decimal(index.fixed_by_role.get(role_id, 0))
+            groups[group_key].append((employee_id, role_id))
+
+        for members in groups.values():
+            percent_by_column, bonus_by_column = coefficients.vectors(frozenset(role_id for _, role_id in members))
+            if not percent_by_column and not bonus_by_column:
+                continue
+            pot = sum(
+                (payed_sum * percent_by_column.get(column_id, 0) + count * bonus_by_column.get(column_id, 0)
+                 for column_id, payed_sum, count in row),
+                Decimal(0),
+            )
+            if pot > 0:
+                share = pot / len(members)
+                for employee_id, _ in members:
+                    shift_salaries[employee_id] += share
+
+        for employee_id, salary in shift_salaries.items():
+            totals[employee_id] += salary
+    return dict(totals)
+
+
+def proposed_rule_index(rules: Iterable[dict]) -> SalaryRuleIndex:
+    """
+    Compiles an index from a proposed rule set, without saving anything.
+
+    Args:
+        rules: Validated `SalaryRuleSerializer` data, one dict per rule.
+    """
+    compiled, bonuses = [], []
+    for rule_id, rule in enumerate(rules, start=1):
+        compiled.append((
+            rule_id, rule['role'].id, rule.get('fixed_per_shift'), rule.get('percent'),
+            [workshop.workshop_id for workshop in rule.get('workshops', [])],
+        ))
+        bonuses.extend(
+            (rule_id, bonus['product'].product_id, bonus.get('fixed'))
+            for bonus in rule.get('salaryruleproduct_set', [])
+        )
+    return compile_rule_index(compiled, bonuses, version="proposed")
+
+
+def simulate_month(year: int, month: int, proposed: SalaryRuleIndex) -> dict:
+    """
+    Compares a month's salaries under the current rules and under `proposed`.
+
+    Both rule sets are evaluated in memory against the same month of stored
+    sales and assignments; nothing is written.
+
+    Returns:
+        dict: Per-employee current, proposed and delta amounts, and their totals.
+    """
+    started = time.time()
+    data = load_month_sales(year, month)
+    current = evaluate_month(get_rule_index(), data)
+    simulated = evaluate_month(proposed, data)
+
+    employees = []
+    for employee_id in sorted(set(current) | set(simulated), key=lambda emp_id: data.employee_names.get(emp_id, "")):
+        before = current.get(employee_id, Decimal(0))
+        after = simulated.get(employee_id, Decimal(0))
+        employees.append({
+            "employee_id": employee_id,
+            "employee_name": data.employee_names.get(employee_id),
+            "current": float(round(before, 2)),
+            "proposed": float(round(after, 2)),
+            "delta": float(round(after - before, 2)),
+        })
+
+    total_current, total_proposed = sum(current.values(), Decimal(0)), sum(simulated.values(), Decimal(0))
+    logger.info(f"[simulate_month] {len(data.rows)} shifts of {month}/{year} simulated "
+                f"in {round(time.time() - started, 3)} sec.")
+    return {
+        "year": year,
+        "month": month,
+        "shifts": len(data.rows),
+        "employees": employees,
+        "total": {
+            "current": float(round(total_current, 2)),
+            "proposed": float(round(total_proposed, 2)),
+            "delta": float(round(total_proposed - total_current, 2)),
+        },
+    }
@@ -0,0 +1,80 @@
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Set, Tuple
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import MonthlySalarySummary, SalaryRecord
+
+logger = logging.getLogger(__name__)
+
+SummaryKey = Tuple[int, date]
+
+# SalaryRecord column summed into each MonthlySalarySummary column.
+SUMMED_FIELDS = {
+    'total_amount': 'total_salary',
+    'fixed_amount': 'fixed_part',
+    'percent_amount': 'percent_part',
+    'bonus_amount': 'bonus_part',
+    'write_off_amount': 'write_off',
+}
+
+
+def month_of(day: date) -> date:
+    """The first day of the month of `day`, the month key of a summary."""
+    return day.replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def refresh_monthly_summaries(keys: Iterable[SummaryKey]) -> int:
+    """
+    Brings the MonthlySalarySummary of each (employee id, month) in `keys` in line with its SalaryRecords.
+
+    Only the given keys are re-summed, in one grouped query, and written in
+    one upsert; a key without records left loses its summary.
+
+    Returns:
+        int: The number of summaries written.
+    """
+    keys: Set[SummaryKey] = {(employee_id, month_of(month)) for employee_id, month in keys}
+    if not keys:
+        return 0
+
+    months = {month for _, month in keys}
+    totals = SalaryRecord.objects.filter(
+        employee_id__in={employee_id for employee_id, _ in keys},
+        shift__date__gte=min(months),
+        shift__date__lt=_next_month(max(months)),
+    ).annotate(month=TruncMonth('shift__date')).values('employee_id', 'month').annotate(
+        shift_count=Count('id'), **{field: Sum(column) for field, column in SUMMED_FIELDS.items()}
+    ).order_by()
+
+    summaries = []
+    for row in totals:
+        key = (row['employee_id'], row['month'])
+        if key in keys:
+            summaries.append(MonthlySalarySummary(
+                employee_id=key[0], month=key[1], shift_count=row['shift_count'],
+                **{field: row[field] or Decimal(0) for field in SUMMED_FIELDS},
+            ))
+
+    MonthlySalarySummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['employee', 'month'],
+        update_fields=[*SUMMED_FIELDS, 'shift_count', 'updated_at'],
+    )
+    emptied = keys - {(summary.employee_id, summary.month) for summary in summaries}
+    if emptied:
+        condition = Q(pk__in=[])
+        for employee_id, month in emptied:
+            condition |= Q(employee_id=employee_id, month=month)
+        MonthlySalarySummary.objects.filter(condition).delete()
+
+    logger.info(f"[refresh_monthly_summaries] {len(summaries)} summaries refreshed, {len(emptied)} removed.")
+    return len(summaries)
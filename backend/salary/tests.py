@@ -1,6 +1,11 @@
 from decimal import Decimal
 from datetime import date
-from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -8,9 +13,20 @@ from rest_framework.test import APIClient
 from users.models import User, Employee, Role, PayGroup
 from shift.models import Shift, ShiftEmployee
 from poster_api.models import ShiftSale, ShiftSaleItem, Workshop, Product, Category
-from salary.models import SalaryRule, SalaryRuleProduct, SalaryRecord
-from salary.aggreg import aggregate_sales
-from salary.services import calculate_and_save_shift_salaries
+from poster_api.services.saving import save_shift_sales
+from salary.models import DirtyShift, MonthlySalarySummary, SalaryRule, SalaryRuleProduct, SalaryRecord
+from salary.dirty import mark_shifts_dirty, recalculate_dirty_shifts
+from salary.aggreg import aggregate_sales, aggregate_sales_for_shifts
+from salary.services import (
+    calculate_and_save_salaries, calculate_and_save_shift_salaries, recalculate_shifts_parallel, save_salaries,
+)
+from salary import rule_index
+from salary.rule_index import get_rule_index, invalidate_rule_index
+from salary.serializers import SalaryRuleSerializer
+from salary.simulation import evaluate_month, load_month_sales
+from jobs.models import Job
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 class SalaryCalculationBaseTest(TestCase):
     """Base setup for salary calculation tests."""
@@ -55,8 +71,10 @@ class SalaryCalculationBaseTest(TestCase):
         ShiftSaleItem.objects.create(
             shift_sale=self.shift_sale,
             product_name="Steak",
+            product=self.prod_steak,
             category_name="regular",
             workshop=1,
+            workshop_id=1,
             payed_sum=1000,
             count=1
         )
@@ -69,8 +87,10 @@ class SalaryCalculationBaseTest(TestCase):
         ShiftSaleItem.objects.create(
             shift_sale=self.shift_sale,
             product_name="Cola",
+            product=self.prod_cola,
             category_name="regular",
             workshop=2,
+            workshop_id=2,
             payed_sum=500,
             count=2
         )
@@ -136,6 +156,86 @@ class AggregationLogicTest(SalaryCalculationBaseTest):
         self.assertEqual(result[self.emp_waiter.id]['total_salary'], 1000)
         self.assertEqual(result[self.emp_waiter.id]['percent_total'], 0)
 
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_batched_shifts_match_per_shift_results(self):
+        """Tests that the month engine matches the per-shift calculation in a fixed number of queries."""
+        self.create_salary_rule(self.role_chef, fixed=100, percent=10, workshops=[self.workshop_kitchen])
+        rule = self.create_salary_rule(self.role_waiter, fixed=50, workshops=[self.workshop_bar])
+        SalaryRuleProduct.objects.create(salary_rule=rule, product=self.prod_cola, fixed=10)
+
+        shifts = [self.shift]
+        for day in range(2, 6):
+            shift = Shift.objects.create(date=date(2025, 10, day), shift_id=100 + day)
+            shift_sale = ShiftSale.objects.create(shift_id=shift.shift_id, date=shift.date)
+            ShiftEmployee.objects.create(shift=shift, employee=self.emp_chef, role=self.role_chef)
+            ShiftEmployee.objects.create(shift=shift, employee=self.emp_waiter, role=self.role_waiter)
+            ShiftSaleItem.objects.create(shift_sale=shift_sale, product_name="Steak ", product=self.prod_steak,
+                                         category_name="regular", workshop_id=1, payed_sum=100 * day, count=day)
+            ShiftSaleItem.objects.create(shift_sale=shift_sale, product_name="Cola", product=self.prod_cola,
+                                         category_name="regular", workshop_id=2, payed_sum=50, count=day)
+            shifts.append(shift)
+        shifts.append(Shift.objects.create(date=date(2025, 10, 9), shift_id=999))
+
+        invalidate_rule_index()
+        get_rule_index()
+        # Shift sales, items and assignments; the rules come from the compiled index.
+        with self.assertNumQueries(3):
+            batched = aggregate_sales_for_shifts(shifts)
+
+        self.assertEqual(set(batched), {shift.id for shift in shifts})
+        for shift in shifts:
+            self.assertEqual(batched[shift.id], aggregate_sales(shift))
+        self.assertEqual(batched[shifts[-1].id], {})
+        self.assertEqual(batched[shifts[2].id][self.emp_waiter.id]['fixed_bonus_total'], Decimal('30'))
+
+    def test_sales_are_summed_per_workshop_and_product(self):
+        """Tests that rows of one product, even under another name, are summed before the rules apply."""
+        terrace = Workshop.objects.create(workshop_id=3, workshop_name="Terrace")
+        self.create_salary_rule(self.role_waiter, percent=10, workshops=[terrace])
+        for name, category, payed_sum in (("Cola", "regular", 100), ("Cola 0.5", "regular", 250),
+                                          ("Cola", "delivery", 9999)):
+            ShiftSaleItem.objects.create(shift_sale=self.shift_sale, product_name=name, product=self.prod_cola,
+                                         category_name=category, workshop_id=terrace.workshop_id,
+                                         payed_sum=payed_sum, count=1)
+
+        result = aggregate_sales(self.shift)
+
+        self.assertEqual(result[self.emp_waiter.id]['percent_total'], Decimal('35'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RuleIndexTest(SalaryCalculationBaseTest):
+    """Tests for the compiled, cached salary rule index."""
+
+    def setUp(self):
+        super().setUp()
+        # The cache outlives the rolled-back rows of earlier tests.
+        invalidate_rule_index()
+
+    def test_index_is_cached_and_invalidated_on_rule_changes(self):
+        rule = self.create_salary_rule(self.role_waiter, percent=10, workshops=[self.workshop_bar])
+        bonus = SalaryRuleProduct.objects.create(salary_rule=rule, product=self.prod_cola, fixed=10)
+
+        index = get_rule_index()
+        self.assertEqual(index.by_workshop[self.workshop_bar.workshop_id], [(rule.id, Decimal('0.1'))])
+        self.assertEqual(index.bonuses[self.prod_cola.product_id], {rule.id: Decimal('10')})
+        with self.assertNumQueries(0):
+            self.assertIs(get_rule_index(), index)
+
+        # Another process finds the compiled index in the cache.
+        rule_index._local_index = None
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rule_index().bonuses, index.bonuses)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bonus.fixed = 15
+            bonus.save()
+        self.assertEqual(get_rule_index().bonuses[self.prod_cola.product_id], {rule.id: Decimal('15')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.workshops.add(self.workshop_kitchen)
+        self.assertEqual(get_rule_index().by_workshop[self.workshop_kitchen.workshop_id], [(rule.id, Decimal('0.1'))])
+
 
 class ServicesTest(SalaryCalculationBaseTest):
     """Tests for service layer functions."""
@@ -167,6 +267,238 @@ class ServicesTest(SalaryCalculationBaseTest):
         self.assertEqual(record.comment, "Spilled soup")
         self.assertEqual(record.total_salary, 1800)
 
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_month_is_saved_in_constant_statements(self):
+        """Ensures a batch of shifts is upserted with a fixed number of queries, keeping manual fields."""
+        invalidate_rule_index()
+        self.create_salary_rule(self.role_waiter, fixed=1000)
+        self.create_salary_rule(self.role_chef, fixed=500)
+        shifts = [self.shift]
+        for day in range(2, 5):
+            shift = Shift.objects.create(date=date(2025, 10, day), shift_id=100 + day)
+            ShiftSale.objects.create(shift_id=shift.shift_id, date=shift.date)
+            ShiftEmployee.objects.create(shift=shift, employee=self.emp_chef, role=self.role_chef)
+            ShiftEmployee.objects.create(shift=shift, employee=self.emp_waiter, role=self.role_waiter)
+            shifts.append(shift)
+        calculate_and_save_salaries(shifts[:1])
+        SalaryRecord.objects.filter(employee=self.emp_waiter, shift=self.shift).update(
+            details={'write_off': 300, 'comment': "Broken glass"}
+        )
+
+        with CaptureQueriesContext(connection) as one_shift:
+            calculate_and_save_salaries(shifts[1:2])
+        with CaptureQueriesContext(connection) as all_shifts:
+            processed, failed = calculate_and_save_salaries(shifts)
+
+        self.assertEqual(len(all_shifts), len(one_shift))
+        self.assertEqual((processed, failed), (4, []))
+        self.assertEqual(SalaryRecord.objects.count(), 9)
+        record = SalaryRecord.objects.get(employee=self.emp_waiter, shift=self.shift)
+        self.assertEqual((record.total_salary, record.write_off, record.comment), (700, 300, "Broken glass"))
+
+
+    def test_shift_with_a_failing_record_is_saved_whole_or_not_at_all(self):
+        """Ensures a shift whose second record can't be built saves none of its records."""
+        other = Shift.objects.create(date=date(2025, 10, 2), shift_id=102)
+        good = {'details': {'fixed': 1000, 'percent': 0, 'bonus': 0}}
+        salaries = {
+            self.shift.id: {self.emp_chef.id: good, self.emp_waiter.id: {'details': {'fixed': 'n/a'}}},
+            other.id: {self.emp_chef.id: good},
+        }
+
+        errors = save_salaries([self.shift, other], salaries)
+
+        self.assertEqual(list(errors), [self.shift.id])
+        self.assertFalse(SalaryRecord.objects.filter(shift=self.shift).exists())
+        self.assertEqual(SalaryRecord.objects.get(shift=other).total_salary, 1000)
+
+    def test_parallel_recalculation_matches_serial_results(self):
+        """Ensures the pooled month runner saves the same records as the serial one, in one write phase."""
+        self.create_salary_rule(self.role_waiter, fixed=1000, percent=10, workshops=[self.workshop_bar])
+        self.create_salary_rule(self.role_chef, fixed=500)
+        shifts = [self.shift]
+        for day in range(2, 5):
+            shift = Shift.objects.create(date=date(2025, 10, day), shift_id=100 + day)
+            shift_sale = ShiftSale.objects.create(shift_id=shift.shift_id, date=shift.date)
+            ShiftEmployee.objects.create(shift=shift, employee=self.emp_waiter, role=self.role_waiter)
+            ShiftSaleItem.objects.create(shift_sale=shift_sale, product_name="Cola", product=self.prod_cola,
+                                         category_name="regular", workshop_id=self.workshop_bar.workshop_id,
+                                         payed_sum=100 * day, count=1)
+            shifts.append(shift)
+        calculate_and_save_salaries(shifts)
+        serial = dict(SalaryRecord.objects.values_list('id', 'total_salary'))
+        SalaryRecord.objects.update(total_salary=0)
+
+        chunks = []
+        processed, failed = recalculate_shifts_parallel(shifts, workers=1, on_chunk=chunks.append)
+
+        self.assertEqual((processed, failed), (4, []))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 4)
+        self.assertEqual(dict(SalaryRecord.objects.values_list('id', 'total_salary')), serial)
+
+
+class DirtyTrackingTest(SalaryCalculationBaseTest):
+    """Tests for marking changed shifts dirty and recalculating only those."""
+
+    def setUp(self):
+        super().setUp()
+        self.terrace = Workshop.objects.create(workshop_id=3, workshop_name="Terrace")
+        self.other_shift = Shift.objects.create(date=date(2025, 10, 2), shift_id=200)
+        other_sale = ShiftSale.objects.create(shift_id=200, date=self.other_shift.date)
+        ShiftEmployee.objects.create(shift=self.other_shift, employee=self.emp_waiter, role=self.role_waiter)
+        ShiftSaleItem.objects.create(shift_sale=other_sale, product_name="Lemonade", category_name="regular",
+                                     workshop_id=self.terrace.workshop_id, payed_sum=300, count=3)
+
+    def dirty(self):
+        return set(DirtyShift.objects.values_list('shift_id', flat=True))
+
+    def test_staff_changes_mark_the_shift(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ShiftEmployee.objects.filter(shift=self.shift, employee=self.emp_sous).delete()
+        self.assertEqual(self.dirty(), {self.shift.id})
+
+    def test_rule_edits_mark_only_shifts_they_pay_on(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = self.create_salary_rule(self.role_waiter, percent=10)
+        self.assertEqual(self.dirty(), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.workshops.add(self.terrace)
+        self.assertEqual(self.dirty(), {self.other_shift.id})
+
+        DirtyShift.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            SalaryRuleProduct.objects.create(salary_rule=rule, product=self.prod_steak, fixed=5)
+        self.assertEqual(self.dirty(), {self.shift.id})
+
+        DirtyShift.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.fixed_per_shift = 100
+            rule.save()
+        self.assertEqual(self.dirty(), {self.shift.id, self.other_shift.id})
+
+    def test_saving_sales_marks_the_shift(self):
+        save_shift_sales({'200': {'regular': [
+            {'product_name': "Lemonade", 'workshop': str(self.terrace.workshop_id), 'payed_sum': '400', 'count': 4},
+        ]}}, '2025-10-02')
+        self.assertEqual(self.dirty(), {self.other_shift.id})
+
+    def test_recalculation_processes_only_dirty_shifts(self):
+        self.create_salary_rule(self.role_waiter, fixed=1000)
+        mark_shifts_dirty([self.other_shift.id], DirtyShift.REASON_STAFF)
+
+        processed, failed = recalculate_dirty_shifts()
+
+        self.assertEqual((processed, failed), (1, []))
+        self.assertEqual(set(SalaryRecord.objects.values_list('shift_id', flat=True)), {self.other_shift.id})
+        self.assertEqual(self.dirty(), set())
+        self.assertEqual(recalculate_dirty_shifts(), (0, []))
+
+    def test_recalculate_dirty_action_runs_as_job(self):
+        self.create_salary_rule(self.role_waiter, fixed=1000)
+        mark_shifts_dirty([self.shift.id, self.other_shift.id], DirtyShift.REASON_RULES)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='owner', password='password'))
+
+        response = client.post(reverse('salary_records-recalculate-dirty'), {'month': 10, 'year': 2025}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        with patch('jobs.management.commands.run_worker.close_old_connections'):
+            call_command('run_worker', '--once', stdout=StringIO())
+
+        job = Job.objects.get(pk=response.data['job_id'])
+        self.assertEqual((job.status, job.result['processed'], job.total), (Job.STATUS_DONE, 2, 2))
+        self.assertEqual(self.dirty(), set())
+
+
+class SimulationTest(SalaryCalculationBaseTest):
+    """Tests for the what-if simulation of a month under a proposed rule set."""
+
+    def setUp(self):
+        super().setUp()
+        invalidate_rule_index()
+        self.terrace = Workshop.objects.create(workshop_id=3, workshop_name="Terrace")
+        lemonade = Product.objects.create(product_id=3, product_name="Lemonade", workshop=3, category=self.category_bar)
+        ShiftSaleItem.objects.create(shift_sale=self.shift_sale, product_name="Lemonade", product=lemonade,
+                                     category_name="regular", workshop_id=self.terrace.workshop_id,
+                                     payed_sum=400, count=4)
+        self.create_salary_rule(self.role_chef, fixed=100)
+        self.waiter_rule = self.create_salary_rule(self.role_waiter, fixed=50, percent=10, workshops=[self.terrace])
+        SalaryRuleProduct.objects.create(salary_rule=self.waiter_rule, product=lemonade, fixed=5)
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='owner', password='password'))
+
+    def current_rules(self):
+        return SalaryRuleSerializer(SalaryRule.objects.order_by('pk'), many=True).data
+
+    def test_current_rules_match_the_salary_engine(self):
+        data = load_month_sales(2025, 10)
+        simulated = evaluate_month(get_rule_index(), data)
+        expected = {emp_id: result['total_salary'] for emp_id, result in aggregate_sales(self.shift).items()}
+        self.assertEqual(simulated, expected)
+        self.assertEqual(simulated[self.emp_waiter.id], Decimal('110'))
+
+    def test_simulation_returns_deltas_without_saving(self):
+        rules = self.current_rules()
+        rules[1]['percent'] = '20.00'
+        rules[1]['product_fixed'] = [{'product': 3, 'fixed': '10'}]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('aggregate_sales-simulate'), {'year': 2025, 'month': 10, 'rules': rules}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        deltas = {e['employee_id']: (e['current'], e['proposed'], e['delta']) for e in response.data['employees']}
+        self.assertEqual(deltas[self.emp_waiter.id], (110.0, 170.0, 60.0))
+        self.assertEqual(deltas[self.emp_chef.id], (100.0, 100.0, 0.0))
+        self.assertEqual(response.data['total']['delta'], 60.0)
+        self.assertEqual(SalaryRule.objects.get(pk=self.waiter_rule.pk).percent, 10)
+        self.assertFalse(SalaryRecord.objects.exists())
+
+    def test_invalid_rules_are_rejected(self):
+        response = self.client.post(
+            reverse('aggregate_sales-simulate'), {'year': 2025, 'month': 10, 'rules': [{'role': 999}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CalculationTraceTest(SalaryCalculationBaseTest):
+    """Tests for the opt-in calculation trace."""
+
+    def setUp(self):
+        super().setUp()
+        self.rule = self.create_salary_rule(self.role_chef, percent=10, workshops=[self.workshop_kitchen])
+
+    def test_untraced_calculation_logs_nothing(self):
+        with self.assertNoLogs('salary.aggreg', level='INFO'):
+            result = aggregate_sales(self.shift)
+        self.assertNotIn('trace', result[self.emp_chef.id])
+
+    def test_trace_records_rule_hits_and_split(self):
+        trace = aggregate_sales(self.shift, trace=1)[self.emp_chef.id]['trace']
+
+        self.assertEqual(sorted(trace['revenue']), [[1, 1000.0], [2, 500.0]])
+        group = next(g for g in trace['groups'] if g['rules'] == [self.rule.id])
+        self.assertEqual(group['hits'], [[1, 1, self.rule.id, 100.0, 0.0]])
+        self.assertEqual((group['pot'], group['split'], group['each']), ([100.0, 0.0], 2, [50.0, 0.0]))
+
+        calculate_and_save_shift_salaries(self.shift, trace=True)
+        record = SalaryRecord.objects.get(employee=self.emp_sous, shift=self.shift)
+        self.assertEqual(record.details['trace'], trace)
+
+        calculate_and_save_shift_salaries(self.shift)
+        record.refresh_from_db()
+        self.assertNotIn('trace', record.details)
+        self.assertEqual(record.percent_part, 50)
+
+    def test_shifts_are_sampled_and_hits_capped(self):
+        with patch('salary.aggreg.TRACE_SAMPLE_RATE', 0.5), patch('salary.trace.random.random', return_value=0.7):
+            self.assertNotIn('trace', aggregate_sales(self.shift)[self.emp_chef.id])
+        with patch('salary.aggreg.TRACE_SAMPLE_RATE', 0.5), patch('salary.trace.random.random', return_value=0.2), \
+                patch('salary.trace.TRACE_MAX_HITS', 0):
+            group = aggregate_sales(self.shift)[self.emp_chef.id]['trace']['groups'][0]
+        self.assertEqual((group['hits'], group['hits_dropped']), ([], 1))
+
 
 class SalaryViewsTest(SalaryCalculationBaseTest):
     """Tests for Salary API ViewSets."""
@@ -215,12 +547,45 @@ class SalaryViewsTest(SalaryCalculationBaseTest):
         self.rule.save()
         
         response = self.client.post(url, {'month': 10, 'year': 2025}, format='json')
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("Processed shifts: 1", response.data['message'])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = Job.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.status, Job.STATUS_PENDING)
+
+        # The worker recycles connections between jobs; keep the test transaction's.
+        with patch('jobs.management.commands.run_worker.close_old_connections'):
+            call_command('run_worker', '--once', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertIn("Processed shifts: 1", job.result['message'])
         
         self.salary_record.refresh_from_db()
         self.assertEqual(self.salary_record.total_salary, 5000)
 
+    def test_month_summary_follows_record_writes(self):
+        """Tests that the month summary is kept up to date and serves the month endpoints."""
+        month = date(2025, 10, 1)
+        summary = MonthlySalarySummary.objects.get(employee=self.emp_waiter, month=month)
+        self.assertEqual((summary.total_amount, summary.shift_count), (1000, 1))
+
+        url = reverse('salary_records-detail', args=[self.salary_record.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'details': {'write_off': 300}}, format='json')
+        summary.refresh_from_db()
+        self.assertEqual((summary.total_amount, summary.write_off_amount), (700, 300))
+
+        response = self.client.get(reverse('salary_records-summary'), {'month': 10, 'year': 2025})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = {e['employee_id']: e['total_salary'] for e in response.data['employees']}
+        self.assertEqual(totals, {self.emp_chef.id: 0, self.emp_sous.id: 0, self.emp_waiter.id: 700})
+
+        response = self.client.get(reverse('aggregate_sales-by-month', args=[2025, 10]))
+        self.assertEqual(response.data['total'], 700)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salary_record.delete()
+        self.assertFalse(MonthlySalarySummary.objects.filter(employee=self.emp_waiter).exists())
+
     def test_aggregate_view_by_shift(self):
         """Tests the aggregate preview endpoint by shift ID."""
         try:
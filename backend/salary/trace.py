@@ -0,0 +1,93 @@
+import random
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+# Fraction of shifts traced when the caller doesn't ask for a trace; 0 traces none.
+TRACE_SAMPLE_RATE = 0.0
+
+# Rule hits kept per pay group; further hits are only counted.
+TRACE_MAX_HITS = 50
+
+
+def _amount(value) -> float:
+    return float(round(Decimal(value), 2))
+
+
+class CalculationTrace:
+    """
+    A compact, JSON-safe record of how one shift's salaries were calculated.
+
+    It holds the calculation's inputs (revenue per workshop, staff), and for
+    each pay group its rules, the sales rows those rules paid on, and how the
+    pot was split. Amounts are rounded floats and rows are lists, so a trace
+    can be stored as is in `SalaryRecord.details['trace']`.
+    """
+
+    def __init__(self, shift, rules_version: str = ""):
+        self.shift_id = shift.id
+        self.date = shift.date.isoformat() if shift.date else None
+        self.rules_version = rules_version
+        self.revenue: List[list] = []
+        self.staff: List[list] = []
+        self.groups: List[dict] = []
+
+    def inputs(self, sales_agg: Dict[tuple, dict], shift_employees) -> None:
+        """Records the revenue per Poster workshop and the (employee, role, pay group) of each assignment."""
+        revenue = {}
+        for (workshop_id, _), sale_data in sales_agg.items():
+            revenue[workshop_id] = revenue.get(workshop_id, 0) + sale_data['sum']
+        self.revenue = [[workshop_id, _amount(total)] for workshop_id, total in revenue.items()]
+        self.staff = [[se.employee_id, se.role_id, se.role.pay_group_id] for se in shift_employees]
+
+    def group(self, key, role_ids, rule_ids: List[int], employee_ids: List[int]) -> dict:
+        """Starts the record of one pay group (or role without one) and returns it."""
+        group = {
+            "key": str(key),
+            "roles": sorted(role_ids),
+            "rules": list(rule_ids),
+            "employees": list(employee_ids),
+            "hits": [],
+            "hits_dropped": 0,
+        }
+        self.groups.append(group)
+        return group
+
+    @staticmethod
+    def hit(group: dict, workshop_id: int, product_id: Optional[int], rule_id: int, percent, bonus) -> None:
+        """Records that `rule_id` paid `percent` and `bonus` on a (workshop, product) sales row."""
+        if len(group["hits"]) < TRACE_MAX_HITS:
+            group["hits"].append([workshop_id, product_id, rule_id, _amount(percent), _amount(bonus)])
+        else:
+            group["hits_dropped"] += 1
+
+    @staticmethod
+    def split(group: dict, percent, bonus, members: int) -> None:
+        """Records the group's pot and its even split among `members` employees."""
+        group["pot"] = [_amount(percent), _amount(bonus)]
+        group["split"] = members
+        if members:
+            group["each"] = [_amount(percent / members), _amount(bonus / members)]
+
+    def as_dict(self) -> dict:
+        return {
+            "shift": self.shift_id,
+            "date": self.date,
+            "rules_version": self.rules_version,
+            "revenue": self.revenue,
+            "staff": self.staff,
+            "groups": self.groups,
+        }
+
+
+def start_trace(shift, sample: float, rules_version: str = "") -> Optional[CalculationTrace]:
+    """
+    A trace for `shift`, or None if the shift isn't sampled.
+
+    Args:
+        shift: The shift being calculated.
+        sample: The fraction of shifts to trace; 1 (or True) traces every shift, 0 none.
+        rules_version: The version of the rule index the shift is calculated with.
+    """
+    if not sample or (sample < 1 and random.random() >= sample):
+        return None
+    return CalculationTrace(shift, rules_version)
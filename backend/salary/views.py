@@ -1,25 +1,33 @@
 from collections import defaultdict
+from datetime import date, timedelta
 from decimal import Decimal
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
 
 from calendar import day_name
 from rest_framework.permissions import IsAuthenticated
 import logging
 
 
-from .services import calculate_and_save_shift_salaries
+from jobs.services import enqueue
+from jobs.views import accepted_response
 from salary.aggreg import aggregate_sales
 from shift.models import Shift
-from poster_api.models import Employee
-from .models import SalaryRecord, SalaryRule
+from .models import MonthlySalarySummary, SalaryRecord, SalaryRule
 from .serializers import  SalaryRecordSerializer, SalaryRuleSerializer
+from .simulation import proposed_rule_index, simulate_month
 
 logger = logging.getLogger(__name__)
 
 
+def month_summaries(month_start: date):
+    """The month's MonthlySalarySummary rows with their employees, by employee name."""
+    return MonthlySalarySummary.objects.filter(month=month_start).select_related('employee').order_by('employee__name')
+
+
 class SalaryRecordViewSet(viewsets.ModelViewSet):
     """
     API endpoint for accessing and managing saved SalaryRecord entries.
@@ -62,6 +70,39 @@ class SalaryRecordViewSet(viewsets.ModelViewSet):
         
         return Response(salaries_by_employee)
     
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Returns each employee's salary totals for a given month and year.
+
+        The owner's payroll view reads these from MonthlySalarySummary in
+        one query instead of adding up the month's records.
+        """
+        try:
+            month_start = date(int(request.query_params.get('year')), int(request.query_params.get('month')), 1)
+        except (TypeError, ValueError):
+            return Response({"error": "Year and month must be provided."}, status=400)
+
+        employees = [
+            {
+                "employee_id": summary.employee_id,
+                "employee_name": summary.employee.name,
+                "total_salary": summary.total_amount,
+                "fixed": summary.fixed_amount,
+                "percent": summary.percent_amount,
+                "bonus": summary.bonus_amount,
+                "write_off": summary.write_off_amount,
+                "shift_count": summary.shift_count,
+            }
+            for summary in month_summaries(month_start)
+        ]
+        return Response({
+            "year": month_start.year,
+            "month": month_start.month,
+            "employees": employees,
+            "total": sum((e["total_salary"] for e in employees), Decimal(0)),
+        })
+
     def partial_update(self, request, *args, **kwargs):
         """
         Handles manual updates to a SalaryRecord from the detail modal.
@@ -98,10 +139,13 @@ class SalaryRecordViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def recalculate(self, request):
         """
-        Recalculates all salaries for a given month and year.
-        
-        This action calls the `calculate_and_save_shift_salaries` service
-        for every shift in the specified month.
+        Queues the recalculation of all salaries for a given month and year.
+
+        The `salary.recalculate_month` job calculates the month's shifts on a
+        pool of workers (`recalculate_shifts_parallel`) on a `run_worker`
+        process. The response carries the job id; poll
+        /api/jobs/<id>/progress/ for its status. With `trace` set, every
+        shift's calculation trace is stored in its records' details.
         """
         try:
             month = int(request.data.get('month'))
@@ -112,37 +156,42 @@ class SalaryRecordViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        logger.info(f"--- Salary recalculation started for {month}/{year} ---")
-
-        shifts_to_recalculate = Shift.objects.filter(
-            date__year=year,
-            date__month=month,
-        )
-
-        if not shifts_to_recalculate.exists():
+        if not Shift.objects.filter(date__year=year, date__month=month).exists():
             logger.warning("--- No shifts found for recalculation ---")
             return Response(
                 {"message": "No shifts found for this month."},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        processed_count = 0
-        
-        for shift in shifts_to_recalculate:
+        params = {"year": year, "month": month}
+        if request.data.get('trace'):
+            params["trace"] = True
+        job, created = enqueue("salary.recalculate_month", params, user=request.user)
+        logger.info(f"--- Salary recalculation for {month}/{year} queued as job {job.id} ---")
+        return accepted_response(job, created)
+
+    @action(detail=False, methods=['post'])
+    def recalculate_dirty(self, request):
+        """
+        Queues the recalculation of the shifts whose sales, staff or rules changed.
+
+        With `month` and `year` only that month's dirty shifts are
+        recalculated, otherwise all of them. Like `recalculate`, it answers
+        with the id of the `salary.recalculate_dirty` job.
+        """
+        params = {}
+        if request.data.get('month') or request.data.get('year'):
             try:
-                calculate_and_save_shift_salaries(shift=shift)
-                
-                logger.info(f"Recalculating shift {shift.id} for {shift.date}")
-                processed_count += 1
-                
-            except Exception as e:
-                logger.error(f"ERROR recalculating shift {shift.id}: {e}")
+                params = {"year": int(request.data.get('year')), "month": int(request.data.get('month'))}
+            except (TypeError, ValueError):
+                return Response(
+                    {"error": "Invalid 'month' or 'year'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        logger.info(f"--- Recalculation finished. Processed shifts: {processed_count} ---")
-        return Response(
-            {"message": f"Recalculation finished. Processed shifts: {processed_count}"},
-            status=status.HTTP_200_OK
-        )
+        job, created = enqueue("salary.recalculate_dirty", params, user=request.user)
+        logger.info(f"--- Dirty shift recalculation {params or 'of all months'} queued as job {job.id} ---")
+        return accepted_response(job, created)
 
 
 
@@ -183,6 +232,7 @@ class SalaryAggregateViewSet(viewsets.ViewSet):
     def by_shift(self, request, shift_id=None):
         """
         Returns the aggregated salary for a specific shift.
+        With `?trace=1` the response also carries the calculation trace.
         Example: GET /api/salary/aggregate_sales/shift/12/
         """
         try:
@@ -192,44 +242,72 @@ class SalaryAggregateViewSet(viewsets.ViewSet):
 
         logger.info(f"Агрегация зарплаты для смены ID={shift_id}")
 
-        result = aggregate_sales(shift)
+        traced = request.query_params.get("trace") in ("1", "true")
+        result = aggregate_sales(shift, trace=1 if traced else None)
 
         formatted = [self.format_employee_salary(v) for v in result.values()]
         total = sum(v["additional"] for v in formatted)
 
-        return Response({
+        response_data = {
             "shift_id": shift.id,
             "date": shift.date if hasattr(shift, "date") else None,
             "employees": formatted,
             "total_shift_payout": total
-        })
+        }
+        if traced:
+            response_data["trace"] = next((v["trace"] for v in result.values() if "trace" in v), None)
+        return Response(response_data)
+
+    @action(detail=False, methods=["post"])
+    def simulate(self, request):
+        """
+        Shows what a month's payroll would be under a proposed rule set.
+
+        Body: `rules`, a list in the `SalaryRuleSerializer` format that
+        replaces all current rules, and optionally `month` and `year`
+        (default: last month). The proposal is evaluated in memory against
+        the month's stored sales and assignments; nothing is saved.
+        Example: POST /api/aggregate_sales/simulate/
+        """
+        today = timezone.localdate()
+        last_month = (today.replace(day=1) - timedelta(days=1))
+        try:
+            year = int(request.data.get('year') or last_month.year)
+            month = int(request.data.get('month') or last_month.month)
+            date(year, month, 1)
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid 'month' or 'year'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rules = SalaryRuleSerializer(data=request.data.get('rules', []), many=True)
+        if not rules.is_valid():
+            return Response({"rules": rules.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(simulate_month(year, month, proposed_rule_index(rules.validated_data)))
 
     @action(detail=False, methods=["get"], url_path=r"month/(?P<year>\d{4})/(?P<month>\d{1,2})")
     def by_month(self, request, year=None, month=None):
         """
         Returns the sum of payments for all shifts for the month.  
-        """
-        shifts = Shift.objects.filter(date__year=year, date__month=month)
-        if not shifts.exists():
-            return Response({"error": "Смены за указанный месяц не найдены"}, status=404)
-
-        logger.info(f"Агрегация зарплаты за {month}.{year}")
 
-        total_result = defaultdict(Decimal)
-        for shift in shifts:
-            result = aggregate_sales(shift)
-            for emp_id, data in result.items():
-                total_result[emp_id] += data["total_salary"]
+        The totals are read from the month's MonthlySalarySummary rows, which
+        follow the saved SalaryRecords, instead of recalculating every shift.
+        """
+        try:
+            month_start = date(int(year), int(month), 1)
+        except ValueError:
+            return Response({"error": "Некорректный месяц"}, status=400)
 
-        employees = Employee.objects.filter(id__in=total_result.keys())
+        summaries = list(month_summaries(month_start))
+        if not summaries and not Shift.objects.filter(date__year=year, date__month=month).exists():
+            return Response({"error": "Смены за указанный месяц не найдены"}, status=404)
 
         formatted = [
             {
-                "employee_id": emp.id,
-                "employee_name": emp.name,
-                "total_month_salary": float(total_result[emp.id])
+                "employee_id": summary.employee_id,
+                "employee_name": summary.employee.name,
+                "total_month_salary": float(summary.total_amount)
             }
-            for emp in employees
+            for summary in summaries
         ]
 
         return Response({
@@ -256,24 +334,23 @@ class SaveShiftSalaryViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['post'], url_path='recalculate_salary')
     def recalculate_salary(self, request, pk=None):
         """
-        Triggers the calculation and saving of salaries for a specific shift.
+        Queues the calculation and saving of salaries for a specific shift.
 
-        This action calls the `calculate_and_save_shift_salaries` service,
-        which runs the `aggregate_sales` logic and then updates or creates
-        `SalaryRecord` entries for each employee on that shift.
+        The `salary.recalculate_shift` job calls the `calculate_and_save_shift_salaries`
+        service, which runs the `aggregate_sales` logic and then updates or
+        creates `SalaryRecord` entries for each employee on that shift. With
+        `trace` set in the body, the calculation trace is stored in their details.
 
         Args:
             request: The DRF request object.
             pk (int): The primary key of the `Shift` to recalculate.
 
         Returns:
-            Response: A 200 response indicating success.
+            Response: A 202 response with the job id.
         """
-        shift = self.get_object()
-        
-        calculate_and_save_shift_salaries(shift)
-        
-        return Response(
-            {"status": "success", "message": f"Salary for shift {shift.id} recalculated."},
-            status=status.HTTP_200_OK
-        )        
\ No newline at end of file
+        shift = get_object_or_404(Shift, pk=pk)
+        params = {"shift_id": shift.id}
+        if request.data.get('trace'):
+            params["trace"] = True
+        job, created = enqueue("salary.recalculate_shift", params, user=request.user)
+        return accepted_response(job, created)
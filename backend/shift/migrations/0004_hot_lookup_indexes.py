@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shift', '0003_alter_shift_shift_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shift',
+            name='date',
+            field=models.DateField(db_index=True, default='2025-10-01'),
+        ),
+    ]
@@ -8,7 +8,7 @@ class Shift(models.Model):
     Represents a single work shift on a specific date.
     """
     shift_id = models.IntegerField(unique=True, null=True, blank=True)
-    date = models.DateField(default='2025-10-01')
+    date = models.DateField(default='2025-10-01', db_index=True)
     employees = models.ManyToManyField(
         Employee,
         through='ShiftEmployee',
@@ -0,0 +1,11 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsOwnerOrAdmin(BasePermission):
+    """Allows owners (`User.role == 'owner'`) and superusers."""
+
+    message = "Only the owner can do this."
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_superuser or getattr(user, 'role', None) == 'owner'))
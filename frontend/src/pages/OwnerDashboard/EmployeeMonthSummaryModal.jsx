@@ -1,4 +1,4 @@
-import React, { useMemo } from 'react';
+import React from 'react';
 
 const formatNumber = (num) => Number(num).toFixed(2);
 
@@ -18,41 +18,16 @@ const SummaryRow = ({ label, value, isNegative = false, isTotal = false }) => (
 );
 
 
-export default function EmployeeMonthSummaryModal({ data, onClose }) {
-    const { employee, salaryData } = data;
-
-    const summary = useMemo(() => {
-        let totalFixed = 0;
-        let totalPercent = 0;
-        let totalBonus = 0;
-        let totalWriteOff = 0;
-        let grandTotal = 0;
-        
-        const dailyRecords = Object.values(salaryData);
-        const daysWorked = dailyRecords.length;
-
-        for (const record of dailyRecords) {
-            if (record && record.details) {
-                totalFixed += parseFloat(record.details.fixed) || 0;
-                totalPercent += parseFloat(record.details.percent) || 0;
-                totalBonus += parseFloat(record.details.bonus) || 0;
-                totalWriteOff += parseFloat(record.details.write_off) || 0;
-            }
-            grandTotal += parseFloat(record.total_salary) || 0;
-        }
+// `summary` is the employee's row of /api/salary_records/summary/; none means no shifts this month.
+const EMPTY_SUMMARY = { shift_count: 0, fixed: 0, percent: 0, bonus: 0, write_off: 0, total_salary: 0 };
 
-        return {
-            daysWorked,
-            totalFixed,
-            totalPercent,
-            totalBonus,
-            totalWriteOff,
-            grandTotal
-        };
-    }, [salaryData]); 
 
+export default function EmployeeMonthSummaryModal({ data, onClose }) {
     if (!data) return null;
 
+    const { employee } = data;
+    const summary = data.summary || EMPTY_SUMMARY;
+
     return (
         <div 
             className="fixed inset-0 bg-black bg-opacity-50 flex justify-center items-center z-50" 
@@ -68,15 +43,15 @@ export default function EmployeeMonthSummaryModal({ data, onClose }) {
                 <div className="space-y-1 text-gray-900 dark:text-gray-100">
                     <div className="flex justify-between pb-2">
                         <span className="text-gray-600 dark:text-gray-300">Отработано смен:</span>
-                        <span className="font-medium">{summary.daysWorked}</span>
+                        <span className="font-medium">{summary.shift_count}</span>
                     </div>
 
-                    <SummaryRow label="Итого фикс. часть" value={summary.totalFixed} />
-                    <SummaryRow label="Итого процент" value={summary.totalPercent} />
-                    <SummaryRow label="Итого бонусы" value={summary.totalBonus} />
-                    <SummaryRow label="Итого списания" value={summary.totalWriteOff} isNegative={true} />
+                    <SummaryRow label="Итого фикс. часть" value={summary.fixed} />
+                    <SummaryRow label="Итого процент" value={summary.percent} />
+                    <SummaryRow label="Итого бонусы" value={summary.bonus} />
+                    <SummaryRow label="Итого списания" value={summary.write_off} isNegative={true} />
 
-                    <SummaryRow label="Итого к выплате" value={summary.grandTotal} isTotal={true} />
+                    <SummaryRow label="Итого к выплате" value={summary.total_salary} isTotal={true} />
                 </div>
 
                 <div className="mt-6 flex justify-end">
@@ -13,6 +13,7 @@ export default function SalaryTable() {
     
     const [days, setDays] = useState([]);
     const [salaries, setSalaries] = useState({});
+    const [summaries, setSummaries] = useState({});
 
     const [isModalOpen, setIsModalOpen] = useState(false);
     const [selectedSalaryData, setSelectedSalaryData] = useState(null);
@@ -49,6 +50,17 @@ export default function SalaryTable() {
         }
     };
 
+    // Month totals come from the server's monthly summaries; the per-day records only fill the grid.
+    const fetchSummaries = async () => {
+        try {
+            const res = await api.get(`/api/salary_records/summary/?month=${month}&year=${year}`);
+            setSummaries(Object.fromEntries(res.data.employees.map((summary) => [summary.employee_id, summary])));
+        } catch (err) {
+            console.error("Ошибка загрузки итогов за месяц:", err);
+            setSummaries({});
+        }
+    };
+
 
     useEffect(() => {
         fetchEmployees();
@@ -58,6 +70,7 @@ export default function SalaryTable() {
         console.log(`Загрузка данных за ${month}/${year}`);
         generateDays();
         fetchSalaries();
+        fetchSummaries();
     }, [month, year]); 
 
 
@@ -69,8 +82,8 @@ export default function SalaryTable() {
         }
     };
 
-    const handleEmployeeClick = (employee, employeeSalaries) => {
-        setSelectedEmployeeSummary({ employee, salaryData: employeeSalaries });
+    const handleEmployeeClick = (employee) => {
+        setSelectedEmployeeSummary({ employee, summary: summaries[employee.id] });
         setIsSummaryModalOpen(true);
     };
 
@@ -88,6 +101,7 @@ export default function SalaryTable() {
             }
             return newSalaries;
         });
+        fetchSummaries();
 
         setIsModalOpen(false); 
     };
@@ -118,10 +132,20 @@ export default function SalaryTable() {
                 `/api/salary_records/recalculate/`, 
                 { month, year }
             );
+
+            // The recalculation runs as a background job; poll until it finishes.
+            let job = response.data;
+            while (job.status === "pending" || job.status === "running") {
+                await new Promise((resolve) => setTimeout(resolve, 2000));
+                job = (await api.get(`/api/jobs/${response.data.job_id}/`)).data;
+            }
+            if (job.status === "failed") {
+                throw new Error(job.error);
+            }
             
-            console.log("Пересчет завершен:", response.data.message);
+            console.log("Пересчет завершен:", job.result?.message);
 
-            await fetchSalaries(); 
+            await Promise.all([fetchSalaries(), fetchSummaries()]);
             alert("Расчеты успешно обновлены!");
 
         } catch (err) {
@@ -174,6 +198,7 @@ export default function SalaryTable() {
                                         {day}
                                     </th>
                                 ))}
+                                <th className="border p-2 text-center font-semibold dark:border-gray-600">Итого</th>
                             </tr>
                         </thead>
                         <tbody>
@@ -184,7 +209,7 @@ export default function SalaryTable() {
 
                                         <td
                                             className="border p-2 font-medium sticky left-0 bg-white dark:bg-gray-800 hover:bg-gray-100 dark:hover:bg-gray-700 z-10 cursor-pointer dark:border-gray-600"
-                                            onClick={() => handleEmployeeClick(emp, empSalaries)}
+                                            onClick={() => handleEmployeeClick(emp)}
                                         >
                                             {emp.name}
                                         </td>
@@ -205,11 +230,15 @@ export default function SalaryTable() {
                                                 </td>
                                             );
                                         })}
+
+                                        <td className="border p-2 text-center font-semibold dark:border-gray-600">
+                                            {summaries[emp.id] ? Number(summaries[emp.id].total_salary).toFixed(0) : ""}
+                                        </td>
                                     </tr>
                                 );
                             }) : (
                                 <tr className="border-t dark:border-gray-700">
-                                    <td colSpan={days.length + 1} className="text-center p-4 text-gray-500 dark:text-gray-400">Загрузка сотрудников...</td>
+                                    <td colSpan={days.length + 2} className="text-center p-4 text-gray-500 dark:text-gray-400">Загрузка сотрудников...</td>
                                 </tr>
                             )}
                         </tbody>